@@ -0,0 +1 @@
+"""Helpers shared by the getcharacter, fandom, gen and evaluation stages."""
@@ -0,0 +1,124 @@
+"""
+Non-blocking logging for the LLM helpers in gen/ and evaluation/utils.py.
+
+attach_queue_listener() moves a logger's handlers behind a QueueHandler: the
+calling thread only formats the record and puts it on an unbounded queue, a
+QueueListener thread does the file and console writes. Worker threads then
+never wait on a handler lock or on disk, and records keep their order.
+
+ResponseTrace keeps full LLM responses out of the log: a sampled fraction of
+them (10% by default; logging.trace_sample_rate) is written by its own
+background thread as gzip-compressed JSONL
+(`python -m common.async_logging <trace.jsonl.gz>` prints one back).
+"""
+
+import sys
+import gzip
+import json
+import time
+import queue
+import atexit
+import random
+import argparse
+import threading
+import logging
+import logging.handlers
+from typing import Any, Optional
+
+
+def attach_queue_listener(logger: logging.Logger) -> logging.handlers.QueueListener:
+    """Replace the logger's handlers with a QueueHandler feeding them from a background thread"""
+    handlers = list(logger.handlers)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    # respect_handler_level: the console may be quieter than the file
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class ResponseTrace:
+    def __init__(self, path: Optional[str] = 'llm_trace.jsonl.gz', sample_rate: float = 0.1, max_chars: int = 20000):
+        """Sampled, truncated responses as gzip JSONL, written off the calling thread; path None disables it"""
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def sampled(self) -> bool:
+        return bool(self.path) and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def write(self, **fields: Any) -> bool:
+        """Queue one trace record (when sampled); returns whether it was kept"""
+        if not self.sampled():
+            return False
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), threading.current_thread().name, fields))
+        return True
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='response-trace', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        # gzip members appended per batch: the file stays readable even if the process dies mid-run
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            lines = [self._line(*entry) for entry in batch if entry is not None]
+            if lines:
+                with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                    f.write(''.join(lines))
+            if stop:
+                return
+
+    def _line(self, timestamp: float, thread: str, fields: dict) -> str:
+        record = {'time': round(timestamp, 3), 'thread': thread}
+        for name, value in fields.items():
+            if isinstance(value, str) and len(value) > self.max_chars:
+                value = value[:self.max_chars] + f'... [{len(value) - self.max_chars} chars truncated]'
+            record[name] = value
+        return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+    def close(self):
+        """Write out everything queued (called at exit)"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="print an LLM response trace")
+    parser.add_argument("path", type=str)
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--grep", type=str, default=None, help="只显示包含该字符串的记录")
+    args = parser.parse_args()
+
+    with gzip.open(args.path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if args.grep is not None and args.grep not in line:
+                continue
+            record = json.loads(line)
+            if args.model is not None and record.get('model') != args.model:
+                continue
+            sys.stdout.write(json.dumps(record, ensure_ascii=False, indent=2) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Per-provider circuit breakers with optional failover, for _get_response / get_response.
+
+A breaker watches the last `window` calls of one provider (gemini, doubao,
+qwen, gpt, claude; gemini and gemini_search share one). When at least
+min_calls of them were made and the failure rate reaches error_rate it opens:
+calls fail fast with None instead of hitting the API and sleeping in the
+provider's error path. After `cooldown` seconds it goes half-open and lets
+`probes` calls through; a success closes it, a failure re-opens it with the
+cooldown doubled (up to max_cooldown).
+
+A failure is a provider call that returned None (quota, rate limit, timeout,
+network). ERROR_SIGN is a verdict on the prompt, not on the provider, and
+counts as a success.
+
+BreakerBoard.failover(model) names the model get_response should switch to
+while `model`'s breaker is open, from the config failover map
+({"gemini_search": "doubao_search"}; keys match exactly or as the longest
+model-name prefix). The target's answer is used as is, so it must have the
+same shape as the model it replaces: gen/utils.gpt returns the raw completion
+dict, not text, and cannot stand in for qwen.
+
+Breakers are off in the shipped configs (circuit_breaker.enable: false).
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from common.llm_metrics import provider_for
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 cooldown: float = 60.0, max_cooldown: float = 600.0, probes: int = 1):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probes = probes
+        self.state = CLOSED
+        self.cooldown = cooldown
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now (a half-open breaker admits `probes` calls)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool) -> Optional[str]:
+        """Result of an allowed call; returns the new state when it changed"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if ok:
+                    self.state = CLOSED
+                    self.cooldown = self.base_cooldown
+                    self._results.clear()
+                    return CLOSED
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                return self._open()
+            if self.state == OPEN:
+                # a call admitted before the breaker opened
+                return None
+            self._results.append(ok)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures >= self.error_rate * len(self._results):
+                return self._open()
+            return None
+
+    def _open(self) -> str:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.opens += 1
+        self._results.clear()
+        return OPEN
+
+    def is_open(self) -> bool:
+        """Open and still cooling down (a half-open breaker is probing, so not open)"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+
+class BreakerBoard:
+    def __init__(self, enable: bool = True, failover: Optional[Dict[str, str]] = None, **breaker_options):
+        """One CircuitBreaker per provider, built with breaker_options; config.json 'circuit_breaker' section"""
+        self.enable = enable
+        self.failover_map = failover or {}
+        self.breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.failovers = 0
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        provider = provider_for(model)
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(provider, CircuitBreaker(provider, **self.breaker_options))
+        return breaker
+
+    def allow(self, model: str) -> bool:
+        return not self.enable or self.breaker(model).allow()
+
+    def record(self, model: str, ok: bool) -> Optional[str]:
+        if not self.enable:
+            return None
+        return self.breaker(model).record(ok)
+
+    def failover(self, model: str) -> Optional[str]:
+        """Model to use instead of `model` while its breaker is open, if one is configured and its own breaker is not open"""
+        if not self.enable or not self.breaker(model).is_open():
+            return None
+        if model in self.failover_map:
+            target = self.failover_map[model]
+        else:
+            prefixes = [prefix for prefix in self.failover_map if model.startswith(prefix)]
+            if not prefixes:
+                return None
+            target = self.failover_map[max(prefixes, key=len)]
+        if self.breaker(target).is_open():
+            return None
+        with self._lock:
+            self.failovers += 1
+        return target
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: {'state': b.state, 'opens': b.opens, 'rejected': b.rejected}
+                for name, b in sorted(self._breakers.items())}
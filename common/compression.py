@@ -0,0 +1,130 @@
+"""
+Transparent compression of stored values (LLM response cache, DiskStore records).
+
+Every encoded value starts with a one-byte tag, so stores can hold a mix of
+raw, zlib and zstd values and old rows keep reading after the codec changes:
+
+  0x00 raw | 0x01 zlib | 0x02 zstd | 0x03 zstd with dictionary (4-byte dict id follows)
+
+Legacy values written before compression existed (pickles start with 0x80,
+JSON text is stored as str) are returned unchanged by decode(). zstd needs the
+optional `zstandard` package; without it new values use zlib, and a value
+that was written with zstd raises a RuntimeError naming the missing package.
+Short values stay raw: below min_size the header costs more than it saves.
+"""
+
+import zlib
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW, ZLIB, ZSTD, ZSTD_DICT = 0, 1, 2, 3
+_LEGACY_PICKLE = 0x80
+
+DEFAULT_DICT_SIZE = 112 * 1024
+
+
+def available_codecs() -> List[str]:
+    return ['raw', 'zlib'] + (['zstd'] if zstandard is not None else [])
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = DEFAULT_DICT_SIZE) -> bytes:
+    """zstd dictionary trained on sample values (needs zstandard and a few hundred samples)"""
+    if zstandard is None:
+        raise RuntimeError('training a compression dictionary needs the zstandard package (pip install zstandard)')
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
+
+
+def dictionary_id(dictionary: bytes) -> int:
+    return zstandard.ZstdCompressionDict(dictionary).dict_id()
+
+
+class ValueCodec:
+    def __init__(self, codec: str = 'zstd', level: int = 3, min_size: int = 256,
+                 dictionaries: Optional[Dict[int, bytes]] = None, dict_id: Optional[int] = None):
+        """
+        codec: 'zstd' (falls back to 'zlib' without zstandard), 'zlib' or 'raw'; level applies to zstd
+        dictionaries: dict id -> zstd dictionary, for reading; dict_id selects the one used for writing
+        """
+        if codec not in ('zstd', 'zlib', 'raw'):
+            raise ValueError(f'unknown codec: {codec}')
+        if codec == 'zstd' and zstandard is None:
+            codec = 'zlib'
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+        self.dictionaries: Dict[int, bytes] = dict(dictionaries or {})
+        self.dict_id = dict_id if codec == 'zstd' and dict_id in self.dictionaries else None
+        # zstandard (de)compressor objects must not be shared between threads
+        self._local = threading.local()
+
+    def set_dictionaries(self, dictionaries: Dict[int, bytes], dict_id: Optional[int] = None):
+        self.dictionaries.update(dictionaries)
+        if self.codec == 'zstd' and dict_id in self.dictionaries:
+            self.dict_id = dict_id
+        self._local = threading.local()
+
+    def add_dictionary(self, dictionary: bytes, use: bool = True) -> int:
+        dict_id = dictionary_id(dictionary)
+        self.set_dictionaries({dict_id: dictionary}, dict_id if use else None)
+        return dict_id
+
+    def _compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            if self.dict_id is not None:
+                dictionary = zstandard.ZstdCompressionDict(self.dictionaries[self.dict_id])
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            else:
+                compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: Optional[int] = None):
+        cache = getattr(self._local, 'decompressors', None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        decompressor = cache.get(dict_id)
+        if decompressor is None:
+            if dict_id is None:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                if dict_id not in self.dictionaries:
+                    raise KeyError(f'value was compressed with unknown zstd dictionary {dict_id}')
+                decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(self.dictionaries[dict_id]))
+            cache[dict_id] = decompressor
+        return decompressor
+
+    def encode(self, data: bytes) -> bytes:
+        if self.codec == 'raw' or len(data) < self.min_size:
+            return bytes((RAW,)) + data
+        if self.codec == 'zlib':
+            packed = bytes((ZLIB,)) + zlib.compress(data)
+        elif self.dict_id is not None:
+            packed = bytes((ZSTD_DICT,)) + struct.pack('<I', self.dict_id) + self._compressor().compress(data)
+        else:
+            packed = bytes((ZSTD,)) + self._compressor().compress(data)
+        # incompressible values (already compressed, tiny) are kept raw
+        return packed if len(packed) < len(data) + 1 else bytes((RAW,)) + data
+
+    def decode(self, data: bytes) -> bytes:
+        tag = data[0]
+        if tag == RAW:
+            return data[1:]
+        if tag == ZLIB:
+            return zlib.decompress(data[1:])
+        if tag == _LEGACY_PICKLE:
+            return data
+        if tag in (ZSTD, ZSTD_DICT):
+            if zstandard is None:
+                raise RuntimeError('this value is zstd-compressed; install the zstandard package to read it')
+            if tag == ZSTD:
+                return self._decompressor().decompress(data[1:])
+            dict_id, = struct.unpack_from('<I', data, 1)
+            return self._decompressor(dict_id).decompress(data[5:])
+        raise ValueError(f'unknown value encoding tag {tag:#x}')
@@ -0,0 +1,127 @@
+"""
+Canonical entity IDs and a persistent key index shared by gen, fandom and evaluation.
+
+Every stage writes results under its own "Name (Franchise)" key variant. The
+index maps each variant to one canonical ID (normalized name + franchise) in a
+SQLite file, so cross-stage joins are indexed lookups instead of exact string
+matches that silently drop entities when the formatting differs.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .normalize import normalize_name, normalize_franchise, split_entity_key
+
+# ENTITY_INDEX_PATH points a run (e.g. a benchmark) at its own index
+DEFAULT_INDEX_PATH = os.environ.get('ENTITY_INDEX_PATH') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'entity_keys.sqlite')
+
+
+def entity_id(name: str, franchise: str) -> str:
+    """Canonical ID of a character"""
+    return f'{normalize_name(name)}|{normalize_franchise(franchise)}'
+
+
+def entity_id_from_key(key: str) -> str:
+    """Canonical ID of a "Name (Franchise)" key"""
+    return entity_id(*split_entity_key(key))
+
+
+class EntityIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entities (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                franchise TEXT
+            );
+            CREATE TABLE IF NOT EXISTS entity_keys (
+                key TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                entity_id TEXT NOT NULL REFERENCES entities(id),
+                PRIMARY KEY (key, stage)
+            );
+            CREATE INDEX IF NOT EXISTS entity_keys_by_key ON entity_keys(key);
+            CREATE INDEX IF NOT EXISTS entity_keys_by_entity ON entity_keys(entity_id, stage);
+        ''')
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def register_many(self, keys: Iterable[str], stage: str, entity_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Record the key variants a stage uses. IDs are derived from the keys unless
+        given explicitly (e.g. to alias a key variant to an existing entity).
+        """
+        keys = list(keys)
+        ids = list(entity_ids) if entity_ids is not None else [entity_id_from_key(key) for key in keys]
+        entities = {}
+        for key, eid in zip(keys, ids):
+            if eid not in entities:
+                entities[eid] = split_entity_key(key)
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO entities (id, name, franchise) VALUES (?, ?, ?)',
+                                   [(eid, name, franchise) for eid, (name, franchise) in entities.items()])
+            self._conn.executemany('INSERT OR REPLACE INTO entity_keys (key, stage, entity_id) VALUES (?, ?, ?)',
+                                   list(zip(keys, [stage] * len(keys), ids)))
+        return ids
+
+    def register(self, key: str, stage: str, entity_id: Optional[str] = None) -> str:
+        return self.register_many([key], stage, None if entity_id is None else [entity_id])[0]
+
+    def resolve(self, key: str, stage: Optional[str] = None) -> str:
+        """Canonical ID of a key; unregistered keys fall back to their normalized form"""
+        query = 'SELECT entity_id FROM entity_keys WHERE key = ?'
+        params: Tuple = (key,)
+        if stage is not None:
+            query += ' AND stage = ?'
+            params += (stage,)
+        with self._lock:
+            row = self._conn.execute(query + ' LIMIT 1', params).fetchone()
+        return row[0] if row else entity_id_from_key(key)
+
+    def resolve_many(self, keys: Iterable[str], stage: Optional[str] = None) -> Dict[str, str]:
+        return {key: self.resolve(key, stage) for key in keys}
+
+    def keys_for(self, eid: str, stage: Optional[str] = None) -> List[str]:
+        query = 'SELECT key FROM entity_keys WHERE entity_id = ?'
+        params: Tuple = (eid,)
+        if stage is not None:
+            query += ' AND stage = ?'
+            params += (stage,)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def join(self, left: Iterable[str], right: Iterable[str], left_stage: Optional[str] = None,
+             right_stage: Optional[str] = None) -> Tuple[List[Tuple[str, str, str]], List[str], Dict[str, List[str]]]:
+        """
+        Match two stages' keys through their canonical IDs.
+        Returns ([(entity_id, left_key, right_key)], [left keys without a match],
+        {entity_id: right keys} for the IDs with more than one right key; those are
+        matched to their first right key and reported so the caller can flag them).
+        """
+        right_by_id: Dict[str, List[str]] = {}
+        for key, eid in self.resolve_many(right, right_stage).items():
+            right_by_id.setdefault(eid, []).append(key)
+
+        matched, unmatched, ambiguous = [], [], {}
+        for key, eid in self.resolve_many(left, left_stage).items():
+            if eid in right_by_id:
+                matched.append((eid, key, right_by_id[eid][0]))
+                if len(right_by_id[eid]) > 1:
+                    ambiguous[eid] = right_by_id[eid]
+            else:
+                unmatched.append(key)
+        return matched, unmatched, ambiguous
@@ -0,0 +1,190 @@
+"""
+Hedged LLM requests: cut the latency tail of slow (search) calls.
+
+Hedger.call(model, task) runs task(model) on a worker thread. If no answer
+has arrived after the model's hedge delay (a percentile of its recent
+latencies, within [min_delay, max_delay]; initial_delay until min_samples
+calls have been seen), a duplicate task(alternate or model) is started and the
+first successful result wins. A failed result (ok(result) is False) does not
+win while the other request is still running.
+
+Python cannot interrupt a blocking HTTP request, so the loser is cancelled
+only if it is still queued for a worker; otherwise it runs to completion in the
+background and its result goes to on_loser (so its spend can be recorded),
+which always runs on a hedger worker thread, never the caller's, and is
+otherwise dropped.
+
+Per model the hedger counts calls, hedges and hedge wins and keeps log2
+latency histograms of primary and hedge requests, for tuning the percentile.
+"""
+
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        """Recent successful latencies of one model"""
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            values = sorted(self._latencies)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+        # bucket b counts latencies in [2^(b-1), 2^b) seconds; bucket 0 is < 1s
+        self.primary_hist: Dict[int, int] = {}
+        self.hedge_hist: Dict[int, int] = {}
+
+    @staticmethod
+    def bucket(latency: float) -> int:
+        return 0 if latency < 1 else int(math.log2(latency)) + 1
+
+
+def _report_loser(future: Future, on_loser: Callable[[str, Any, Optional[float]], None]):
+    if future.exception() is None:
+        on_loser(future.model, future.result(), future.timing.get('latency'))
+
+
+class Hedger:
+    def __init__(self, enable: bool = False, models: Optional[Dict[str, Dict]] = None, min_samples: int = 20, window: int = 200,
+                 max_workers: int = 64):
+        """
+        models: model -> {percentile, min_delay, max_delay, initial_delay, alternate}; only these models are hedged
+        max_workers: threads shared by all hedged requests (reused, so per-thread buffers stay bounded)
+        """
+        self.enable = enable
+        self.models = models or {}
+        self.min_samples = min_samples
+        self.window = window
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._stats: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='hedge')
+
+    def enabled_for(self, model: str) -> bool:
+        return self.enable and model in self.models
+
+    def _tracker(self, model: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._trackers.get(model)
+            if tracker is None:
+                tracker = self._trackers[model] = LatencyTracker(self.window)
+            return tracker
+
+    def _model_stats(self, model: str) -> _ModelStats:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = _ModelStats()
+            return stats
+
+    def delay(self, model: str) -> float:
+        """Seconds to wait for the primary request before hedging"""
+        policy = self.models[model]
+        tracker = self._tracker(model)
+        if len(tracker) < self.min_samples:
+            return policy.get('initial_delay', 60.0)
+        delay = tracker.percentile(policy.get('percentile', 0.95))
+        return min(max(delay, policy.get('min_delay', 5.0)), policy.get('max_delay', 300.0))
+
+    def _start(self, model: str, task: Callable[[str], Any], ok: Callable[[Any], bool], stats: _ModelStats,
+               hedge: bool) -> Future:
+        timing: Dict[str, float] = {}
+
+        def run():
+            start = time.perf_counter()
+            result = task(model)
+            latency = timing['latency'] = time.perf_counter() - start
+            with self._lock:
+                hist = stats.hedge_hist if hedge else stats.primary_hist
+                bucket = _ModelStats.bucket(latency)
+                hist[bucket] = hist.get(bucket, 0) + 1
+            if ok(result):
+                self._tracker(model).add(latency)
+            return result
+
+        future = self._executor.submit(run)
+        future.model = model
+        future.timing = timing
+        return future
+
+    def call(self, model: str, task: Callable[[str], Any], ok: Callable[[Any], bool] = lambda r: r is not None,
+             on_loser: Optional[Callable[[str, Any, Optional[float]], None]] = None) -> Tuple[Any, bool]:
+        """task(model_name) -> result; returns (first ok result, hedged) - the primary's result when neither is ok"""
+        stats = self._model_stats(model)
+        with self._lock:
+            stats.calls += 1
+        primary = self._start(model, task, ok, stats, hedge=False)
+        done, _ = wait([primary], timeout=self.delay(model))
+        if done:
+            return primary.result(), False
+
+        alternate = self.models[model].get('alternate') or model
+        hedge = self._start(alternate, task, ok, stats, hedge=True)
+        with self._lock:
+            stats.hedged += 1
+        pending = {primary, hedge}
+        winner = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and ok(future.result()):
+                    winner = future
+                    break
+            if winner is not None:
+                break
+        if winner is None:
+            # both failed: report the primary's result / exception
+            return primary.result(), True
+
+        with self._lock:
+            stats.hedge_wins += winner is hedge
+        for loser in {primary, hedge} - {winner}:
+            if loser.cancel():
+                with self._lock:
+                    stats.cancelled += 1
+            elif on_loser is not None:
+                # a loser that already finished would run the callback here, on the caller's thread
+                loser.add_done_callback(lambda f: self._executor.submit(_report_loser, f, on_loser))
+        return winner.result(), True
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {model: {'calls': s.calls, 'hedged': s.hedged, 'hedge_wins': s.hedge_wins, 'cancelled': s.cancelled,
+                            'primary_hist': dict(sorted(s.primary_hist.items())),
+                            'hedge_hist': dict(sorted(s.hedge_hist.items()))}
+                    for model, s in sorted(self._stats.items())}
+
+    def report(self):
+        for model, s in self.stats().items():
+            if not s['calls']:
+                continue
+            rate = 100 * s['hedged'] / s['calls']
+            print(f"  🪁 {model}: {s['calls']} 次调用, 对冲 {s['hedged']} 次 ({rate:.1f}%), 对冲胜出 {s['hedge_wins']} 次, "
+                  f"当前对冲延迟 {self.delay(model):.1f}s")
+            for name in ('primary_hist', 'hedge_hist'):
+                if s[name]:
+                    buckets = ' '.join(f"<{2 ** b}s:{n}" for b, n in s[name].items())
+                    print(f"     {name.split('_')[0]:<8} {buckets}")
@@ -0,0 +1,113 @@
+"""
+Deferred imports for the heavy optional modules of gen/ and evaluation/utils.py.
+
+openai, requests and pandas cost most of the startup of every script that
+imports utils, yet quick commands (metric.py, --help, a single-entity debug
+run served from the cache) never touch them. lazy_module(name) returns a
+stand-in module object that imports the real module on first attribute access,
+so `requests.post(...)` keeps working unchanged and a missing package only
+fails when it is actually used.
+
+lazy_object(factory) does the same for module-level state that is costly or
+has side effects (reading config.json, starting the log listener thread,
+building the breaker / hedging / budget singletons): the stand-in calls
+factory() on first attribute or item access and forwards to its result.
+
+EAGER_IMPORTS=1 in the environment imports and builds everything up front
+again (benchmark_import_time.py uses it as the baseline).
+"""
+
+import os
+import sys
+import types
+import importlib
+import threading
+from typing import Any, Callable
+
+EAGER = os.environ.get('EAGER_IMPORTS', '') not in ('', '0')
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_lock'] = threading.Lock()
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    module = self.__dict__['_lazy_module'] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr: str):
+        # only called for names not set on the stand-in itself
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """The module if it is already imported (or EAGER_IMPORTS is set), else a stand-in that imports it on first use"""
+    if name in sys.modules or EAGER:
+        return importlib.import_module(name)
+    return LazyModule(name)
+
+
+_UNSET = object()
+
+
+class LazyObject:
+    """Stand-in for factory(): built on first use (attributes, items, iteration, len, in), thread-safe"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, '_lazy_factory', factory)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+        object.__setattr__(self, '_lazy_value', _UNSET)
+
+    def _get(self) -> Any:
+        value = object.__getattribute__(self, '_lazy_value')
+        if value is _UNSET:
+            with object.__getattribute__(self, '_lazy_lock'):
+                value = object.__getattribute__(self, '_lazy_value')
+                if value is _UNSET:
+                    value = object.__getattribute__(self, '_lazy_factory')()
+                    object.__setattr__(self, '_lazy_value', value)
+        return value
+
+    def __getattr__(self, attr: str):
+        return getattr(self._get(), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._get(), attr, value)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._get()
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self) -> int:
+        return len(self._get())
+
+    def __bool__(self) -> bool:
+        return bool(self._get())
+
+    def __repr__(self) -> str:
+        value = object.__getattribute__(self, '_lazy_value')
+        return "<lazy object (not built)>" if value is _UNSET else repr(value)
+
+
+def lazy_object(factory: Callable[[], Any]) -> Any:
+    """factory() now if EAGER_IMPORTS is set, else a stand-in that builds it on first use"""
+    return factory() if EAGER else LazyObject(factory)
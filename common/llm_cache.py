@@ -0,0 +1,542 @@
+"""
+Building blocks for the response cache behind utils.cached (gen/ and evaluation/).
+
+SqliteCache stores one row per response in a WAL-mode SQLite file, so several
+pipeline processes can share a cache file: readers never block, writers are
+short single-row transactions serialized by SQLite's file lock, and nothing a
+process wrote can be lost to another process rewriting a whole snapshot.
+SingleFlight coalesces concurrent identical requests inside one process.
+
+Entries expire after a per-model TTL (provider refusals get their own, short
+negative TTL) and the store is kept under max_entries / max_bytes by LRU or
+LFU eviction. Values are pickled and compressed (common.compression: zstd,
+optionally with a dictionary trained on the cache itself, or zlib).
+Maintenance: python -m common.llm_cache {stats,prune,export,import,vacuum,compress} <cache>
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import atexit
+import pickle
+import argparse
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from common.compression import DEFAULT_DICT_SIZE, ValueCodec, dictionary_id, train_dictionary
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Coalesce concurrent calls with the same key: the first caller runs the
+        function, callers arriving while it is in flight wait for its result
+        instead of issuing the identical request again.
+        """
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.leaders = 0
+        self.suppressed = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (result, shared); shared is True when another caller's result was reused"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.suppressed += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'leaders': self.leaders, 'suppressed': self.suppressed, 'in_flight': len(self._calls)}
+
+
+def key_hash(key: Hashable) -> str:
+    """Stable digest of a cached() key tuple (its repr is built from strings only)"""
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+class SqliteCache:
+    def __init__(self, path: str, timeout: float = 60.0, ttl: Optional[float] = None,
+                 model_ttl: Optional[Dict[str, float]] = None, negative_ttl: Optional[float] = 3600,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 eviction: str = 'lru', evict_every: int = 100, compression: str = 'zstd', compression_level: int = 3):
+        """
+        timeout: seconds a writer waits for another process's transaction before failing
+        ttl / model_ttl: lifetime in seconds of a response, by default / by model name prefix; 0 or None = forever
+        negative_ttl: lifetime of a negative entry (a provider refusal)
+        max_entries / max_bytes: bounds enforced every evict_every writes, evicting by 'lru' or 'lfu'
+        compression: codec for new values ('zstd', 'zlib' or 'raw'); existing values are read whatever their codec
+        """
+        if eviction not in ('lru', 'lfu'):
+            raise ValueError(f'unknown eviction policy: {eviction}')
+        self.path = path
+        self.timeout = timeout
+        self.ttl = ttl
+        self.model_ttl = model_ttl or {}
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # hits are counted in memory and written in batches, so a hit is not a write transaction
+        self._touches: Dict[str, List[float]] = {}
+        self._touch_lock = threading.Lock()
+        self._puts = 0
+        self._closed = False
+        self.codec = ValueCodec(compression, compression_level)
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key_hash TEXT PRIMARY KEY,
+                    func TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            ''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(responses)')}
+            for column, decl in (('model', "TEXT NOT NULL DEFAULT ''"), ('size', 'INTEGER NOT NULL DEFAULT 0'),
+                                 ('negative', 'INTEGER NOT NULL DEFAULT 0'), ('expires_at', 'REAL'),
+                                 ('accessed_at', 'REAL NOT NULL DEFAULT 0'), ('hits', 'INTEGER NOT NULL DEFAULT 0')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE responses ADD COLUMN {column} {decl}')
+            if 'size' not in columns:
+                conn.execute('UPDATE responses SET size = length(value), accessed_at = created_at')
+            conn.executescript('''
+                CREATE INDEX IF NOT EXISTS responses_by_access ON responses(accessed_at);
+                CREATE INDEX IF NOT EXISTS responses_by_expiry ON responses(expires_at);
+                CREATE INDEX IF NOT EXISTS responses_by_model ON responses(model, created_at);
+            ''')
+        self._load_dictionaries()
+        atexit.register(self.flush_touches)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread: WAL readers then run in parallel without a Python lock
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _load_dictionaries(self):
+        """zstd dictionaries trained into this file (meta 'zstd_dict:<id>'); 'zstd_dict' names the active one"""
+        rows = dict(self._conn().execute("SELECT name, value FROM meta WHERE name LIKE 'zstd_dict%'"))
+        active = rows.pop('zstd_dict', None)
+        self.codec.set_dictionaries({int(name.split(':', 1)[1]): dictionary for name, dictionary in rows.items()},
+                                    int(active) if active is not None else None)
+
+    def _dumps(self, value: Any) -> bytes:
+        return self.codec.encode(pickle.dumps(value, -1))
+
+    def _loads(self, data: bytes) -> Any:
+        try:
+            return pickle.loads(self.codec.decode(data))
+        except KeyError:
+            # another process trained a dictionary after this one opened the file
+            self._load_dictionaries()
+            return pickle.loads(self.codec.decode(data))
+
+    def ttl_for(self, model: str = '', negative: bool = False) -> Optional[float]:
+        if negative:
+            return self.negative_ttl
+        prefixes = [prefix for prefix in self.model_ttl if model.startswith(prefix)]
+        if prefixes:
+            return self.model_ttl[max(prefixes, key=len)]
+        return self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Value of a live (not expired) entry"""
+        digest = key_hash(key)
+        now = time.time()
+        row = self._conn().execute('SELECT value FROM responses WHERE key_hash = ? AND (expires_at IS NULL OR expires_at > ?)',
+                                   (digest, now)).fetchone()
+        if row is None:
+            return default
+        self._touch(digest, now)
+        return self._loads(row[0])
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._conn().execute('SELECT 1 FROM responses WHERE key_hash = ? AND (expires_at IS NULL OR expires_at > ?)',
+                                    (key_hash(key), time.time())).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def put(self, key: Hashable, value: Any, func: Optional[str] = None, model: str = '', negative: bool = False):
+        self.put_many([(key, value)], func, model, negative)
+
+    def put_many(self, items: Iterable[Tuple[Hashable, Any]], func: Optional[str] = None, model: str = '',
+                 negative: bool = False) -> int:
+        now = time.time()
+        ttl = self.ttl_for(model, negative)
+        expires_at = now + ttl if ttl else None
+        rows = []
+        for key, value in items:
+            data = self._dumps(value)
+            rows.append((key_hash(key), func or str(key[0]), model, data, len(data), int(negative), now, expires_at, now))
+        conn = self._conn()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO responses (key_hash, func, model, value, size, negative, created_at, '
+                             'expires_at, accessed_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)', rows)
+        self._puts += len(rows)
+        if (self.max_entries or self.max_bytes) and self._puts >= self.evict_every:
+            self._puts = 0
+            self.evict()
+        return len(rows)
+
+    def _touch(self, digest: str, now: float):
+        with self._touch_lock:
+            touch = self._touches.setdefault(digest, [0, now])
+            touch[0] += 1
+            touch[1] = now
+            full = len(self._touches) >= 100
+        if full:
+            self.flush_touches()
+
+    def flush_touches(self):
+        with self._touch_lock:
+            touches, self._touches = self._touches, {}
+        if not touches or self._closed:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany('UPDATE responses SET hits = hits + ?, accessed_at = max(accessed_at, ?) WHERE key_hash = ?',
+                             [(count, accessed_at, digest) for digest, (count, accessed_at) in touches.items()])
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently / frequently used until under the bounds (with 10% slack)"""
+        self.flush_touches()
+        order = 'accessed_at' if self.eviction == 'lru' else 'hits, accessed_at'
+        conn = self._conn()
+        evicted = 0
+        with conn:
+            evicted += conn.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time(),)).rowcount
+            count, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            excess = 0
+            if self.max_entries and count > self.max_entries:
+                excess = count - int(self.max_entries * 0.9)
+            if self.max_bytes and size > self.max_bytes and count:
+                excess = max(excess, int((size - self.max_bytes * 0.9) / (size / count)) + 1)
+            if excess:
+                evicted += conn.execute(f'DELETE FROM responses WHERE key_hash IN '
+                                        f'(SELECT key_hash FROM responses ORDER BY {order} LIMIT ?)', (excess,)).rowcount
+        return evicted
+
+    def prune(self, model: Optional[str] = None, func: Optional[str] = None, older_than: Optional[float] = None,
+              expired: bool = False, negative: Optional[bool] = None) -> int:
+        """Delete entries matching every given filter; older_than is an age in seconds"""
+        where, params = self._filters(model, func, older_than, expired, negative)
+        conn = self._conn()
+        with conn:
+            return conn.execute(f'DELETE FROM responses WHERE {where}', params).rowcount
+
+    def _filters(self, model=None, func=None, older_than=None, expired=False, negative=None) -> Tuple[str, List]:
+        clauses, params = ['1'], []
+        if model is not None:
+            clauses.append("model LIKE ? || '%'")
+            params.append(model)
+        if func is not None:
+            clauses.append('func = ?')
+            params.append(func)
+        if older_than is not None:
+            clauses.append('created_at < ?')
+            params.append(time.time() - older_than)
+        if expired:
+            clauses.append('expires_at <= ?')
+            params.append(time.time())
+        if negative is not None:
+            clauses.append('negative = ?')
+            params.append(int(negative))
+        return ' AND '.join(clauses), params
+
+    def stats(self) -> Dict[str, Any]:
+        self.flush_touches()
+        conn = self._conn()
+        now = time.time()
+        count, size, negative, expired, hits, oldest, newest = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(negative), 0), '
+            'COALESCE(SUM(expires_at <= ?), 0), COALESCE(SUM(hits), 0), MIN(created_at), MAX(created_at) FROM responses',
+            (now,)).fetchone()
+        models = [{'model': model, 'entries': n, 'bytes': b, 'negative': neg, 'hits': h}
+                  for model, n, b, neg, h in conn.execute(
+                      'SELECT model, COUNT(*), SUM(size), SUM(negative), SUM(hits) FROM responses GROUP BY model ORDER BY SUM(size) DESC')]
+        disk = sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal', '-shm') if os.path.exists(self.path + suffix))
+        return {'path': self.path, 'entries': count, 'bytes': size, 'disk_bytes': disk, 'negative': negative,
+                'expired': expired, 'hits': hits, 'oldest': oldest, 'newest': newest, 'models': models}
+
+    def export(self, out_path: str, **filters) -> int:
+        """JSONL dump of matching entries; values that are not plain JSON are kept as base64 pickles"""
+        where, params = self._filters(**filters)
+        count = 0
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for row in self._conn().execute(f'SELECT key_hash, func, model, value, negative, created_at, expires_at, hits '
+                                            f'FROM responses WHERE {where}', params):
+                digest, func, model, data, negative, created_at, expires_at, hits = row
+                value = self._loads(data)
+                record = {'key_hash': digest, 'func': func, 'model': model, 'negative': bool(negative),
+                          'created_at': created_at, 'expires_at': expires_at, 'hits': hits}
+                if isinstance(value, (str, int, float, bool, list, dict)):
+                    record['value'] = value
+                else:
+                    record['pickle'] = base64.b64encode(pickle.dumps(value, -1)).decode('ascii')
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    def import_jsonl(self, in_path: str, replace: bool = False) -> int:
+        """Load an export; existing entries are kept unless replace=True"""
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        count = 0
+        conn = self._conn()
+        with open(in_path, 'r', encoding='utf-8') as f, conn:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                value = record['value'] if 'value' in record else pickle.loads(base64.b64decode(record['pickle']))
+                data = self._dumps(value)
+                count += conn.execute(
+                    f'{verb} INTO responses (key_hash, func, model, value, size, negative, created_at, expires_at, '
+                    f'accessed_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (record['key_hash'], record['func'], record.get('model', ''), data, len(data),
+                     int(record.get('negative', False)), record['created_at'], record.get('expires_at'),
+                     record['created_at'], record.get('hits', 0))).rowcount
+        return count
+
+    def train_dictionary(self, samples: int = 2000, size: Optional[int] = None) -> int:
+        """Train a zstd dictionary on a random sample of cached values and use it for new writes; returns its id"""
+        rows = self._conn().execute('SELECT value FROM responses ORDER BY RANDOM() LIMIT ?', (samples,)).fetchall()
+        return self.use_dictionary(train_dictionary([self.codec.decode(row[0]) for row in rows], size or DEFAULT_DICT_SIZE))
+
+    def use_dictionary(self, dictionary: bytes) -> int:
+        """Store a zstd dictionary in the file and compress new values with it (in every process that opens it later)"""
+        dict_id = dictionary_id(dictionary)
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (f'zstd_dict:{dict_id}', dictionary))
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('zstd_dict', ?)", (str(dict_id),))
+        self.codec.add_dictionary(dictionary)
+        return dict_id
+
+    def recompress(self, batch_size: int = 500) -> Tuple[int, int]:
+        """Re-encode every value with the current codec; returns (bytes before, bytes after)"""
+        conn = self._conn()
+        before = after = 0
+        last = ''
+        while True:
+            rows = conn.execute('SELECT key_hash, value FROM responses WHERE key_hash > ? ORDER BY key_hash LIMIT ?',
+                                (last, batch_size)).fetchall()
+            if not rows:
+                return before, after
+            updates = []
+            for digest, data in rows:
+                packed = self.codec.encode(self.codec.decode(data))
+                before += len(data)
+                after += len(packed)
+                updates.append((packed, len(packed), digest))
+            with conn:
+                conn.executemany('UPDATE responses SET value = ?, size = ? WHERE key_hash = ?', updates)
+            last = rows[-1][0]
+
+    def vacuum(self):
+        """Give the space of deleted entries back to the file system"""
+        conn = self._conn()
+        conn.execute('VACUUM')
+        # VACUUM goes through the WAL in WAL mode; fold it back into the main file
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def import_pickle(self, pickle_path: str) -> int:
+        """One-time import of a legacy {key: value} pickle cache; later calls (from any process) are no-ops"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute("SELECT 1 FROM meta WHERE name = 'imported:' || ?", (os.path.abspath(pickle_path),)).fetchone()
+            count = 0
+            if not done:
+                with open(pickle_path, 'rb') as f:
+                    legacy = pickle.load(f)
+                now = time.time()
+                rows = []
+                for key, value in legacy.items():
+                    if value is None:
+                        continue
+                    data = self._dumps(value)
+                    rows.append((key_hash(key), str(key[0]) if isinstance(key, tuple) else '', data, len(data), now, now))
+                # entries written through the new backend win over the old snapshot
+                conn.executemany('INSERT OR IGNORE INTO responses (key_hash, func, value, size, created_at, accessed_at) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                conn.execute("INSERT INTO meta (name, value) VALUES ('imported:' || ?, ?)", (os.path.abspath(pickle_path), str(now)))
+                count = len(rows)
+            conn.execute('COMMIT')
+            return count
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        self.flush_touches()
+        self._closed = True
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+def cache_path_for(path: str) -> str:
+    """SQLite file behind a utils.set_cache_path() path ('.cache-acg.pkl' -> '.cache-acg.sqlite')"""
+    root, ext = os.path.splitext(path)
+    return path if ext == '.sqlite' else (root if ext == '.pkl' else path) + '.sqlite'
+
+
+def open_cache(path: str, **options) -> SqliteCache:
+    """
+    Cache for a utils.set_cache_path() path; options are SqliteCache keyword
+    arguments (e.g. the config.json cache section). A legacy '.pkl' path is
+    imported into the SQLite file the first time it is opened.
+    """
+    sqlite_path = cache_path_for(path)
+    cache = SqliteCache(sqlite_path, **options)
+    if path.endswith('.pkl') and os.path.exists(path):
+        imported = cache.import_pickle(path)
+        if imported:
+            print(f"imported {imported} cached responses from {path} into {sqlite_path}")
+    return cache
+
+
+def cache_options(config_section: Dict) -> Dict:
+    """SqliteCache keyword arguments from the config.json cache section"""
+    names = ('ttl', 'model_ttl', 'negative_ttl', 'max_entries', 'max_bytes', 'eviction', 'compression', 'compression_level')
+    return {name: config_section[name] for name in names if name in config_section}
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024:
+            return f'{n:.1f}{unit}'
+        n /= 1024
+    return f'{n:.1f}TB'
+
+
+def _parse_age(text: str) -> float:
+    """'3600', '90s', '30m', '12h', '7d' -> seconds"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="maintain an LLM response cache")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def add(name, help):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("cache", type=str, help="缓存路径(.sqlite，或set_cache_path使用的.pkl)")
+        return p
+
+    add('stats', '条目数、大小、按模型统计')
+    for name, help in (('prune', '按模型/年龄/过期/负缓存删除条目'), ('export', '导出为JSONL')):
+        p = add(name, help)
+        p.add_argument("--model", type=str, default=None, help="模型名前缀")
+        p.add_argument("--func", type=str, default=None)
+        p.add_argument("--older_than", type=_parse_age, default=None, help="如 3600, 12h, 30d")
+        p.add_argument("--expired", action='store_true')
+        p.add_argument("--negative", action='store_true', help="只处理负缓存(模型拒答)条目")
+        if name == 'export':
+            p.add_argument("--output", type=str, required=True)
+    p = add('import', '导入JSONL')
+    p.add_argument("--input", type=str, required=True)
+    p.add_argument("--replace", action='store_true', help="覆盖已有条目")
+    add('vacuum', '回收已删除条目占用的磁盘空间')
+    p = add('compress', '用当前压缩方式重新编码所有条目')
+    p.add_argument("--codec", type=str, default='zstd', choices=['zstd', 'zlib', 'raw'])
+    p.add_argument("--level", type=int, default=3)
+    p.add_argument("--train_dict", action='store_true', help="先在缓存样本上训练zstd字典(需要zstandard)")
+    p.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    path = cache_path_for(args.cache)
+    if args.command != 'import' and not os.path.exists(path):
+        sys.exit(f'no cache at {path}')
+    cache = SqliteCache(path, **({'compression': args.codec, 'compression_level': args.level} if args.command == 'compress' else {}))
+    filters = {}
+    if args.command in ('prune', 'export'):
+        filters = {'model': args.model, 'func': args.func, 'older_than': args.older_than,
+                   'expired': args.expired, 'negative': True if args.negative else None}
+
+    if args.command == 'stats':
+        stats = cache.stats()
+        print(f"{stats['path']}: {stats['entries']} 条, 数据 {_format_bytes(stats['bytes'])}, 磁盘 {_format_bytes(stats['disk_bytes'])}")
+        print(f"  负缓存 {stats['negative']} 条, 已过期 {stats['expired']} 条, 命中 {stats['hits']} 次")
+        if stats['oldest']:
+            print(f"  时间范围 {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['oldest']))} ~ "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(stats['newest']))}")
+        for row in stats['models']:
+            print(f"  {row['model'] or '(unknown)':<32} {row['entries']:>8} 条 {_format_bytes(row['bytes']):>10} "
+                  f"负缓存 {row['negative']:>6} 命中 {row['hits']:>8}")
+    elif args.command == 'prune':
+        if all(v is None or v is False for v in filters.values()):
+            sys.exit('prune needs at least one filter')
+        print(f"deleted {cache.prune(**filters)} entries (run vacuum to shrink the file)")
+    elif args.command == 'export':
+        print(f"exported {cache.export(args.output, **filters)} entries to {args.output}")
+    elif args.command == 'import':
+        print(f"imported {cache.import_jsonl(args.input, args.replace)} entries from {args.input}")
+    elif args.command == 'compress':
+        if args.train_dict:
+            print(f"trained zstd dictionary {cache.train_dictionary(args.samples)}")
+        before, after = cache.recompress()
+        print(f"{cache.codec.codec}: {_format_bytes(before)} -> {_format_bytes(after)} (run vacuum to shrink the file)")
+    elif args.command == 'vacuum':
+        before = cache.stats()['disk_bytes']
+        cache.vacuum()
+        print(f"{_format_bytes(before)} -> {_format_bytes(cache.stats()['disk_bytes'])}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+Per-call token and latency accounting for the LLM helpers in gen/ and evaluation/utils.py.
+
+Each _get_response call appends one record (provider, model, prompt/completion
+tokens, latency, retry number, cache hit) to a buffer owned by the calling
+thread. The buffer has its own lock, held only for the append and for the
+moment a flush swaps the pending records out, so workers never wait on each
+other. Once a buffer holds flush_every records a background flusher thread
+counts the calls whose provider reported no usage with tiktoken (one batch)
+and appends them to the metrics JSONL file with a single O_APPEND write;
+flush() / exit does the same for the rest. The worker itself never encodes
+or writes. summary() aggregates the current run, and
+`python -m common.llm_metrics <metrics.jsonl>` reports a whole file.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import functools
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_METRICS_PATH = 'llm_metrics.jsonl'
+ERROR_SIGN = '[ERROR]'  # same marker as utils.ERROR_SIGN (blocked / unrecoverable response)
+
+# Model names as accepted by _get_response -> provider
+_PROVIDER_PREFIXES = (('gemini', 'gemini'), ('doubao', 'doubao'), ('claude', 'claude'),
+                      ('gpt', 'gpt'), ('qwen', 'qwen'), ('deer-flow', 'deer-flow'))
+
+
+def provider_for(model: str) -> str:
+    for prefix, provider in _PROVIDER_PREFIXES:
+        if model.startswith(prefix):
+            return provider
+    return 'unknown'
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name: str = 'cl100k_base'):
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+def token_text(text: Any) -> str:
+    """The text tiktoken counts for a string, message list or JSON-able response"""
+    if text is None:
+        return ''
+    if isinstance(text, list) and all(isinstance(m, dict) and 'content' in m for m in text):
+        return '\n'.join(str(m['content']) for m in text)
+    if not isinstance(text, str):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def count_tokens(text: Any, encoding_name: str = 'cl100k_base') -> int:
+    """tiktoken count of a string, message list or JSON-able response"""
+    if text is None:
+        return 0
+    return len(get_encoding(encoding_name).encode(token_text(text), disallowed_special=()))
+
+
+def usage_from_response(response: Any) -> Optional[Tuple[int, int]]:
+    """(prompt_tokens, completion_tokens) from an OpenAI, Gemini or Ark responses payload"""
+    if response is None:
+        return None
+    if not isinstance(response, dict):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        return getattr(usage, 'prompt_tokens', 0) or 0, getattr(usage, 'completion_tokens', 0) or 0
+    if isinstance(response.get('usage'), dict):
+        usage = response['usage']
+        if 'prompt_tokens' in usage:
+            return usage.get('prompt_tokens') or 0, usage.get('completion_tokens') or 0
+        if 'input_tokens' in usage:
+            return usage.get('input_tokens') or 0, usage.get('output_tokens') or 0
+    if isinstance(response.get('usageMetadata'), dict):
+        usage = response['usageMetadata']
+        return usage.get('promptTokenCount') or 0, usage.get('candidatesTokenCount') or 0
+    return None
+
+
+class _ThreadBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records: List[Dict] = []
+        # records still to be counted with tiktoken: (record, prompt or None if already counted, completion or None)
+        self.uncounted: List[Tuple[Dict, Any, Any]] = []
+        # (provider, model) -> [calls, cache_hits, failures, retries, prompt, completion, latency]
+        self.totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0.0])
+        self.latencies: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        self.usage: Optional[Tuple[int, int]] = None
+        self.prompt_tokens: Optional[int] = None
+        self.cache_hit = False
+        self.extra: Optional[Dict] = None
+
+
+class LLMMetrics:
+    def __init__(self, path: str = DEFAULT_METRICS_PATH, flush_every: int = 50, encoding_name: str = 'cl100k_base'):
+        self.path = path
+        self.flush_every = flush_every
+        self.encoding_name = encoding_name
+        self.run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.stage = os.path.basename(getattr(sys.modules.get('__main__'), '__file__', '') or 'interactive')
+        self._local = threading.local()
+        # appended once per thread; list.append is atomic, so no shared lock on the call path
+        self._buffers: List[_ThreadBuffer] = []
+        self._fd: Optional[int] = None
+        self._fd_lock = threading.Lock()
+        # one flush at a time (flusher thread, flush() from a caller, exit)
+        self._flush_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._warned = False
+        atexit.register(self.flush)
+
+    def _buffer(self) -> _ThreadBuffer:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadBuffer()
+            self._buffers.append(buffer)
+        return buffer
+
+    def note_usage(self, response: Any):
+        """Called by a provider with its raw API response so usage counts beat tiktoken estimates"""
+        self._buffer().usage = usage_from_response(response)
+
+    def note_prompt_tokens(self, tokens: int):
+        """Prompt size already counted by the caller (token budget), used instead of re-encoding the prompt"""
+        self._buffer().prompt_tokens = tokens
+
+    def note_cache_hit(self):
+        self._buffer().cache_hit = True
+
+    def take_noted(self) -> Tuple[Optional[Tuple[int, int]], Optional[Dict]]:
+        """Pop the usage / extra fields noted on this thread, to hand them to the thread that records the call"""
+        buffer = self._buffer()
+        noted = buffer.usage, buffer.extra
+        buffer.usage, buffer.extra = None, None
+        return noted
+
+    def restore_noted(self, noted: Tuple[Optional[Tuple[int, int]], Optional[Dict]]):
+        buffer = self._buffer()
+        buffer.usage = noted[0]
+        buffer.extra = dict(buffer.extra or {}, **(noted[1] or {})) or None
+
+    def note_extra(self, **fields):
+        """Extra fields for the next record of this thread (e.g. hedged=True)"""
+        buffer = self._buffer()
+        buffer.extra = dict(buffer.extra or {}, **fields)
+
+    def record(self, model: str, messages: Any, response: Any, latency: float, retry: int = 0):
+        buffer = self._buffer()
+        usage, cache_hit, extra, known_prompt = buffer.usage, buffer.cache_hit, buffer.extra, buffer.prompt_tokens
+        buffer.usage, buffer.cache_hit, buffer.extra, buffer.prompt_tokens = None, False, None, None
+
+        ok = isinstance(response, (str, dict, list)) and bool(response) and response != ERROR_SIGN
+        if cache_hit:
+            # served from the local cache: nothing billed
+            prompt_tokens = completion_tokens = 0
+            token_source = 'cache'
+        elif usage is not None:
+            prompt_tokens, completion_tokens = usage
+            token_source = 'usage'
+        else:
+            # counted in _count() when the buffer is written
+            prompt_tokens = known_prompt or 0
+            completion_tokens = 0
+            token_source = 'tiktoken'
+
+        provider = provider_for(model)
+        record = {
+            'run_id': self.run_id, 'stage': self.stage, 'time': round(time.time(), 3),
+            'provider': provider, 'model': model,
+            'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'token_source': token_source,
+            'latency': round(latency, 4), 'retry': retry, 'cache_hit': cache_hit, 'ok': ok,
+        }
+        if extra:
+            record.update(extra)
+        with buffer.lock:
+            buffer.records.append(record)
+            if token_source == 'tiktoken':
+                buffer.uncounted.append((record, None if known_prompt is not None else messages, response if ok else None))
+            totals = buffer.totals[(provider, model)]
+            totals[0] += 1
+            totals[1] += cache_hit
+            totals[2] += not ok
+            totals[3] += retry > 0
+            totals[4] += prompt_tokens
+            totals[5] += completion_tokens
+            totals[6] += latency
+            if not cache_hit:
+                buffer.latencies[(provider, model)].append(latency)
+
+            full = len(buffer.records) >= self.flush_every
+        if full:
+            self._wake_flusher()
+
+    def _wake_flusher(self):
+        if self._flusher is None:
+            with self._fd_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name='llm-metrics-flusher', daemon=True)
+                    self._flusher.start()
+        self._wake.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                if not self._warned:
+                    self._warned = True
+                    print(f'llm metrics: flush failed: {e!r}')
+
+    def _count(self, buffer: _ThreadBuffer, uncounted: List[Tuple[Dict, Any, Any]]):
+        """Fill in the tiktoken counts of records taken from a buffer, in one batch (buffer.lock not held)"""
+        if not uncounted:
+            return
+        texts = []
+        for _, messages, response in uncounted:
+            if messages is not None:
+                texts.append(token_text(messages))
+            texts.append(token_text(response))
+        try:
+            lengths = [len(tokens) for tokens in get_encoding(self.encoding_name).encode_ordinary_batch(texts)]
+        except Exception as e:
+            # accounting must never fail the call itself; the records keep 0 tokens
+            if not self._warned:
+                self._warned = True
+                print(f'llm metrics: token counting failed: {e!r}')
+            return
+        lengths = iter(lengths)
+        for record, messages, _ in uncounted:
+            if messages is not None:
+                record['prompt_tokens'] = next(lengths)
+            record['completion_tokens'] = next(lengths)
+        with buffer.lock:
+            for record, messages, _ in uncounted:
+                totals = buffer.totals[(record['provider'], record['model'])]
+                if messages is not None:
+                    totals[4] += record['prompt_tokens']
+                totals[5] += record['completion_tokens']
+
+    def _write(self, records: List[Dict]):
+        if not records or not self.path:
+            return
+        with self._fd_lock:
+            if self._fd is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # one write() per batch: O_APPEND keeps concurrent batches from interleaving
+        os.write(self._fd, ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8'))
+
+    def flush(self):
+        """Count and write out every thread's pending records"""
+        with self._flush_lock:
+            for buffer in list(self._buffers):
+                with buffer.lock:
+                    records, buffer.records = buffer.records, []
+                    uncounted, buffer.uncounted = buffer.uncounted, []
+                self._count(buffer, uncounted)
+                self._write(records)
+
+    def set_path(self, path: str):
+        with self._flush_lock:
+            self.flush()
+            with self._fd_lock:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self.path = path
+
+    def summary(self) -> List[Dict]:
+        totals: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0.0])
+        latencies: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+        # pending records still need their tiktoken counts
+        self.flush()
+        for buffer in list(self._buffers):
+            with buffer.lock:
+                for key, values in buffer.totals.items():
+                    totals[key] = [a + b for a, b in zip(totals[key], values)]
+                for key, values in buffer.latencies.items():
+                    latencies[key].extend(values)
+        return [_row(provider, model, values, latencies[(provider, model)])
+                for (provider, model), values in sorted(totals.items())]
+
+    def report(self):
+        print_report(self.summary(), title=f"📈 LLM调用统计 (run {self.run_id})")
+
+    def wrap(self, func):
+        """Decorate _get_response(model, messages, nth_generation=0, ...) to record every call"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            model = kwargs.get('model', args[0] if args else '')
+            messages = kwargs.get('messages', args[1] if len(args) > 1 else None)
+            start = time.perf_counter()
+            response = None
+            try:
+                response = func(*args, **kwargs)
+                return response
+            finally:
+                try:
+                    self.record(model, messages, response, time.perf_counter() - start, kwargs.get('nth_generation', 0))
+                except Exception as e:
+                    # accounting must never fail the call itself
+                    if not self._warned:
+                        self._warned = True
+                        print(f'llm metrics disabled for a call: {e!r}')
+        return wrapper
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _row(provider: str, model: str, totals: List[float], latencies: List[float]) -> Dict:
+    calls, cache_hits, failures, retries, prompt_tokens, completion_tokens, latency = totals
+    latencies = sorted(latencies)
+    return {
+        'provider': provider, 'model': model, 'calls': int(calls), 'cache_hits': int(cache_hits),
+        'failures': int(failures), 'retries': int(retries),
+        'prompt_tokens': int(prompt_tokens), 'completion_tokens': int(completion_tokens),
+        'latency': latency, 'p50': _percentile(latencies, 0.5), 'p95': _percentile(latencies, 0.95),
+    }
+
+
+def summarize(records: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """Aggregate metrics records per run: run_id -> rows per (provider, model)"""
+    runs: Dict[str, Dict[Tuple[str, str], List[float]]] = defaultdict(lambda: defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0.0]))
+    latencies: Dict[Tuple[str, str, str], List[float]] = defaultdict(list)
+    stages: Dict[str, str] = {}
+    for r in records:
+        run = f"{r['run_id']} ({r.get('stage', '')})"
+        key = (r['provider'], r['model'])
+        totals = runs[run][key]
+        totals[0] += 1
+        totals[1] += bool(r['cache_hit'])
+        totals[2] += not r['ok']
+        totals[3] += r['retry'] > 0
+        totals[4] += r['prompt_tokens']
+        totals[5] += r['completion_tokens']
+        totals[6] += r['latency']
+        if not r['cache_hit']:
+            latencies[(run,) + key].append(r['latency'])
+    return {run: [_row(provider, model, values, latencies[(run, provider, model)])
+                  for (provider, model), values in sorted(rows.items())]
+            for run, rows in runs.items()}
+
+
+def print_report(rows: List[Dict], title: str = '📈 LLM调用统计'):
+    print(title)
+    if not rows:
+        print('  (no calls)')
+        return
+    total_tokens = sum(r['prompt_tokens'] + r['completion_tokens'] for r in rows) or 1
+    total_latency = sum(r['latency'] for r in rows) or 1.0
+    print(f"  {'provider/model':<32} {'calls':>7} {'cache':>7} {'fail':>5} {'retry':>6} {'prompt':>10} "
+          f"{'compl':>9} {'tok%':>6} {'time(s)':>9} {'time%':>6} {'p50':>6} {'p95':>6}")
+    for r in rows:
+        tokens = r['prompt_tokens'] + r['completion_tokens']
+        print(f"  {r['provider'] + '/' + r['model']:<32} {r['calls']:>7} {r['cache_hits']:>7} {r['failures']:>5} "
+              f"{r['retries']:>6} {r['prompt_tokens']:>10} {r['completion_tokens']:>9} {100 * tokens / total_tokens:>5.1f}% "
+              f"{r['latency']:>9.1f} {100 * r['latency'] / total_latency:>5.1f}% {r['p50']:>6.1f} {r['p95']:>6.1f}")
+
+
+def iter_metrics(path: str) -> Iterable[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summarize an LLM metrics file per pipeline run")
+    parser.add_argument("path", type=str, nargs='?', default=DEFAULT_METRICS_PATH)
+    parser.add_argument("--run", type=str, default=None, help="只显示run_id包含该字符串的运行")
+    args = parser.parse_args()
+
+    for run, rows in summarize(iter_metrics(args.path)).items():
+        if args.run is None or args.run in run:
+            print_report(rows, title=f"📈 {run}")
+
+
+if __name__ == "__main__":
+    main()
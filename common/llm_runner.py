@@ -0,0 +1,393 @@
+"""
+Shared driver for the per-entity LLM scripts (gen_wiki, knowledge_extraction,
+completeness_evaluation, check_json).
+
+A script only defines how to process one task and how to key its result;
+LLMRunner feeds tasks from a lazy iterable into a thread pool with a bounded
+in-flight window, skips tasks already completed in the output (resume), hands
+results to pluggable sinks and reports progress, ETA and per-task timing
+(aggregated in fixed-size counters, not stored per task).
+"""
+
+import os
+import json
+import math
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .record_store import DiskStore, iter_records
+from .profiling import span, profiled
+
+
+class JsonSink:
+    def __init__(self, path: str, save_interval: int = 10, indent: Optional[int] = 2):
+        """Results as one JSON object {key: result}, rewritten every save_interval results"""
+        self.path = path
+        self.save_interval = save_interval
+        self.indent = indent
+        self.results: Dict[str, Any] = {}
+        self._previous: Dict[str, Any] = {}
+        self._unsaved = 0
+
+    def resume(self, is_complete: Callable[[Any], bool]) -> Set[str]:
+        """Load the previous output and return the keys whose results are complete"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._previous = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                print(f'cannot resume from {self.path}')
+        return {key for key, result in self._previous.items() if is_complete(result)}
+
+    def previous_result(self, key: str) -> Any:
+        return self._previous[key]
+
+    def restore(self, key: str, result: Any):
+        """Carry over a result of a previous run"""
+        self.results[key] = result
+
+    def write(self, key: str, result: Any):
+        self.results[key] = result
+        self._unsaved += 1
+        if self.save_interval and self._unsaved >= self.save_interval:
+            self.flush()
+
+    @profiled('progress.dump')
+    def flush(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.results, f, ensure_ascii=False, indent=self.indent)
+        os.replace(tmp_path, self.path)
+        print(f"💾 已完成 {len(self.results)} 个实体，中间结果已保存: {self.path}")
+        self._unsaved = 0
+
+    def close(self):
+        self.flush()
+
+    def items(self):
+        return self.results.items()
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        """Append-only {"key": ..., "result": ...} lines; cost per result does not grow with the run"""
+        self.path = path
+        self._f = None
+        self._previous: Dict[str, Any] = {}
+
+    def resume(self, is_complete: Callable[[Any], bool]) -> Set[str]:
+        self._previous = dict(iter_records(self.path)) if os.path.exists(self.path) else {}
+        return {key for key, result in self._previous.items() if is_complete(result)}
+
+    def previous_result(self, key: str) -> Any:
+        return self._previous[key]
+
+    def restore(self, key: str, result: Any):
+        if key not in self._previous:
+            self.write(key, result)
+
+    @profiled('progress.write')
+    def write(self, key: str, result: Any):
+        if self._f is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._f = open(self.path, 'a', encoding='utf-8')
+        self._f.write(json.dumps({'key': key, 'result': result}, ensure_ascii=False) + '\n')
+        self._f.flush()
+
+    def flush(self):
+        if self._f is not None:
+            self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def items(self):
+        return iter_records(self.path)
+
+
+class SpooledJsonSink:
+    def __init__(self, path: str, indent: Optional[int] = 2):
+        """
+        Same {key: result} JSON output as JsonSink, but results are appended to a
+        <path>.partial.jsonl journal as they arrive and the JSON file is streamed out
+        of the journal on close. Memory stays flat however many entities a run has;
+        an interrupted run resumes from its journal.
+        """
+        self.path = path
+        self.indent = indent
+        self.journal_path = path + '.partial.jsonl'
+        self._journal = JsonlSink(self.journal_path)
+        self._previous: Optional[DiskStore] = None
+        self._started = False
+
+    def _start(self):
+        # A journal left behind by a run that is not being resumed is stale
+        if not self._started:
+            self._started = True
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def resume(self, is_complete: Callable[[Any], bool]) -> Set[str]:
+        # Previous results go to a disk store; the new journal starts empty and
+        # receives whatever the runner restores from it
+        self._started = True
+        source = None
+        if os.path.exists(self.journal_path):
+            source = self.journal_path
+        elif os.path.exists(self.path):
+            source = self.path
+        if source is None:
+            return set()
+
+        self._previous = DiskStore()
+        completed = set()
+
+        def complete_records():
+            for key, result in iter_records(source):
+                if is_complete(result):
+                    completed.add(key)
+                    yield key, result
+
+        self._previous.put_many(complete_records())
+        if source == self.journal_path:
+            os.replace(self.journal_path, self.journal_path + '.resumed')
+        return completed
+
+    def previous_result(self, key: str) -> Any:
+        return self._previous.get(key)
+
+    def restore(self, key: str, result: Any):
+        self.write(key, result)
+
+    def write(self, key: str, result: Any):
+        self._start()
+        self._journal.write(key, result)
+
+    def flush(self):
+        self._journal.flush()
+
+    @profiled('progress.finalize')
+    def close(self):
+        self._start()
+        self._journal.close()
+        if self._previous is not None:
+            self._previous.close()
+            self._previous = None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Latest result per key wins; only offsets are kept in memory
+        offsets: Dict[str, int] = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        offsets[json.loads(line)['key']] = offset
+                    except (json.JSONDecodeError, KeyError):
+                        pass
+                    offset += len(line)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as out, open(self.journal_path if offsets else os.devnull, 'rb') as journal:
+            out.write('{')
+            for i, (key, offset) in enumerate(offsets.items()):
+                journal.seek(offset)
+                result = json.loads(journal.readline())['result']
+                value = json.dumps(result, ensure_ascii=False, indent=self.indent)
+                if self.indent is not None:
+                    pad = ' ' * self.indent
+                    value = value.replace('\n', '\n' + pad)
+                    out.write(('' if i == 0 else ',') + '\n' + pad)
+                else:
+                    out.write('' if i == 0 else ', ')
+                out.write(json.dumps(key, ensure_ascii=False) + ': ' + value)
+            out.write('\n}' if offsets and self.indent is not None else '}')
+        os.replace(tmp_path, self.path)
+
+        for path in (self.journal_path, self.journal_path + '.resumed'):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"💾 已保存 {len(offsets)} 个实体: {self.path}")
+
+    def items(self):
+        return iter_records(self.path)
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds}s'
+
+
+class TaskTimings:
+    """
+    Per-task durations in fixed-size counters: count, total, max and a histogram
+    with 4 buckets per doubling (percentiles within ~19%), so memory does not
+    grow with the number of tasks
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._hist: Dict[int, int] = {}
+
+    @staticmethod
+    def _bucket(seconds: float) -> int:
+        # bucket b holds durations in (2^((b-1)/4), 2^(b/4)] seconds; anything under 10ms shares one bucket
+        return math.ceil(4 * math.log2(max(seconds, 0.01)))
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        bucket = self._bucket(seconds)
+        self._hist[bucket] = self._hist.get(bucket, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (capped at the max)"""
+        if not self.count:
+            return 0.0
+        rank = min(self.count - 1, int(q * self.count))
+        seen = 0
+        for bucket in sorted(self._hist):
+            seen += self._hist[bucket]
+            if seen > rank:
+                return min(2 ** (bucket / 4), self.max)
+        return self.max
+
+
+class LLMRunner:
+    def __init__(self, process: Callable[[Any], Any], key: Callable[[Any], str], sinks: List,
+                 max_workers: int = 5, max_in_flight: Optional[int] = None, parallel: bool = True,
+                 resume: bool = True, is_complete: Callable[[Any], bool] = lambda result: result is not None,
+                 is_success: Callable[[Any], bool] = lambda result: result is not None):
+        """
+        process(task) -> result runs in worker threads; key(task) names the result.
+        The first sink is the primary output: with resume=True its complete results
+        are carried over and those tasks are not processed again.
+        At most max_in_flight tasks (default 2 * max_workers) are submitted at a time.
+        """
+        self.process = process
+        self.key = key
+        self.sinks = sinks
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or 2 * max_workers
+        self.parallel = parallel
+        self.resume = resume
+        self.is_complete = is_complete
+        self.is_success = is_success
+
+        self.timings = TaskTimings()
+        self.processed = 0
+        self.resumed = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def _timed(self, task):
+        start = time.perf_counter()
+        try:
+            with span('task'):
+                result = self.process(task)
+        except Exception:
+            traceback.print_exc()
+            result = None
+        return result, time.perf_counter() - start
+
+    def _emit(self, key: str, result: Any):
+        for sink in self.sinks:
+            sink.write(key, result)
+
+    def _record(self, key: str, result: Any, elapsed: float, total: Optional[int]):
+        self.timings.add(elapsed)
+        self.processed += 1
+        if self.is_success(result):
+            self.succeeded += 1
+            status = '完成'
+        else:
+            self.failed += 1
+            status = '失败'
+
+        self._emit(key, result)
+
+        done = self.processed + self.resumed
+        wall = time.perf_counter() - self._start
+        progress = f'[{done}/{total}]' if total else f'[{done}]'
+        eta = ''
+        if total and self.processed:
+            eta = f', ETA {_format_seconds((total - done) * wall / self.processed)}'
+        print(f"{progress} {key} {status} ({elapsed:.1f}s{eta})")
+
+    def run(self, tasks: Iterable, total: Optional[int] = None) -> 'LLMRunner':
+        primary = self.sinks[0]
+        completed = primary.resume(self.is_complete) if self.resume else set()
+        self._start = time.perf_counter()
+
+        def pending():
+            for task in tasks:
+                key = self.key(task)
+                if key in completed:
+                    self.resumed += 1
+                    result = primary.previous_result(key)
+                    for sink in self.sinks:
+                        sink.restore(key, result)
+                    continue
+                yield key, task
+
+        try:
+            if not self.parallel:
+                for key, task in pending():
+                    result, elapsed = self._timed(task)
+                    self._record(key, result, elapsed, total)
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    queue = pending()
+                    in_flight = {}
+                    exhausted = False
+                    while True:
+                        # Backpressure: only pull new tasks while the window has room
+                        while not exhausted and len(in_flight) < self.max_in_flight:
+                            try:
+                                key, task = next(queue)
+                            except StopIteration:
+                                exhausted = True
+                                break
+                            in_flight[executor.submit(self._timed, task)] = key
+                        if not in_flight:
+                            break
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            key = in_flight.pop(future)
+                            result, elapsed = future.result()
+                            self._record(key, result, elapsed, total)
+        finally:
+            for sink in self.sinks:
+                sink.close()
+
+        self.summary()
+        return self
+
+    def summary(self):
+        timings = self.timings
+        wall = time.perf_counter() - self._start
+        print("📊 统计结果:")
+        print(f"  新处理实体: {self.processed}, 已完成(跳过): {self.resumed}")
+        print(f"  新成功: {self.succeeded}, 新失败: {self.failed}")
+        if timings.count:
+            print(f"  单任务耗时: mean {timings.total / timings.count:.1f}s, p50 ≤{timings.percentile(0.5):.1f}s, "
+                  f"p95 ≤{timings.percentile(0.95):.1f}s, max {timings.max:.1f}s")
+        print(f"  总耗时: {_format_seconds(wall)}")
@@ -0,0 +1,279 @@
+"""
+Local mock of the LLM APIs used by gen/ and evaluation/utils.py, for offline benchmarks.
+
+Serves the three wire formats the pipeline speaks:
+  POST .../chat/completions      OpenAI-compatible (gpt, qwen, claude via openai client)
+  POST ...:generateContent       Gemini REST (gemini, gemini_search)
+  POST .../responses             Ark responses API (doubao_search)
+and their streaming variants ("stream": true, ...:streamGenerateContent?alt=sse)
+as server-sent events spread over the drawn latency, with an optional rate of
+streams cut off halfway (drop_rate) to exercise resumption. Latency
+distribution, error rate and response size are configurable. Response
+content follows the prompt: knowledge extraction prompts get a knowledge_points
+JSON object, completeness prompts get one verdict per knowledge id, anything
+else gets free text, so the stage scripts parse the answers as they would real ones.
+
+Standalone: python -m common.mock_llm_server --port 8765 --latency lognormal:1.5,0.5
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+_WORDS = ['sword', 'academy', 'captain', 'village', 'rival', 'festival', 'magic', 'ocean', 'signal', 'promise',
+          'brother', 'titan', 'wall', 'mission', 'dream', 'storm', 'legend', 'friend', 'battle', 'secret']
+_VERDICTS = ['supported', 'partially supported', 'irrelevant', 'contradicted']
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | exp:MEAN (seconds)"""
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',') if v]
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        import math
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f'unknown latency distribution: {spec}')
+
+
+class MockLLM:
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, response_chars: int = 2000,
+                 knowledge_points: int = 15, seed: int = 0, drop_rate: float = 0.0, stream_chunks: int = 20):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.response_chars = response_chars
+        self.knowledge_points = knowledge_points
+        self.drop_rate = drop_rate
+        self.stream_chunks = stream_chunks
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def _draw(self) -> Tuple[float, bool, int]:
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+            return max(0.0, self.latency(self._rng)), failed, self._rng.randrange(1 << 30)
+
+    def text(self, rng: random.Random, chars: int) -> str:
+        words, size = [], 0
+        while size < chars:
+            word = rng.choice(_WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words)
+
+    def answer(self, prompt: str, rng: random.Random) -> Tuple[str, int]:
+        """(content, completion size in characters) for the last user message"""
+        if '"evaluation"' in prompt and '### Input' in prompt:
+            ids = [int(i) for i in re.findall(r'"id":\s*(\d+)', prompt.rsplit('### Input', 1)[1])]
+            content = json.dumps([{'id': i, 'knowledge': f'knowledge {i}', 'evaluation': rng.choice(_VERDICTS),
+                                   'evidence': self.text(rng, 60)} for i in ids], ensure_ascii=False, indent=2)
+        elif '**knowledge items**' in prompt:
+            per_item = max(20, self.response_chars // max(1, self.knowledge_points))
+            content = json.dumps({'knowledge_points': [
+                {'knowledge': self.text(rng, per_item), 'type': 'experience', 'source': 'content'}
+                for _ in range(self.knowledge_points)]}, ensure_ascii=False, indent=2)
+        else:
+            content = self.text(rng, self.response_chars)
+        return content, len(content)
+
+    def handle(self, path: str, body: Dict) -> Tuple[int, Dict, float]:
+        delay, failed, seed = self._draw()
+        if failed:
+            return 429, {'error': {'code': 429, 'message': 'rate limit exceeded, please try again later'}}, delay
+        rng = random.Random(seed)
+
+        if path.endswith('/chat/completions'):
+            prompt = _last_user_text(body.get('messages', []), 'content')
+            content, _ = self.answer(prompt, rng)
+            return 200, {
+                'id': f'chatcmpl-{seed}', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': _usage(prompt, content, 'prompt_tokens', 'completion_tokens'),
+            }, delay
+        if path.lower().endswith('generatecontent') or 'gemini' in path:
+            prompt = ' '.join(part.get('text', '') for message in body.get('contents', [])[-1:]
+                              for part in message.get('parts', []))
+            content, _ = self.answer(prompt, rng)
+            usage = _usage(prompt, content, 'promptTokenCount', 'candidatesTokenCount')
+            return 200, {'candidates': [{'content': {'role': 'model', 'parts': [{'text': content}]}}],
+                         'usageMetadata': usage}, delay
+        if path.endswith('/responses'):
+            prompt = _last_user_text(body.get('input', []), 'content')
+            content, _ = self.answer(prompt, rng)
+            return 200, {'output': [{'type': 'message', 'content': [{'type': 'output_text', 'text': content}]}],
+                         'usage': _usage(prompt, content, 'input_tokens', 'output_tokens')}, delay
+        return 404, {'error': {'message': f'unknown endpoint {path}'}}, 0.0
+
+    def stream(self, path: str, body: Dict) -> Tuple[int, object, float]:
+        """(status, list of SSE payloads or an error payload, delay); a dropped stream ends halfway"""
+        status, payload, delay = self.handle(path, body)
+        if status != 200:
+            return status, payload, delay
+        if path.endswith('/chat/completions'):
+            content = payload['choices'][0]['message']['content']
+            events = [{'id': payload['id'], 'object': 'chat.completion.chunk', 'model': payload['model'],
+                       'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                      for piece in _pieces(content, self.stream_chunks)]
+            events[-1]['choices'][0]['finish_reason'] = 'stop'
+            events.append({'id': payload['id'], 'object': 'chat.completion.chunk', 'model': payload['model'],
+                           'choices': [], 'usage': payload['usage']})
+            events.append('[DONE]')
+        elif path.endswith('/responses'):
+            content = payload['output'][-1]['content'][0]['text']
+            events = [{'type': 'response.output_text.delta', 'delta': piece} for piece in _pieces(content, self.stream_chunks)]
+            events.append({'type': 'response.completed', 'response': payload})
+        else:
+            content = payload['candidates'][0]['content']['parts'][0]['text']
+            events = [{'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}]}
+                      for piece in _pieces(content, self.stream_chunks)]
+            events[-1]['candidates'][0]['finishReason'] = 'STOP'
+            events[-1]['usageMetadata'] = payload['usageMetadata']
+        with self._lock:
+            dropped = self._rng.random() < self.drop_rate
+            self.dropped += dropped
+        if dropped:
+            events = events[:max(1, len(events) // 2)]
+            events.append(None)  # connection closed without the end of the stream
+        return status, events, delay
+
+
+def _pieces(text: str, n: int) -> List[str]:
+    size = max(1, -(-len(text) // max(1, n)))
+    return [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+
+def _last_user_text(messages: List[Dict], field: str) -> str:
+    for message in reversed(messages):
+        if message.get('role') == 'user':
+            content = message.get(field, '')
+            return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return ''
+
+
+def _usage(prompt: str, content: str, prompt_field: str, completion_field: str) -> Dict:
+    # ~4 characters per token, close enough for throughput accounting
+    return {prompt_field: len(prompt) // 4 + 1, completion_field: len(content) // 4 + 1}
+
+
+def make_handler(mock: MockLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                body = {}
+            if body.get('stream') or ':streamGenerateContent' in self.path:
+                return self.send_stream(*mock.stream(self.path.split('?')[0], body))
+            status, payload, delay = mock.handle(self.path, body)
+            if delay:
+                time.sleep(delay)
+            data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_stream(self, status, events, delay):
+            if status != 200:
+                time.sleep(delay)
+                data = json.dumps(events, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            # first token after a fifth of the latency, the rest spread over the remainder
+            time.sleep(delay * 0.2)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for event in events:
+                if event is None:
+                    return
+                data = event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)
+                self.wfile.write(f'data: {data}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(delay * 0.8 / max(1, len(events)))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class MockLLMServer:
+    def __init__(self, mock: MockLLM, host: str = '127.0.0.1', port: int = 0):
+        """port=0 picks a free port; see .url"""
+        self.mock = mock
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(mock))
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'MockLLMServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-llm-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mock OpenAI/Gemini/Ark LLM server")
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=str, default='fixed:0', help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | exp:MEAN")
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--response_chars", type=int, default=2000)
+    parser.add_argument("--knowledge_points", type=int, default=15)
+    parser.add_argument("--drop_rate", type=float, default=0.0, help="流式响应中途断开的比例")
+    args = parser.parse_args()
+
+    server = MockLLMServer(MockLLM(args.latency, args.error_rate, args.response_chars, args.knowledge_points,
+                                   drop_rate=args.drop_rate), args.host, args.port)
+    print(f"mock LLM server on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Name and franchise normalization shared by every pipeline stage.
+
+All patterns are compiled once at import time and the scalar functions are
+memoized, so the same character key normalizes identically (and cheaply) in
+getcharacter, fandom, gen and evaluation.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+_TITLE_PREFIX = re.compile(r'^(mr|mrs|dr|sir|lord|lady|captain|professor)\s+')
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Normalized alias -> canonical franchise
+FRANCHISE_ALIASES = {
+    'onepiece': 'one piece',
+    'shingeki no kyojin': 'attack on titan', 'aot': 'attack on titan',
+    'jjk': 'jujutsu kaisen',
+    'naruto shippuden': 'naruto',
+    'hxh': 'hunter x hunter',
+    'kimetsu no yaiba': 'demon slayer',
+    'boku no hero academia': 'my hero academia', 'mha': 'my hero academia', 'bnha': 'my hero academia',
+    'genshin': 'genshin impact',
+    'pokémon': 'pokemon',
+    'spyxfamily': 'spy x family',
+    'opm': 'one punch man',
+}
+
+CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_name(name: str) -> str:
+    """Lowercase, drop titles and punctuation, collapse spaces, unify romanization (Gojou -> Gojo)"""
+    if not name:
+        return ''
+    name = _TITLE_PREFIX.sub('', name.lower())
+    name = _PUNCTUATION.sub('', name)
+    name = _WHITESPACE.sub(' ', name).strip()
+    return name.replace('ou', 'o').replace('uu', 'u')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_franchise(franchise: str) -> str:
+    """Lowercase, punctuation to spaces, collapse spaces and map known aliases"""
+    if not franchise:
+        return ''
+    normalized = _PUNCTUATION.sub(' ', franchise.lower().strip())
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return FRANCHISE_ALIASES.get(normalized, normalized)
+
+
+def _batch(func, values):
+    # pandas Series keep their index; anything else iterable (lists, numpy arrays) gives a list.
+    # Each distinct value is normalized once.
+    if hasattr(values, 'map') and hasattr(values, 'index'):
+        return values.map(func)
+    seen = {}
+    return [seen[v] if v in seen else seen.setdefault(v, func(v)) for v in values]
+
+
+def normalize_names(names: Iterable[str]) -> List[str]:
+    """normalize_name over an array of strings"""
+    return _batch(normalize_name, names)
+
+
+def normalize_franchises(franchises: Iterable[str]) -> List[str]:
+    """normalize_franchise over an array of strings"""
+    return _batch(normalize_franchise, franchises)
+
+
+def make_entity_key(name: str, franchise: str) -> str:
+    """The "Name (Franchise)" key used for results across stages"""
+    return f'{name} ({franchise})'
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def split_entity_key(key: str) -> Tuple[str, str]:
+    """Inverse of make_entity_key; franchise is '' for keys without parentheses"""
+    if '(' not in key:
+        return key.strip(), ''
+    name, franchise = key.split('(', maxsplit=1)
+    franchise = franchise.strip()
+    if franchise.endswith(')'):
+        franchise = franchise[:-1]
+    return name.strip(), franchise.strip()
+
+
+def normalize_entity_key(key: str) -> Tuple[str, str]:
+    """(normalized name, normalized franchise) of a "Name (Franchise)" key"""
+    name, franchise = split_entity_key(key)
+    return normalize_name(name), normalize_franchise(franchise)
@@ -0,0 +1,200 @@
+"""
+Opt-in profiling for the LLM pipeline scripts.
+
+Set PIPELINE_PROFILE=1 (optionally PIPELINE_PROFILE_DIR, default ./profile) to
+record timing spans around the hot paths: provider calls, cache load/pickle,
+extract_json, progress-file writes and waits on shared locks. Spans are
+aggregated per name and per thread in thread-local tables; a background
+sampler also collects stacks of every thread into a folded-stacks file that
+speedscope (https://www.speedscope.app) and flamegraph.pl open directly.
+The report is printed and saved when the process exits.
+
+Profiling is decided once at import: when it is off, span() returns a shared
+no-op context manager, profiled() returns the function unchanged and
+timed_lock() returns the lock itself, so the instrumented code runs as before.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+ENABLED = os.environ.get('PIPELINE_PROFILE', '').lower() not in ('', '0', 'false', 'no')
+OUTPUT_DIR = os.environ.get('PIPELINE_PROFILE_DIR', 'profile')
+SAMPLE_INTERVAL = float(os.environ.get('PIPELINE_PROFILE_INTERVAL', '0.005'))
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ('table', 'name', 'start')
+
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stats = self.table.get(self.name)
+        if stats is None:
+            stats = self.table[self.name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        return False
+
+
+class Profiler:
+    def __init__(self, output_dir: str = OUTPUT_DIR, sample_interval: float = SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.stage = os.path.splitext(os.path.basename(getattr(sys.modules.get('__main__'), '__file__', '') or 'interactive'))[0]
+        self._local = threading.local()
+        # thread name -> {span: [count, total, max]}; each table is only written by its thread
+        self._tables: Dict[str, Dict[str, List[float]]] = {}
+        self._samples: Dict[str, int] = defaultdict(int)
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._start = time.perf_counter()
+
+    def table(self) -> Dict[str, List[float]]:
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            thread = threading.current_thread()
+            table = self._local.table = {}
+            self._tables[f'{thread.name}-{thread.ident}'] = table
+        return table
+
+    def span(self, name: str) -> _Span:
+        return _Span(self.table(), name)
+
+    def start_sampler(self):
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.sample_interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[';'.join(reversed(stack))] += 1
+
+    def summary(self) -> Dict[str, Dict[str, List[float]]]:
+        """span -> thread -> [count, total, max] (plus an 'all' row per span)"""
+        merged: Dict[str, Dict[str, List[float]]] = defaultdict(dict)
+        for thread, table in list(self._tables.items()):
+            for name, (count, total, peak) in list(table.items()):
+                merged[name][thread] = [count, total, peak]
+                row = merged[name].setdefault('all', [0, 0.0, 0.0])
+                row[0] += count
+                row[1] += total
+                row[2] = max(row[2], peak)
+        return merged
+
+    def report(self):
+        wall = time.perf_counter() - self._start
+        merged = self.summary()
+        print(f"⏱️ profile [{self.stage}] wall {wall:.1f}s")
+        print(f"  {'span':<36} {'count':>8} {'total(s)':>10} {'mean(ms)':>9} {'max(ms)':>9} {'threads':>7}")
+        for name, rows in sorted(merged.items(), key=lambda item: -item[1]['all'][1]):
+            count, total, peak = rows['all']
+            print(f"  {name:<36} {count:>8} {total:>10.2f} {1000 * total / count:>9.2f} {1000 * peak:>9.1f} {len(rows) - 1:>7}")
+
+    def save(self) -> List[str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{self.stage}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}")
+        with open(prefix + '_spans.json', 'w', encoding='utf-8') as f:
+            json.dump({'stage': self.stage, 'wall': time.perf_counter() - self._start, 'spans': self.summary()},
+                      f, ensure_ascii=False, indent=2)
+        paths = [prefix + '_spans.json']
+        if self._samples:
+            with open(prefix + '.folded', 'w', encoding='utf-8') as f:
+                for stack, count in sorted(self._samples.items()):
+                    f.write(f'{stack} {count}\n')
+            paths.append(prefix + '.folded')
+        return paths
+
+    def finish(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.report()
+        for path in self.save():
+            print(f"  📄 {path}")
+
+
+class _TimedLock:
+    def __init__(self, lock, name: str):
+        self._lock = lock
+        self._span = 'lock_wait:' + name
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        with _profiler.span(self._span):
+            return self._lock.acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+_profiler: Optional[Profiler] = None
+if ENABLED:
+    _profiler = Profiler()
+    if SAMPLE_INTERVAL > 0:
+        _profiler.start_sampler()
+    atexit.register(_profiler.finish)
+
+
+def span(name: str):
+    """Time a block: `with span('cache.pickle_dump'): ...`"""
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name)
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """Decorator form of span(); a no-op unless profiling is enabled"""
+    def decorator(func):
+        if _profiler is None:
+            return func
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _profiler.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_lock(lock, name: str):
+    """Wrap a lock so time spent waiting for it shows up as lock_wait:<name>"""
+    if _profiler is None:
+        return lock
+    return _TimedLock(lock, name)
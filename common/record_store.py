@@ -0,0 +1,175 @@
+"""
+Lazy access to the large {key: record} JSON files passed between stages.
+
+iter_json_object streams the top-level items of a JSON object without parsing
+the whole file, and DiskStore keeps records in a SQLite file so a driver can
+hold only keys in memory and load each task's inputs when the task runs.
+DiskStore values are compressed JSON (common.compression).
+"""
+
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from common.compression import ValueCodec
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',}]'
+
+
+def iter_json_object(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, Any]]:
+    """Yield (key, value) of a top-level JSON object, holding about one value in memory"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf, pos, eof = '', 0, False
+
+        def fill(size=chunk_size):
+            nonlocal buf, pos, eof
+            chunk = f.read(size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in _WHITESPACE:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # a number cut by the chunk boundary ("12" of "123", "1.5" of "1.5e3") parses too early
+                    if eof or (end < len(buf) and (not isinstance(value, (int, float)) or buf[end] in _DELIMITERS)):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                # grow geometrically so a value much larger than chunk_size is not re-parsed per chunk
+                fill(max(chunk_size, len(buf) - pos))
+
+        def expect(char):
+            nonlocal pos
+            skip_whitespace()
+            if pos >= len(buf) or buf[pos] != char:
+                raise ValueError(f'{path}: expected {char!r} at top level')
+            pos += 1
+
+        fill()
+        expect('{')
+        skip_whitespace()
+        if pos < len(buf) and buf[pos] == '}':
+            return
+        while True:
+            skip_whitespace()
+            key = decode()
+            expect(':')
+            skip_whitespace()
+            yield key, decode()
+            skip_whitespace()
+            if pos < len(buf) and buf[pos] == ',':
+                pos += 1
+                continue
+            expect('}')
+            return
+
+
+def iter_records(path: str) -> Iterator[Tuple[str, Any]]:
+    """(key, record) pairs of a .json object file, streamed; .jsonl lines use their 'key' field"""
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record['key'], record.get('result', record)
+        return
+    yield from iter_json_object(path)
+
+
+class DiskStore:
+    def __init__(self, path: Optional[str] = None, compression: str = 'zstd'):
+        """SQLite-backed {key: JSON value}; a temporary file is used (and removed on close) when path is None"""
+        self.codec = ValueCodec(compression, level=1)
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(fd)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def put_many(self, items: Iterable[Tuple[str, Any]], batch_size: int = 1000) -> int:
+        count = 0
+        batch: List[Tuple[str, bytes]] = []
+        for key, value in items:
+            batch.append((key, self._encode(value)))
+            if len(batch) >= batch_size:
+                count += self._insert(batch)
+                batch = []
+        if batch:
+            count += self._insert(batch)
+        return count
+
+    def _insert(self, batch) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO records (key, value) VALUES (?, ?)', batch)
+        return len(batch)
+
+    def _encode(self, value: Any) -> bytes:
+        return self.codec.encode(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+    def _decode(self, data) -> Any:
+        # str: written before values were compressed
+        return json.loads(data if isinstance(data, str) else self.codec.decode(data))
+
+    def put(self, key: str, value: Any):
+        self._insert([(key, self._encode(value))])
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM records WHERE key = ?', (key,))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM records WHERE key = ?', (key,)).fetchone()
+        return self._decode(row[0]) if row else default
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM records WHERE key = ?', (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT key FROM records ORDER BY rowid')]
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self.keys():
+            yield key, self.get(key)
+
+    def close(self):
+        self._conn.close()
+        if self._temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
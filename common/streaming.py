@@ -0,0 +1,157 @@
+"""
+Streaming support for the provider helpers in gen/ and evaluation/utils.py.
+
+With streaming on, a provider reads its answer as a stream of deltas (OpenAI
+chat chunks, Gemini streamGenerateContent / Ark responses server-sent events)
+instead of waiting for the whole body. Two things come out of that:
+
+- time to first token is measured per call (metrics records get ttft), and the
+  HTTP timeout becomes an idle timeout between chunks instead of a limit on
+  the whole generation;
+- the text received so far is checkpointed every checkpoint_every characters
+  to a small SQLite store keyed by (provider, messages). When the connection
+  drops, the next attempt for the same prompt continues from the partial
+  text instead of starting over: qwen supports continuing an assistant
+  prefix natively ('prefix' mode, DashScope partial mode), other providers
+  are asked to continue after the partial answer ('instruction' mode).
+  A completed answer clears its checkpoint.
+"""
+
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from common.llm_cache import key_hash
+from common.record_store import DiskStore
+
+CONTINUE_PROMPT = ('Your previous answer was cut off. Continue exactly where it stopped, '
+                   'without repeating any of the text above and without any preamble.')
+
+
+def iter_sse(lines: Iterable[Union[bytes, str]]) -> Iterator[Dict]:
+    """JSON payloads of the 'data:' lines of a server-sent event stream (stops at [DONE])"""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        if data:
+            yield json.loads(data)
+
+
+def continuation_messages(messages: List[Dict], partial: str, mode: str) -> List[Dict]:
+    if mode == 'prefix':
+        return messages + [{'role': 'assistant', 'content': partial, 'partial': True}]
+    return messages + [{'role': 'assistant', 'content': partial}, {'role': 'user', 'content': CONTINUE_PROMPT}]
+
+
+class StreamCheckpoints:
+    def __init__(self, path: str, max_age: float = 86400):
+        """Partial generations by (provider, messages); entries older than max_age seconds are ignored"""
+        self.path = path
+        self.max_age = max_age
+        self._store: Optional[DiskStore] = None
+
+    @property
+    def store(self) -> DiskStore:
+        if self._store is None:
+            self._store = DiskStore(self.path)
+        return self._store
+
+    @staticmethod
+    def key(provider: str, messages: Any, search: bool = False) -> str:
+        return key_hash((provider, search, str(messages)))
+
+    def load(self, key: str) -> str:
+        entry = self.store.get(key)
+        if entry is None or time.time() - entry['time'] > self.max_age:
+            return ''
+        return entry['text']
+
+    def save(self, key: str, text: str):
+        self.store.put(key, {'text': text, 'time': time.time()})
+
+    def clear(self, key: str):
+        self.store.delete(key)
+
+
+class StreamCollector:
+    def __init__(self, checkpoints: Optional[StreamCheckpoints], key: str, prefix: str = '', checkpoint_every: int = 2000):
+        """Accumulates the deltas of one generation; prefix is the checkpointed text being continued"""
+        self.checkpoints = checkpoints
+        self.key = key
+        self.prefix = prefix
+        self.checkpoint_every = checkpoint_every
+        self.parts: List[str] = [prefix] if prefix else []
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.chunks = 0
+        self._unsaved = 0
+        self._saved = False
+
+    def add(self, delta: Optional[str]):
+        if not delta:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+        self.parts.append(delta)
+        self.chunks += 1
+        self._unsaved += len(delta)
+        if self.checkpoints is not None and self._unsaved >= self.checkpoint_every:
+            self.checkpoints.save(self.key, self.text)
+            self._unsaved = 0
+            self._saved = True
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+    def abort(self) -> int:
+        """Connection lost: keep what arrived for the next attempt; returns the checkpointed length"""
+        if self.checkpoints is not None and len(self.text) > len(self.prefix):
+            self.checkpoints.save(self.key, self.text)
+        return len(self.text)
+
+    def finish(self) -> str:
+        if self.checkpoints is not None and (self.prefix or self._saved):
+            self.checkpoints.clear(self.key)
+        return self.text
+
+    def stats(self) -> Dict[str, Any]:
+        return {'streamed': True, 'ttft': round(self.ttft, 4) if self.ttft is not None else None,
+                'chunks': self.chunks, 'resumed_chars': len(self.prefix)}
+
+
+class Streaming:
+    def __init__(self, enable: bool = False, providers: Optional[Dict[str, str]] = None,
+                 checkpoint_path: Optional[str] = '.stream_checkpoints.sqlite', checkpoint_every: int = 2000,
+                 max_age: float = 86400, min_partial_chars: int = 200):
+        """
+        providers: provider -> continuation mode ('prefix', 'instruction' or 'restart'); only these providers stream
+        min_partial_chars: shorter partial answers are regenerated rather than continued
+        """
+        self.enable = enable
+        self.providers = providers or {}
+        self.checkpoints = StreamCheckpoints(checkpoint_path, max_age) if checkpoint_path else None
+        self.checkpoint_every = checkpoint_every
+        self.min_partial_chars = min_partial_chars
+
+    def enabled_for(self, provider: str) -> bool:
+        return self.enable and provider in self.providers
+
+    def begin(self, provider: str, messages: List[Dict], search: bool = False) -> Tuple[List[Dict], StreamCollector]:
+        """(messages to send, collector): continues a checkpointed partial answer of the same prompt if there is one"""
+        key = StreamCheckpoints.key(provider, messages, search)
+        mode = self.providers.get(provider, 'restart')
+        partial = ''
+        if self.checkpoints is not None and mode != 'restart':
+            partial = self.checkpoints.load(key)
+            if len(partial) < self.min_partial_chars:
+                partial = ''
+        if partial:
+            messages = continuation_messages(messages, partial, mode)
+        return messages, StreamCollector(self.checkpoints, key, partial, self.checkpoint_every)
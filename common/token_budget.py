@@ -0,0 +1,186 @@
+"""
+Pre-flight token budgeting for the prompts sent through get_response.
+
+Every prompt is counted with the cached tiktoken encoder before it is sent and
+compared with the context window of its model (config 'token_budget'
+section; keys match a model name exactly or as its longest prefix) minus the
+tokens reserved for the answer. A prompt that cannot fit is refused up front
+instead of failing after the round trip and every retry.
+
+Before that point the scripts can make a prompt fit:
+
+- trim_sections (knowledge_extraction): the longest text sections of the
+  input page are cut to a common length (the shortest sections are kept
+  whole) until page and template fit;
+- split_items (completeness_evaluation): the knowledge list is judged in
+  chunks that each fit next to the profile, and the verdicts are concatenated.
+
+The counts of the run go to a per-model log2 histogram (report()). The
+tokenizer of a provider differs from cl100k_base, so `margin` keeps a
+fraction of the window in reserve.
+"""
+
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.llm_metrics import get_encoding
+
+DEFAULT_CONTEXT_WINDOWS = {'qwen': 200000, 'gpt': 128000, 'claude': 200000, 'gemini': 1000000, 'doubao': 256000}
+
+
+class TokenBudget:
+    def __init__(self, enable: bool = True, encoding_name: str = 'cl100k_base', context_windows: Optional[Dict[str, int]] = None,
+                 default_window: int = 128000, reserve_output: int = 8192, margin: float = 0.03,
+                 strategies: Optional[Dict[str, str]] = None):
+        """
+        context_windows: model name or prefix -> context length in tokens (prompt + answer)
+        strategies: script -> 'trim_sections' | 'split_items' | 'refuse'
+        """
+        self.enable = enable
+        self.encoding_name = encoding_name
+        self.context_windows = DEFAULT_CONTEXT_WINDOWS if context_windows is None else context_windows
+        self.default_window = default_window
+        self.reserve_output = reserve_output
+        self.margin = margin
+        self.strategies = strategies or {}
+        self._lock = threading.Lock()
+        self._hist: Dict[str, Dict[int, int]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def strategy(self, script: str) -> str:
+        return self.strategies.get(script, 'refuse') if self.enable else 'refuse'
+
+    def window(self, model: str) -> int:
+        if model in self.context_windows:
+            return self.context_windows[model]
+        prefixes = [prefix for prefix in self.context_windows if model.startswith(prefix)]
+        return self.context_windows[max(prefixes, key=len)] if prefixes else self.default_window
+
+    def limit(self, model: str) -> int:
+        """Prompt tokens model can take"""
+        return int(self.window(model) * (1 - self.margin)) - self.reserve_output
+
+    def count(self, text: Any) -> int:
+        """Tokens of a string or message list"""
+        if isinstance(text, list):
+            text = '\n'.join(str(m.get('content', '')) if isinstance(m, dict) else str(m) for m in text)
+        elif not isinstance(text, str):
+            text = json.dumps(text, ensure_ascii=False)
+        return len(get_encoding(self.encoding_name).encode(text, disallowed_special=()))
+
+    def _note(self, model: str, event: str, tokens: Optional[int] = None):
+        with self._lock:
+            counts = self._counts.setdefault(model, {})
+            counts[event] = counts.get(event, 0) + 1
+            if tokens is not None:
+                hist = self._hist.setdefault(model, {})
+                # bucket b counts prompts of [2^(b-1), 2^b) tokens; bucket 10 is < 1k
+                bucket = max(10, tokens.bit_length())
+                hist[bucket] = hist.get(bucket, 0) + 1
+
+    def admit(self, model: str, messages: Any) -> Tuple[bool, Optional[int]]:
+        """(whether the prompt fits the model's window, its tokens - None when disabled); counted in the run histogram"""
+        if not self.enable:
+            return True, None
+        tokens = self.count(messages)
+        fits = tokens <= self.limit(model)
+        self._note(model, 'prompts' if fits else 'refused', tokens)
+        return fits, tokens
+
+    def trim_sections(self, model: str, template: str, data: Any) -> Tuple[Any, int]:
+        """
+        data (a JSON page or a string) with its longest string sections cut so that template + data fit;
+        template is the prompt without data (its placeholder removed); returns (data, number of sections cut)
+        """
+        available = self.limit(model) - self.count(template)
+        encoding = get_encoding(self.encoding_name)
+        leaves: List[Tuple[List, List[int]]] = []
+
+        def collect(value, path):
+            if isinstance(value, str):
+                leaves.append((path, encoding.encode(value, disallowed_special=())))
+            elif isinstance(value, dict):
+                for key, item in value.items():
+                    collect(item, path + [key])
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    collect(item, path + [i])
+
+        collect(data, [])
+        total = self.count(data)
+        if total <= available or not leaves:
+            return data, 0
+        # keys, brackets and quoting stay; only section text is shortened
+        # (plus up to 2 tokens per cut section for the ' ...' marker)
+        overhead = total - sum(len(tokens) for _, tokens in leaves) + 2 * len(leaves)
+        cap = _water_level([len(tokens) for _, tokens in leaves], available - overhead)
+        if cap is None:
+            return data, 0
+
+        trimmed = 0
+        data = json.loads(json.dumps(data, ensure_ascii=False)) if not isinstance(data, str) else data
+        for path, tokens in leaves:
+            if len(tokens) <= cap:
+                continue
+            text = encoding.decode(tokens[:cap]) + ' ...'
+            trimmed += 1
+            if not path:
+                data = text
+                continue
+            parent = data
+            for key in path[:-1]:
+                parent = parent[key]
+            parent[path[-1]] = text
+        self._note(model, 'trimmed')
+        return data, trimmed
+
+    def split_items(self, model: str, template: str, items: List, render: Callable[[List], str]) -> List[List]:
+        """
+        items in consecutive chunks whose render(chunk) fits next to template (the prompt with the items'
+        placeholder removed); a single chunk when everything fits or when even one item does not (admit() then refuses it)
+        """
+        available = self.limit(model) - self.count(template)
+        if not items or self.count(render(items)) <= available:
+            return [items]
+        sizes = [self.count(render([item])) for item in items]
+        # per-item render overhead (brackets, indentation) counted once per chunk
+        overhead = self.count(render([]))
+        chunks, chunk, used = [], [], overhead
+        for item, size in zip(items, sizes):
+            if size > available:
+                return [items]
+            if chunk and used + size - overhead > available:
+                chunks.append(chunk)
+                chunk, used = [], overhead
+            chunk.append(item)
+            used += size - overhead
+        chunks.append(chunk)
+        self._note(model, 'split')
+        return chunks
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {model: dict(self._counts.get(model, {}), hist=dict(sorted(self._hist.get(model, {}).items())))
+                    for model in sorted(set(self._counts) | set(self._hist))}
+
+    def report(self):
+        for model, s in self.stats().items():
+            print(f"  📏 {model}: {s.get('prompts', 0)} 个prompt, 拒绝 {s.get('refused', 0)}, 截断 {s.get('trimmed', 0)}, "
+                  f"拆分 {s.get('split', 0)} (上限 {self.limit(model)} tokens)")
+            if s['hist']:
+                print('     ' + ' '.join(f"<{2 ** b // 1000}k:{n}" for b, n in s['hist'].items()))
+
+
+def _water_level(lengths: List[int], budget: int) -> Optional[int]:
+    """Largest cap with sum(min(length, cap)) <= budget, None if even cap 0 does not fit"""
+    if budget < 0:
+        return None
+    lengths = sorted(lengths)
+    remaining, count = budget, len(lengths)
+    for i, length in enumerate(lengths):
+        # the i shortest sections are kept whole, the rest share what is left
+        if length * (count - i) > remaining:
+            return remaining // (count - i)
+        remaining -= length
+    return lengths[-1]
@@ -0,0 +1,195 @@
+"""
+Per-entity token counts of the pipeline's datasets, batched and cached.
+
+TokenCounter.count_many() looks every text up by content hash in a small
+SQLite cache and encodes only the misses, in batches with tiktoken's
+multithreaded encode_ordinary_batch (the encoder releases the GIL). Density
+analyses over thousands of profiles therefore pay for tokenization once per
+distinct text, not once per notebook cell or run.
+
+entity_token_counts() extracts the text of one kind from a {key: record}
+file (streamed with iter_records):
+
+- search:    the gen search answer   (field, default 'search_response')
+- profile:   the generated profile   (field, default 'english_profile')
+- fandom:    the whole fandom page, as the extraction prompt embeds it
+- knowledge: the knowledge items of a knowledge_extraction result
+
+`python -m common.token_stats <file> --kind profile [--field chinese_profile]`
+prints the distribution and can write {entity: tokens} as JSON.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.llm_metrics import get_encoding
+from common.record_store import iter_records
+
+DEFAULT_COUNTS_PATH = '.token_counts.sqlite'
+KINDS = ('search', 'profile', 'fandom', 'knowledge')
+DEFAULT_FIELDS = {'search': 'search_response', 'profile': 'english_profile'}
+
+
+class TokenCounter:
+    def __init__(self, encoding_name: str = 'cl100k_base', path: Optional[str] = DEFAULT_COUNTS_PATH, threads: int = 8,
+                 batch_size: int = 1000):
+        """Token counts cached by (encoding, text) hash in the SQLite file at path; path None keeps no cache"""
+        self.encoding_name = encoding_name
+        self.path = path
+        self.threads = threads
+        self.batch_size = batch_size
+        self.hits = 0
+        self.encoded = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS token_counts (hash TEXT PRIMARY KEY, tokens INTEGER NOT NULL)')
+
+    def _hash(self, text: str) -> str:
+        return hashlib.blake2b(f'{self.encoding_name}\0{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _lookup(self, digests: List[str]) -> Dict[str, int]:
+        if self._conn is None:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite's default limit on bound parameters is 999
+            for i in range(0, len(digests), 900):
+                part = digests[i:i + 900]
+                query = f"SELECT hash, tokens FROM token_counts WHERE hash IN ({','.join('?' * len(part))})"
+                found.update(self._conn.execute(query, part))
+        return found
+
+    def _store(self, counts: Dict[str, int]):
+        if self._conn is None or not counts:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO token_counts (hash, tokens) VALUES (?, ?)', counts.items())
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Token count of every text (special tokens counted as plain text)"""
+        digests = [self._hash(text) for text in texts]
+        known = self._lookup(list(set(digests)))
+        missing: Dict[str, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in known:
+                missing.setdefault(digest, text)
+        self.hits += len(texts) - len(missing)
+
+        encoding = get_encoding(self.encoding_name)
+        pending = list(missing.items())
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            encoded = encoding.encode_ordinary_batch([text for _, text in batch], num_threads=self.threads)
+            counts = {digest: len(tokens) for (digest, _), tokens in zip(batch, encoded)}
+            self._store(counts)
+            known.update(counts)
+            self.encoded += len(batch)
+        return [known[digest] for digest in digests]
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def entity_text(record: Any, kind: str, field: Optional[str] = None) -> Optional[str]:
+    """The text of one kind in a record, None when the record has none"""
+    if kind == 'fandom':
+        return json.dumps(record, ensure_ascii=False) if record else None
+    if kind == 'knowledge':
+        response = record.get('response') if isinstance(record, dict) else None
+        if not isinstance(response, dict) or not response.get('knowledge_points'):
+            return None
+        return '\n'.join(str(k.get('knowledge', '')) for k in response['knowledge_points'] if isinstance(k, dict))
+    field = field or DEFAULT_FIELDS[kind]
+    text = record.get(field) if isinstance(record, dict) else None
+    if text is None or text == '':
+        return None
+    return text if isinstance(text, str) else json.dumps(text, ensure_ascii=False)
+
+
+def iter_entity_texts(path: str, kind: str, field: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+    for key, record in iter_records(path):
+        text = entity_text(record, kind, field)
+        if text is not None:
+            yield key, text
+
+
+def entity_token_counts(path: str, kind: str, field: Optional[str] = None, counter: Optional[TokenCounter] = None,
+                        chunk: int = 5000) -> Dict[str, int]:
+    """{entity key: tokens} of one kind of text in a {key: record} file"""
+    own = counter is None
+    counter = counter or TokenCounter()
+    counts: Dict[str, int] = {}
+    try:
+        batch: List[Tuple[str, str]] = []
+        for item in iter_entity_texts(path, kind, field):
+            batch.append(item)
+            if len(batch) >= chunk:
+                counts.update(zip([k for k, _ in batch], counter.count_many([t for _, t in batch])))
+                batch = []
+        if batch:
+            counts.update(zip([k for k, _ in batch], counter.count_many([t for _, t in batch])))
+    finally:
+        if own:
+            counter.close()
+    return counts
+
+
+def summarize(values: Iterable[int]) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {'entities': 0}
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'entities': len(values), 'total': sum(values), 'mean': sum(values) / len(values),
+            'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-entity token counts of pipeline data files")
+    parser.add_argument("paths", type=str, nargs='+', help="{key: record} 的 .json / .jsonl 文件")
+    parser.add_argument("--kind", type=str, choices=KINDS, required=True)
+    parser.add_argument("--field", type=str, default=None, help="search/profile 记录中的文本字段")
+    parser.add_argument("--encoding", type=str, default='cl100k_base')
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--cache", type=str, default=DEFAULT_COUNTS_PATH, help="按内容哈希缓存的token数(空字符串则不缓存)")
+    parser.add_argument("--output", type=str, default=None, help="把 {entity: tokens} 写入JSON")
+    args = parser.parse_args()
+
+    with TokenCounter(args.encoding, args.cache or None, threads=args.threads) as counter:
+        for path in args.paths:
+            start = time.perf_counter()
+            counts = entity_token_counts(path, args.kind, args.field, counter)
+            elapsed = time.perf_counter() - start
+            s = summarize(counts.values())
+            print(f"📏 {path} ({args.kind}): {s['entities']} 个实体, {elapsed:.2f}s")
+            if s['entities']:
+                print(f"  total {s['total']}  mean {s['mean']:.0f}  p50 {s['p50']}  p90 {s['p90']}  p99 {s['p99']}  max {s['max']}")
+            if args.output:
+                output = args.output if len(args.paths) == 1 else f"{os.path.splitext(args.output)[0]}.{os.path.basename(path)}"
+                with open(output, 'w', encoding='utf-8') as f:
+                    json.dump(counts, f, ensure_ascii=False, indent=2)
+        print(f"  编码 {counter.encoded} 条, 缓存命中 {counter.hits} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Per-knowledge-item verdict cache for the completeness judge.
+
+The LLM response cache is keyed by the whole COMPARE_PROMPT, so adding or
+rewording one knowledge item of an entity invalidates the verdicts of all its
+other items. VerdictStore keeps one verdict (evaluation and evidence) per
+(knowledge text hash, profile text hash, judge) in a SQLite file (WAL, so
+parallel evaluation runs can share it). completeness_evaluation sends only
+the items without a stored verdict and merges the answers back in id order.
+
+The judge string names the model and the prompt version, so a changed
+COMPARE_PROMPT does not reuse old verdicts.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class VerdictStore:
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    knowledge_hash TEXT NOT NULL,
+                    profile_hash TEXT NOT NULL,
+                    judge TEXT NOT NULL,
+                    verdict TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (judge, profile_hash, knowledge_hash)
+                ) WITHOUT ROWID
+            ''')
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, judge: str, profile_hash: str, knowledges: List[str]) -> Dict[str, Dict]:
+        """{knowledge text: stored verdict} for the items judged before against this profile by this judge"""
+        hashes = {text_hash(knowledge): knowledge for knowledge in knowledges}
+        found: Dict[str, Dict] = {}
+        digests = list(hashes)
+        with self._lock:
+            # SQLite's default limit on bound parameters is 999
+            for i in range(0, len(digests), 900):
+                part = digests[i:i + 900]
+                rows = self._conn.execute(
+                    f"SELECT knowledge_hash, verdict FROM verdicts WHERE judge = ? AND profile_hash = ? "
+                    f"AND knowledge_hash IN ({','.join('?' * len(part))})", [judge, profile_hash] + part)
+                for digest, verdict in rows:
+                    found[hashes[digest]] = json.loads(verdict)
+            self.hits += sum(knowledge in found for knowledge in knowledges)
+            self.misses += sum(knowledge not in found for knowledge in knowledges)
+        return found
+
+    def put_many(self, judge: str, profile_hash: str, verdicts: Iterable[Tuple[str, Dict]]) -> int:
+        """Store (knowledge text, verdict) pairs"""
+        now = time.time()
+        rows = [(text_hash(knowledge), profile_hash, judge, json.dumps(verdict, ensure_ascii=False), now)
+                for knowledge, verdict in verdicts]
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO verdicts (knowledge_hash, profile_hash, judge, verdict, created_at) '
+                                   'VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'verdicts': len(self), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,167 @@
+"""
+Cache Compression Benchmark - disk and memory cost of the response cache per codec
+Reads every value of an LLM response cache (the legacy .pkl, or its .sqlite) and, for
+raw / zlib / zstd / zstd+trained dictionary, reports stored bytes of the cache values
+(pickles, as SqliteCache stores them) and of the same values as DiskStore JSON records,
+the SQLite file size after loading them, encode throughput and hit-path decode latency.
+Memory: peak Python heap of loading the legacy pickle (what cached() held before the
+SQLite store) against reading every value back from the compressed store.
+Without a cache file, --synthetic N generates mock LLM responses instead.
+Run from evaluation/: python benchmark_cache_compression.py --cache .cache-acg.pkl
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.compression import ValueCodec, available_codecs, train_dictionary
+from common.llm_cache import SqliteCache, cache_path_for
+from common.mock_llm_server import MockLLM
+
+
+def load_values(cache_path, synthetic, seed=0):
+	"""[(key, value)] of the cache, or of synthetic mock responses"""
+	if synthetic:
+		mock, rng = MockLLM(response_chars=30000, knowledge_points=40, seed=seed), random.Random(seed)
+		items = []
+		for i in range(synthetic):
+			prompt = '**knowledge items**' if i % 2 else 'write a profile'
+			content, _ = mock.answer(prompt, random.Random(rng.random()))
+			items.append((('_get_response', str(i)), content))
+		return items
+	if cache_path.endswith('.pkl'):
+		with open(cache_path, 'rb') as f:
+			return [(key, value) for key, value in pickle.load(f).items() if value is not None]
+	store = SqliteCache(cache_path)
+	items = [(digest, store._loads(data)) for digest, data in store._conn().execute('SELECT key_hash, value FROM responses')]
+	store.close()
+	return items
+
+
+def measure_codec(name, codec, items, work_dir, level):
+	pickles = [pickle.dumps(value, -1) for _, value in items]
+	records = [json.dumps(value, ensure_ascii=False).encode('utf-8') for _, value in items]
+
+	start = time.perf_counter()
+	encoded = [codec.encode(data) for data in pickles]
+	encode_time = time.perf_counter() - start
+	json_bytes = sum(len(codec.encode(data)) for data in records)
+
+	latencies = []
+	for data in encoded:
+		start = time.perf_counter()
+		pickle.loads(codec.decode(data))
+		latencies.append(time.perf_counter() - start)
+	latencies.sort()
+
+	path = os.path.join(work_dir, f'{name}.sqlite')
+	store = SqliteCache(path, compression=codec.codec, compression_level=level)
+	if codec.dict_id is not None:
+		store.use_dictionary(codec.dictionaries[codec.dict_id])
+	store.put_many(items, func='_get_response')
+	store.vacuum()
+	store.close()
+	return {
+		'codec': name, 'values': len(items),
+		'value_bytes': sum(len(d) for d in pickles), 'stored_bytes': sum(len(d) for d in encoded),
+		'json_bytes': sum(len(d) for d in records), 'json_stored_bytes': json_bytes,
+		'sqlite_bytes': os.path.getsize(path),
+		'encode_mb_s': sum(len(d) for d in pickles) / (1 << 20) / encode_time if encode_time else 0.0,
+		'decode_p50_us': 1e6 * latencies[len(latencies) // 2], 'decode_p99_us': 1e6 * latencies[int(len(latencies) * 0.99)],
+	}
+
+
+def memory_cost(cache_path, sqlite_path):
+	"""(peak MB loading the legacy pickle, peak MB reading every value from the SQLite store)"""
+	legacy = None
+	if cache_path and cache_path.endswith('.pkl') and os.path.exists(cache_path):
+		tracemalloc.start()
+		with open(cache_path, 'rb') as f:
+			data = pickle.load(f)
+		legacy = tracemalloc.get_traced_memory()[1] / (1 << 20)
+		tracemalloc.stop()
+		del data
+
+	store = SqliteCache(sqlite_path)
+	tracemalloc.start()
+	for _, data in store._conn().execute('SELECT key_hash, value FROM responses'):
+		store._loads(data)
+	streamed = tracemalloc.get_traced_memory()[1] / (1 << 20)
+	tracemalloc.stop()
+	store.close()
+	return legacy, streamed
+
+
+def print_report(results, legacy_mb, streamed_mb):
+	mb = 1 << 20
+	print(f"📊 {results[0]['values']} 条缓存值")
+	print(f"  {'codec':<10} {'values(MB)':>10} {'stored(MB)':>10} {'ratio':>6} {'json(MB)':>9} {'json ratio':>10} "
+		f"{'sqlite(MB)':>10} {'enc MB/s':>9} {'dec p50(us)':>11} {'dec p99(us)':>11}")
+	for r in results:
+		print(f"  {r['codec']:<10} {r['value_bytes'] / mb:>10.1f} {r['stored_bytes'] / mb:>10.1f} "
+			f"{r['value_bytes'] / max(1, r['stored_bytes']):>6.2f} {r['json_stored_bytes'] / mb:>9.1f} "
+			f"{r['json_bytes'] / max(1, r['json_stored_bytes']):>10.2f} {r['sqlite_bytes'] / mb:>10.1f} "
+			f"{r['encode_mb_s']:>9.0f} {r['decode_p50_us']:>11.1f} {r['decode_p99_us']:>11.1f}")
+	if legacy_mb is not None:
+		print(f"  内存: 加载旧pickle缓存峰值 {legacy_mb:.1f}MB, 逐条读取压缩SQLite缓存峰值 {streamed_mb:.1f}MB")
+	else:
+		print(f"  内存: 逐条读取压缩SQLite缓存峰值 {streamed_mb:.1f}MB")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="disk/memory savings of compressed LLM cache values")
+	parser.add_argument("--cache", type=str, default='.cache-acg.pkl', help="旧pickle缓存或SQLite缓存")
+	parser.add_argument("--synthetic", type=int, default=0, help="缓存文件不存在时生成N条模拟响应")
+	parser.add_argument("--level", type=int, default=3, help="zstd压缩级别")
+	parser.add_argument("--dict_samples", type=int, default=2000)
+	parser.add_argument("--report", type=str, default=None, help="把结果另存为JSON")
+	args = parser.parse_args()
+
+	cache_path = args.cache
+	if not args.synthetic and not os.path.exists(cache_path):
+		if os.path.exists(cache_path_for(cache_path)):
+			cache_path = cache_path_for(cache_path)
+		else:
+			sys.exit(f'no cache at {args.cache}; use --synthetic N for generated responses')
+	items = load_values(cache_path, args.synthetic)
+	if not items:
+		sys.exit('cache is empty')
+
+	codecs = [('raw', ValueCodec('raw')), ('zlib', ValueCodec('zlib'))]
+	if 'zstd' in available_codecs():
+		codecs.append(('zstd', ValueCodec('zstd', args.level)))
+		dict_codec = ValueCodec('zstd', args.level)
+		samples = [pickle.dumps(value, -1) for _, value in random.Random(0).sample(items, min(args.dict_samples, len(items)))]
+		try:
+			dict_codec.add_dictionary(train_dictionary(samples))
+			codecs.append(('zstd+dict', dict_codec))
+		except Exception as e:
+			print(f"⚠️ 字典训练失败(样本太少?): {e}")
+	else:
+		print("⚠️ 未安装zstandard，只比较raw/zlib")
+
+	work_dir = tempfile.mkdtemp(prefix='cache-compression-')
+	try:
+		results = [measure_codec(name, codec, items, work_dir, args.level) for name, codec in codecs]
+		best = min(results, key=lambda r: r['sqlite_bytes'])
+		legacy_mb, streamed_mb = memory_cost(None if args.synthetic else cache_path, os.path.join(work_dir, f"{best['codec']}.sqlite"))
+	finally:
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	print_report(results, legacy_mb, streamed_mb)
+	if args.report:
+		with open(args.report, 'w', encoding='utf-8') as f:
+			json.dump({'cache': cache_path, 'codecs': results, 'legacy_load_mb': legacy_mb, 'streamed_read_mb': streamed_mb},
+				f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+	main()
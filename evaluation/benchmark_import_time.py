@@ -0,0 +1,105 @@
+"""
+Import Time Benchmark - startup cost of each pipeline entry point
+Runs every entry point in fresh interpreters (utils of gen/ and evaluation/, and --help of
+the stage scripts, which imports everything a real run imports before doing any work) and
+reports min / median wall time over --repeat runs, plus the slowest imports of one run from
+`python -X importtime` (the entry's own and those of utils). With --eager the same runs are repeated with EAGER_IMPORTS=1
+(openai / requests / pandas imported and config, logger and singletons built up front) for comparison;
+an entry point whose heavy dependency is not installed is reported as failed in that mode.
+Run from evaluation/: python benchmark_import_time.py --repeat 10 --eager
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# (name, stage directory, arguments after the interpreter)
+ENTRY_POINTS = [
+	('gen/utils', 'gen', ['-c', 'import utils']),
+	('evaluation/utils', 'evaluation', ['-c', 'import utils']),
+	('gen_wiki --help', 'gen', ['gen_wiki.py', '--help']),
+	('knowledge_extraction --help', 'evaluation', ['knowledge_extraction.py', '--help']),
+	('completeness_evaluation --help', 'evaluation', ['completeness_evaluation.py', '--help']),
+	('check_json --help', 'evaluation', ['check_json.py', '--help']),
+	('metric --help', 'evaluation', ['metric.py', '--help']),
+]
+
+
+def run_once(stage, argv, eager, importtime=False):
+	"""(seconds, completed process) of one fresh interpreter"""
+	env = dict(os.environ, EAGER_IMPORTS='1' if eager else '0')
+	cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + argv
+	start = time.perf_counter()
+	proc = subprocess.run(cmd, cwd=os.path.join(ROOT, stage), env=env, capture_output=True, text=True)
+	return time.perf_counter() - start, proc
+
+
+def top_imports(stderr, top):
+	"""[(module, cumulative ms)] of the slowest imports in -X importtime output, down to what utils imports"""
+	entries = []
+	for line in stderr.splitlines():
+		if not line.startswith('import time:'):
+			continue
+		_, cumulative, name = line[len('import time:'):].split('|')
+		# nested imports are indented two spaces per level under their importer
+		depth = (len(name) - len(name.lstrip()) - 1) // 2
+		if cumulative.strip().isdigit() and depth <= 1:
+			entries.append((name.strip(), int(cumulative) / 1000))
+	return sorted(entries, key=lambda e: -e[1])[:top]
+
+
+def measure(name, stage, argv, eager, repeat, top):
+	times, proc = [], None
+	for _ in range(repeat):
+		elapsed, proc = run_once(stage, argv, eager)
+		if proc.returncode != 0:
+			error = (proc.stderr.strip().splitlines() or ['?'])[-1]
+			return {'entry': name, 'eager': eager, 'failed': error}
+		times.append(elapsed)
+	_, proc = run_once(stage, argv, eager, importtime=True)
+	return {'entry': name, 'eager': eager, 'min_ms': 1000 * min(times), 'median_ms': 1000 * statistics.median(times),
+		'top_imports': top_imports(proc.stderr, top)}
+
+
+def print_report(results, baseline_ms):
+	print(f"📊 入口启动时间 (空解释器 python -c pass: {baseline_ms:.0f}ms)")
+	print(f"  {'entry':<32} {'mode':<6} {'min(ms)':>8} {'median(ms)':>10}  slowest imports")
+	for r in results:
+		mode = 'eager' if r['eager'] else 'lazy'
+		if 'failed' in r:
+			print(f"  {r['entry']:<32} {mode:<6} {'failed':>8} {'':>10}  {r['failed'][:80]}")
+			continue
+		slowest = ', '.join(f"{module} {ms:.0f}ms" for module, ms in r['top_imports'])
+		print(f"  {r['entry']:<32} {mode:<6} {r['min_ms']:>8.0f} {r['median_ms']:>10.0f}  {slowest}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="import-time cost of each pipeline entry point")
+	parser.add_argument("--repeat", type=int, default=5, help="每个入口运行次数")
+	parser.add_argument("--top", type=int, default=5, help="列出最慢的N个import(入口及utils直接导入的模块)")
+	parser.add_argument("--eager", action='store_true', help="同时测量EAGER_IMPORTS=1(全部提前导入)作对比")
+	parser.add_argument("--entry", type=str, nargs='+', default=None, help="只测量这些入口(名称前缀)")
+	parser.add_argument("--report", type=str, default=None, help="把结果另存为JSON")
+	args = parser.parse_args()
+
+	entries = [e for e in ENTRY_POINTS if args.entry is None or any(e[0].startswith(p) for p in args.entry)]
+	baseline_ms = 1000 * min(run_once('evaluation', ['-c', 'pass'], False)[0] for _ in range(args.repeat))
+	results = []
+	for name, stage, argv in entries:
+		for eager in ([False, True] if args.eager else [False]):
+			results.append(measure(name, stage, argv, eager, args.repeat, args.top))
+
+	print_report(results, baseline_ms)
+	if args.report:
+		with open(args.report, 'w', encoding='utf-8') as f:
+			json.dump({'python_ms': baseline_ms, 'entries': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,199 @@
+"""
+Pipeline Benchmark - gen_wiki → knowledge_extraction → completeness_evaluation end to end, offline
+Every stage runs unmodified as a subprocess against common.mock_llm_server, with a generated
+config.json per stage pointing all providers at the mock. Reports per stage: entities/sec,
+p50/p99 LLM call latency (from the llm_metrics file), cache-write cost (cache.put
+profiling span) and peak RSS (wait4 rusage of the stage process).
+Note: the provider helpers sleep 5-30s after a failed request, so --error_rate > 0 mostly
+measures that backoff.
+Run from evaluation/: python benchmark_pipeline.py --entities 200 --latency lognormal:0.5,0.6
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.normalize import make_entity_key
+from common.record_store import iter_json_object
+from common.mock_llm_server import MockLLM, MockLLMServer
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+PROVIDERS = ('gemini_search', 'gemini', 'doubao', 'qwen', 'gpt', 'claude')
+
+
+def generate_inputs(work_dir, n_entities, content_chars=3000):
+	"""Entity list for gen_wiki and fandom-style pages for knowledge_extraction, sharing keys"""
+	entities, pages = [], {}
+	for i in range(n_entities):
+		label, franchise = f'Character {i}', f'Franchise {i % 97}'
+		entities.append({'label': label, 'franchise': franchise})
+		pages[make_entity_key(label, franchise)] = {
+			'title': label,
+			'infobox': {'Name': label, 'Series': franchise, 'Age': str(10 + i % 40)},
+			'content': (f'{label} is a character from {franchise}. ' * (content_chars // 40 + 1))[:content_chars],
+		}
+	entity_path = os.path.join(work_dir, 'entities.json')
+	fandom_path = os.path.join(work_dir, 'fandom.json')
+	with open(entity_path, 'w', encoding='utf-8') as f:
+		json.dump(entities, f, ensure_ascii=False)
+	with open(fandom_path, 'w', encoding='utf-8') as f:
+		json.dump(pages, f, ensure_ascii=False, indent=2)
+	return entity_path, fandom_path
+
+
+def write_config(stage, stage_dir, server_url, stream=False):
+	"""The stage's config.json with every provider pointed at the mock server"""
+	with open(os.path.join(REPO, stage, 'config.json'), 'r', encoding='utf-8') as f:
+		config = json.load(f)
+	for provider in PROVIDERS:
+		config[provider] = {'url': f'{server_url}/v1', 'ak': 'mock', 'model': f'mock-{provider}', 'timeout': 300}
+	config['gemini_search']['url'] = f'{server_url}/v1beta/models/mock-gemini:generateContent'
+	config['gemini']['url'] = config['gemini_search']['url']
+	config['doubao']['url'] = f'{server_url}/api/v3/responses'
+	config['cache']['default_path'] = '.cache.pkl'
+	config['metrics'] = {'path': os.path.join(stage_dir, 'llm_metrics.jsonl'), 'flush_every': 50}
+	if stream:
+		config['streaming'] = dict(config.get('streaming', {}), enable=True,
+			checkpoint_path=os.path.join(stage_dir, '.stream_checkpoints.sqlite'))
+	os.makedirs(stage_dir, exist_ok=True)
+	with open(os.path.join(stage_dir, 'config.json'), 'w', encoding='utf-8') as f:
+		json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def run_stage(name, script, script_args, stage_dir, work_dir):
+	env = dict(os.environ,
+		PIPELINE_PROFILE='1', PIPELINE_PROFILE_INTERVAL='0', PIPELINE_PROFILE_DIR=os.path.join(stage_dir, 'profile'),
+		ENTITY_INDEX_PATH=os.path.join(work_dir, 'entity_keys.sqlite'))
+	log_path = os.path.join(work_dir, f'{name}.log')
+	start = time.perf_counter()
+	with open(log_path, 'w', encoding='utf-8') as log:
+		proc = subprocess.Popen([sys.executable, script] + script_args, cwd=stage_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+		# wait4 gives this child's own rusage (RUSAGE_CHILDREN would be the max over all stages)
+		_, status, rusage = os.wait4(proc.pid, 0)
+		proc.returncode = os.waitstatus_to_exitcode(status)
+	wall = time.perf_counter() - start
+	if proc.returncode != 0:
+		raise RuntimeError(f'{name} exited with {proc.returncode}, see {log_path}')
+	peak_rss_mb = rusage.ru_maxrss / (1 << 20) if sys.platform == 'darwin' else rusage.ru_maxrss / 1024
+	return wall, peak_rss_mb
+
+
+def _percentile(sorted_values, q):
+	if not sorted_values:
+		return 0.0
+	return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def stage_stats(name, stage_dir, output_path, wall, peak_rss_mb):
+	records = []
+	metrics_path = os.path.join(stage_dir, 'llm_metrics.jsonl')
+	if os.path.exists(metrics_path):
+		with open(metrics_path, 'r', encoding='utf-8') as f:
+			records = [json.loads(line) for line in f if line.strip()]
+	latencies = sorted(r['latency'] for r in records if not r['cache_hit'])
+
+	cache_write, cache_writes = 0.0, 0
+	profile_dir = os.path.join(stage_dir, 'profile')
+	for file in os.listdir(profile_dir) if os.path.isdir(profile_dir) else []:
+		if file.endswith('_spans.json'):
+			with open(os.path.join(profile_dir, file), 'r', encoding='utf-8') as f:
+				spans = json.load(f)['spans']
+			if 'cache.put' in spans:
+				cache_write += spans['cache.put']['all'][1]
+				cache_writes += spans['cache.put']['all'][0]
+
+	entities, null_outputs = 0, 0
+	for _, value in iter_json_object(output_path):
+		entities += 1
+		null_outputs += value is None
+	return {
+		'stage': name, 'entities': entities, 'null_outputs': null_outputs, 'wall': wall, 'entities_per_sec': entities / wall if wall else 0.0,
+		'llm_calls': len(records), 'failed_calls': sum(not r['ok'] for r in records),
+		'prompt_tokens': sum(r['prompt_tokens'] for r in records),
+		'completion_tokens': sum(r['completion_tokens'] for r in records),
+		'latency_p50': _percentile(latencies, 0.5), 'latency_p99': _percentile(latencies, 0.99),
+		'cache_write_total': cache_write, 'cache_write_mean_ms': 1000 * cache_write / cache_writes if cache_writes else 0.0,
+		'peak_rss_mb': peak_rss_mb,
+	}
+
+
+def print_report(results, mock):
+	print(f"📊 mock server: {mock.requests} 次请求, {mock.errors} 次注入错误, {mock.dropped} 次流式中断")
+	print(f"  {'stage':<26} {'entities':>8} {'wall(s)':>8} {'ent/s':>7} {'calls':>6} {'fail':>5} {'null':>5} "
+		f"{'p50(s)':>7} {'p99(s)':>7} {'cache(s)':>9} {'cache/ms':>9} {'RSS(MB)':>8}")
+	for r in results:
+		print(f"  {r['stage']:<26} {r['entities']:>8} {r['wall']:>8.1f} {r['entities_per_sec']:>7.2f} {r['llm_calls']:>6} "
+			f"{r['failed_calls']:>5} {r['null_outputs']:>5} {r['latency_p50']:>7.2f} {r['latency_p99']:>7.2f} {r['cache_write_total']:>9.2f} "
+			f"{r['cache_write_mean_ms']:>9.2f} {r['peak_rss_mb']:>8.1f}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="offline end-to-end pipeline benchmark against a mock LLM server")
+	parser.add_argument("--entities", type=int, default=200)
+	parser.add_argument("--latency", type=str, default='lognormal:0.2,0.5', help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | exp:MEAN")
+	parser.add_argument("--error_rate", type=float, default=0.0)
+	parser.add_argument("--stream", action='store_true', help="provider使用流式输出")
+	parser.add_argument("--drop_rate", type=float, default=0.0, help="流式响应中途断开的比例(配合--stream)")
+	parser.add_argument("--response_chars", type=int, default=2000)
+	parser.add_argument("--knowledge_points", type=int, default=15)
+	parser.add_argument("--gen_workers", type=int, default=3)
+	parser.add_argument("--model", type=str, default='gpt-4o-mini', help="knowledge_extraction / completeness_evaluation 使用的模型")
+	parser.add_argument("--work_dir", type=str, default=None, help="默认使用临时目录，结束后删除")
+	parser.add_argument("--report", type=str, default=None, help="把结果另存为JSON")
+	args = parser.parse_args()
+
+	work_dir = args.work_dir or tempfile.mkdtemp(prefix='pipeline-bench-')
+	os.makedirs(work_dir, exist_ok=True)
+	entity_path, fandom_path = generate_inputs(work_dir, args.entities)
+	knowledge_path = os.path.join(work_dir, 'knowledge.json')
+	completeness_path = os.path.join(work_dir, 'completeness.json')
+	profile_path = os.path.join(work_dir, 'gen', 'results', 'bench_profiles.json')
+
+	stages = [
+		('gen_wiki', 'gen', os.path.join(REPO, 'gen', 'gen_wiki.py'),
+			['--entity_files', entity_path, '--output_file', 'bench_profiles.json', '--max_workers', str(args.gen_workers)],
+			profile_path),
+		('knowledge_extraction', 'evaluation', os.path.join(REPO, 'evaluation', 'knowledge_extraction.py'),
+			['--model', args.model, '--entity_path', fandom_path, '--source', 'fandom', '--output_path', knowledge_path],
+			knowledge_path),
+		('completeness_evaluation', 'evaluation', os.path.join(REPO, 'evaluation', 'completeness_evaluation.py'),
+			['--model', args.model, '--knowledge_path', knowledge_path, '--text_path', profile_path,
+			 '--entity_key', 'english_profile', '--output_path', completeness_path],
+			completeness_path),
+	]
+
+	mock = MockLLM(args.latency, args.error_rate, args.response_chars, args.knowledge_points, drop_rate=args.drop_rate)
+	results, failed_stage = [], None
+	try:
+		with MockLLMServer(mock) as server:
+			print(f"mock LLM server: {server.url}, 数据目录: {work_dir}")
+			for name, stage, script, script_args, output_path in stages:
+				stage_dir = os.path.join(work_dir, name if stage == 'evaluation' else stage)
+				write_config(stage, stage_dir, server.url, args.stream)
+				print(f"▶ {name} ...")
+				wall, peak_rss_mb = run_stage(name, script, script_args, stage_dir, work_dir)
+				results.append(stage_stats(name, stage_dir, output_path, wall, peak_rss_mb))
+				# 子进程对失败任务也会正常退出并写出null，全部为null时后续阶段的输入已无意义
+				if results[-1]['null_outputs'] == results[-1]['entities']:
+					failed_stage = name
+					print(f"❌ {name} 没有产生任何有效输出，跳过后续阶段")
+					break
+		print_report(results, mock)
+		if args.report:
+			with open(args.report, 'w', encoding='utf-8') as f:
+				json.dump({'args': vars(args), 'stages': results}, f, ensure_ascii=False, indent=2)
+		if failed_stage:
+			raise RuntimeError(f'{failed_stage} produced no usable output')
+	finally:
+		if args.work_dir is None:
+			shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	main()
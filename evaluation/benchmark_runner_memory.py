@@ -0,0 +1,151 @@
+"""
+Runner Memory Benchmark - peak RSS of completeness_evaluation style runs
+eager: load both files, build every (entity, knowledge_list, text) task and submit all futures up front
+lazy:  stream inputs into disk stores, LLMRunner with a bounded window, SpooledJsonSink output
+The LLM call is replaced by a fake that only builds the prompt, so no API access is needed.
+Run from evaluation/: python benchmark_runner_memory.py --entities 50000
+"""
+
+import os
+import sys
+import json
+import random
+import resource
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entity_index import EntityIndex
+from common.llm_runner import LLMRunner, SpooledJsonSink
+from common.record_store import DiskStore, iter_records
+
+MAX_WORKERS = 10
+
+
+def generate(data_dir, n_entities, knowledge_points, profile_chars, seed=0):
+	"""Synthetic knowledge / profile files shaped like the real stage outputs"""
+	rng = random.Random(seed)
+	words = ['sword', 'academy', 'captain', 'village', 'rival', 'festival', 'magic', 'ocean', 'signal', 'promise']
+
+	def text(n):
+		return ' '.join(rng.choice(words) for _ in range(n // 7))
+
+	knowledge_path = os.path.join(data_dir, 'knowledge.json')
+	profile_path = os.path.join(data_dir, 'profile.json')
+	with open(knowledge_path, 'w', encoding='utf-8') as fk, open(profile_path, 'w', encoding='utf-8') as fp:
+		fk.write('{')
+		fp.write('{')
+		for i in range(n_entities):
+			key = json.dumps(f'Character {i} (Franchise {i % 997})', ensure_ascii=False)
+			knowledge = {'entity': key, 'response': {'knowledge_points': [{'knowledge': text(120)} for _ in range(knowledge_points)]}}
+			profile = {'profile': text(profile_chars)}
+			sep = ',\n' if i else '\n'
+			fk.write(f'{sep}{key}: {json.dumps(knowledge, ensure_ascii=False)}')
+			fp.write(f'{sep}{key}: {json.dumps(profile, ensure_ascii=False)}')
+		fk.write('\n}')
+		fp.write('\n}')
+	return knowledge_path, profile_path
+
+
+def fake_compare(entity_name, knowledge_list, character_text):
+	prompt = json.dumps(knowledge_list, ensure_ascii=False, indent=2) + character_text
+	return {'entity': entity_name, 'response': [{'id': k['id'], 'label': len(prompt) % 3} for k in knowledge_list]}
+
+
+def run_eager(knowledge_path, profile_path, output_path, index_path):
+	with open(knowledge_path, 'r', encoding='utf-8') as f:
+		gt = json.load(f)
+	with open(profile_path, 'r', encoding='utf-8') as f:
+		profile_full = json.load(f)
+	with EntityIndex(index_path) as key_index:
+		matched, _, _ = key_index.join(gt.keys(), profile_full.keys())
+
+	entities_data = []
+	for _, entity_name, profile_key in matched:
+		knowledges = gt[entity_name]['response']['knowledge_points']
+		knowledge_list = [{'id': i, 'knowledge': knowledge['knowledge']} for i, knowledge in enumerate(knowledges, start=1)]
+		entities_data.append((entity_name, knowledge_list, json.dumps(profile_full[profile_key], ensure_ascii=False)))
+
+	results = {}
+	with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+		future_to_entity = {executor.submit(fake_compare, *entity_info): entity_info[0] for entity_info in entities_data}
+		for future in as_completed(future_to_entity):
+			results[future_to_entity[future]] = future.result()
+	with open(output_path, 'w', encoding='utf-8') as f:
+		json.dump(results, f, ensure_ascii=False, indent=2)
+	return len(results)
+
+
+def run_lazy(knowledge_path, profile_path, output_path, index_path):
+	with DiskStore() as knowledge_store, DiskStore() as profile_store:
+		knowledge_store.put_many(
+			(name, [{'id': i, 'knowledge': k['knowledge']} for i, k in enumerate(record['response']['knowledge_points'], start=1)])
+			for name, record in iter_records(knowledge_path))
+		profile_store.put_many((key, json.dumps(profile, ensure_ascii=False)) for key, profile in iter_records(profile_path))
+		with EntityIndex(index_path) as key_index:
+			matched, _, _ = key_index.join(knowledge_store.keys(), profile_store.keys())
+
+		def process(task):
+			entity_name, profile_key = task
+			return fake_compare(entity_name, knowledge_store.get(entity_name), profile_store.get(profile_key))
+
+		runner = LLMRunner(process, key=lambda task: task[0], sinks=[SpooledJsonSink(output_path)],
+			max_workers=MAX_WORKERS, resume=False)
+		runner.run(((name, key) for _, name, key in matched), total=len(matched))
+		return runner.processed
+
+
+def peak_rss_mb():
+	# ru_maxrss is KiB on Linux, bytes on macOS
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+	parser = argparse.ArgumentParser(description="peak RSS of eager vs lazy LLM runs")
+	parser.add_argument("--entities", type=int, default=50000)
+	parser.add_argument("--knowledge_points", type=int, default=15)
+	parser.add_argument("--profile_chars", type=int, default=3000)
+	parser.add_argument("--data_dir", type=str, default=None, help="复用已生成的数据目录")
+	parser.add_argument("--mode", type=str, default=None, help="eager | lazy (内部使用，单独进程中运行)")
+	args = parser.parse_args()
+
+	if args.mode:
+		run = run_eager if args.mode == 'eager' else run_lazy
+		data_dir = args.data_dir
+		# progress lines of the runner would dominate the wall time
+		with open(os.devnull, 'w') as devnull:
+			stdout, sys.stdout = sys.stdout, devnull
+			try:
+				n = run(os.path.join(data_dir, 'knowledge.json'), os.path.join(data_dir, 'profile.json'),
+					os.path.join(data_dir, f'{args.mode}_output.json'), os.path.join(data_dir, f'{args.mode}_keys.sqlite'))
+			finally:
+				sys.stdout = stdout
+		print(json.dumps({'mode': args.mode, 'entities': n, 'peak_rss_mb': round(peak_rss_mb(), 1)}))
+		return
+
+	data_dir = args.data_dir or tempfile.mkdtemp(prefix='runner-bench-')
+	os.makedirs(data_dir, exist_ok=True)
+	if not os.path.exists(os.path.join(data_dir, 'knowledge.json')):
+		generate(data_dir, args.entities, args.knowledge_points, args.profile_chars)
+	sizes = {name: os.path.getsize(os.path.join(data_dir, name)) / (1 << 20) for name in ('knowledge.json', 'profile.json')}
+	print(f"数据目录: {data_dir} (knowledge {sizes['knowledge.json']:.0f}MB, profile {sizes['profile.json']:.0f}MB)")
+
+	# ru_maxrss survives fork/exec, so both runs start before this process loads anything large
+	for mode in ('eager', 'lazy'):
+		proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode, '--data_dir', data_dir],
+			capture_output=True, text=True, check=True)
+		stats = json.loads(proc.stdout.strip().splitlines()[-1])
+		print(f"{mode:>5}: {stats['entities']} 个实体, 峰值RSS {stats['peak_rss_mb']:.1f}MB")
+
+	outputs = {}
+	for mode in ('eager', 'lazy'):
+		with open(os.path.join(data_dir, f'{mode}_output.json'), 'r', encoding='utf-8') as f:
+			outputs[mode] = json.load(f)
+	print(f"输出一致: {outputs['eager'] == outputs['lazy']}")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,17 +1,20 @@
 import json
-import requests
 import time
 from datetime import datetime
 import os
-import pandas as pd
-import pdb
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 from utils import get_response, save_result, save_result_txt, extract_json, ensure_question_format
 import random 
-from utils import load_file, set_cache_path, init_writer, close_writer
+from utils import load_file, set_cache_path, init_writer, close_writer, report_metrics, token_budget
 import argparse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entity_index import EntityIndex, DEFAULT_INDEX_PATH
+from common.llm_runner import LLMRunner, SpooledJsonSink
+from common.record_store import DiskStore, iter_records
+from common.llm_cache import key_hash
+from common.verdict_store import VerdictStore, text_hash
+
 def parse_args():
 	# 创建解析器
 	parser = argparse.ArgumentParser(description="evaluate completeness of profile")
@@ -25,88 +28,167 @@ def parse_args():
 	parser.add_argument("--entity_key", type=str, default=None, help="输入对比的字段")
 	parser.add_argument("--output_path", type=str, required=True, help="输出文件路径")
 	parser.add_argument("--pre_result", type=str, default=None, help="已有results路径")
+	parser.add_argument("--key_index", type=str, default=DEFAULT_INDEX_PATH, help="跨阶段实体key索引(SQLite)路径")
+	parser.add_argument("--verdict_cache", type=str, default='.verdict_cache.sqlite', help="逐知识点的判定缓存(SQLite)，空字符串则不使用")
 
 	# 解析参数
 	args = parser.parse_args()
 	return args
 
-args = parse_args()
-print(args)
+# 由 setup() 根据命令行参数设置，导入本模块时不解析argv、不创建存储
+args = None
+compare_model = profile_file = gt_konwledge_file = pre_results_file = output_file = None
+pre_results = dict()
+# 知识点与profile按key存在磁盘上，任务执行时再读取
+knowledge_store = profile_store = None
+# 逐知识点缓存判定结果：知识点增删改时只评估变化的知识点
+verdict_store = None
 
-# 配置方法选择
-compare_model = args.model
-# language = 'zh'  # 选择 'zh' 或 'en'
-# profile_method = 'doubao_search'
+parallel = True
+max_workers = 10
 
-# profile_file = "D:/复旦大学/研究生/RPLA/DRCharater-main/gen/results/gemini_search/gemini_acg_characters_old.json"
-profile_file = args.text_path
-gt_konwledge_file = args.knowledge_path
+def setup():
+	global args, compare_model, profile_file, gt_konwledge_file, pre_results_file, output_file, pre_results
+	global knowledge_store, profile_store, verdict_store
+	args = parse_args()
+	print(args)
 
-pre_results_file = args.pre_result
+	# 配置方法选择
+	compare_model = args.model
+	# language = 'zh'  # 选择 'zh' 或 'en'
+	# profile_method = 'doubao_search'
 
-# timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-output_file = args.output_path
+	# profile_file = "D:/复旦大学/研究生/RPLA/DRCharater-main/gen/results/gemini_search/gemini_acg_characters_old.json"
+	profile_file = args.text_path
+	gt_konwledge_file = args.knowledge_path
+	pre_results_file = args.pre_result
+	# timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+	output_file = args.output_path
 
-parallel = True
-max_workers = 10
+	set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
+
+	knowledge_store = DiskStore()
+	profile_store = DiskStore()
+	verdict_store = VerdictStore(args.verdict_cache) if args.verdict_cache else None
 
-set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
+	try: 
+		with open(pre_results_file, 'r', encoding='utf-8') as f:
+			pre_results = json.load(f)
+			print(pre_results_file)
+	except:
+		pre_results = dict()
+		print('no previous results or fail to parse')
 
-progress_count = 0
-progress_lock = threading.Lock()
-total_entities = 0
-save_interval = 10  # 每100个实体保存一次
+# entity_name -> 输入对的内容哈希，main() 中在运行前计算
+fingerprints = {}
 
 def to_my_entity_key(entity_info):
 	return entity_info[0]
 
-def save_progress(results, filename=None):
-	"""统一的保存进度函数"""
-	if filename is None:
-		filename = output_file
-	
-	os.makedirs(os.path.dirname(filename), exist_ok=True)
-	with open(filename, 'w', encoding='utf-8') as f:
-		json.dump(results, f, ensure_ascii=False, indent=2)
+def pair_fingerprint(knowledge_list, character_text):
+	"""Content hash of one judged (knowledge list, profile) pair; the judge model and prompt are part of it"""
+	from prompt import COMPARE_PROMPT
+	return key_hash((compare_model, COMPARE_PROMPT, json.dumps(knowledge_list, ensure_ascii=False, sort_keys=True), character_text))
+
+def is_up_to_date(result):
+	"""A complete result whose inputs have not changed since it was judged"""
+	return isinstance(result, dict) and isinstance(result.get('response'), list) \
+		and result.get('fingerprint') is not None and result.get('fingerprint') == fingerprints.get(result.get('entity'))
+
+def merge_verdicts(knowledge_list, cached, judged):
+	"""Verdicts in the id order of knowledge_list: stored ones for cached items, the judge's answers for the rest"""
+	by_id = {}
+	for verdict in judged:
+		try:
+			by_id[int(verdict['id'])] = verdict
+		except (TypeError, ValueError, KeyError):
+			continue
+	merged = []
+	for item in knowledge_list:
+		if item['knowledge'] in cached:
+			merged.append({'id': item['id'], 'knowledge': item['knowledge'], **cached[item['knowledge']]})
+		elif item['id'] in by_id:
+			merged.append(by_id[item['id']])
+	return merged
+
+def store_verdicts(judge, profile_hash, chunk, response):
+	items = {item['id']: item['knowledge'] for item in chunk}
+	verdicts = []
+	for verdict in response:
+		try:
+			knowledge = items[int(verdict['id'])]
+		except (TypeError, ValueError, KeyError):
+			continue
+		if isinstance(verdict.get('evaluation'), str):
+			verdicts.append((knowledge, {'evaluation': verdict['evaluation'], 'evidence': verdict.get('evidence', '')}))
+	verdict_store.put_many(judge, profile_hash, verdicts)
 
 def process_entity(entity_info):
 	"""处理单个实体的函数，用于并发执行"""
-	global progress_count, total_entities, invalid_cnt
-
-	entity_name, knowledge_list, character_text = entity_info
+	global invalid_cnt
 
-	with progress_lock:
-		progress_count += 1
-		current = progress_count
+	entity_name, profile_key = entity_info
+	knowledge_list = knowledge_store.get(entity_name)
+	character_text = profile_store.get(profile_key)
 
-	print(f"[{current}/{total_entities}] 开始比较实体: {entity_name}")
+	print(f"开始比较实体: {entity_name}")
 
 	pre_result = pre_results.get(entity_name, None)
 	# 保存完整的实体信息
 	result = {
 		'entity': entity_name,
+		'fingerprint': fingerprints.get(entity_name) or pair_fingerprint(knowledge_list, character_text),
 	} 
 
-	## has been evaluated
-	if pre_result and isinstance(pre_result.get('response', None), list):
+	## has been evaluated on the same knowledge list and profile
+	if is_up_to_date(pre_result):
 		result['response'] = pre_result['response']
 		return result
 
 	from prompt import COMPARE_PROMPT
 
-	messages = []
-
-	prompt = COMPARE_PROMPT.replace('{knowledge_list}', json.dumps(knowledge_list, ensure_ascii=False, indent=2)).replace('{character_text}', character_text)
-	messages.append({'role': 'user', 'content': prompt})
-
-	response = get_response(model=compare_model, messages=messages)
-	
-	try:
-		response = response.strip('```').strip('json')
-		response = json.loads(response)
-	except:
-		invalid_cnt += 1
-		print('cannot parse to json format')
+	# 已有判定的知识点(同一profile、同一评估模型与prompt)不再发送，只评估其余知识点
+	cached, pending = {}, knowledge_list
+	if verdict_store is not None:
+		judge = f'{compare_model}@{key_hash(COMPARE_PROMPT)[:12]}'
+		profile_hash = text_hash(character_text)
+		cached = verdict_store.get_many(judge, profile_hash, [item['knowledge'] for item in knowledge_list])
+		pending = [item for item in knowledge_list if item['knowledge'] not in cached]
+		if cached:
+			print(f"♻️ {entity_name}: {len(cached)}/{len(knowledge_list)} 个知识点已有判定")
+
+	render = lambda items: json.dumps(items, ensure_ascii=False, indent=2)
+	# 知识点列表与profile超出上下文窗口时，分批评估知识点后按顺序拼接结果
+	chunks = [pending] if pending else []
+	if pending and token_budget.strategy('completeness_evaluation') == 'split_items':
+		template = COMPARE_PROMPT.replace('{knowledge_list}', '').replace('{character_text}', character_text)
+		chunks = token_budget.split_items(compare_model, template, pending, render)
+		if len(chunks) > 1:
+			print(f"✂️ {entity_name}: {len(pending)} 个知识点分 {len(chunks)} 批评估")
+
+	verdicts = []
+	for chunk in chunks:
+		messages = []
+		prompt = COMPARE_PROMPT.replace('{knowledge_list}', render(chunk)).replace('{character_text}', character_text)
+		messages.append({'role': 'user', 'content': prompt})
+
+		response = get_response(model=compare_model, messages=messages)
+		
+		try:
+			response = response.strip('```').strip('json')
+			response = json.loads(response)
+		except:
+			invalid_cnt += 1
+			print('cannot parse to json format')
+
+		if not isinstance(response, list):
+			break
+		response = [verdict for verdict in response if isinstance(verdict, dict)]
+		if verdict_store is not None:
+			store_verdicts(judge, profile_hash, chunk, response)
+		verdicts.extend(response)
+	else:
+		response = merge_verdicts(knowledge_list, cached, verdicts) if cached else verdicts
 
 	result['response'] = response
 
@@ -116,109 +198,83 @@ def process_entity(entity_info):
 	# 	# 离线判定答案唯一性 TODO
 	return result
 
+def knowledge_records(path):
+	for entity_name, record in iter_records(path):
+		# 抽取失败的任务在输出中为null
+		if not isinstance(record, dict) or not isinstance(record.get('response'), dict) or not record['response'].get('knowledge_points', None): continue
+		knowledges = record['response']['knowledge_points']
+		yield entity_name, [{'id': i, 'knowledge': knowledge['knowledge']} for i, knowledge in enumerate(knowledges, start=1)]
+
+def profile_records(path, entity_key):
+	for profile_key, profile in iter_records(path):
+		if entity_key is None and profile:
+			yield profile_key, json.dumps(profile, ensure_ascii=False)
+		elif entity_key is not None and isinstance(profile, dict) and profile.get(entity_key, None):
+			yield profile_key, profile[entity_key]
+
 def get_input_data():
-	gt = load_file(gt_konwledge_file)
-	print(f"成功读取 {gt_konwledge_file}，共 {len(gt)} 条记录")
-	profile_full = load_file(profile_file)
-	print(f"成功读取 {profile_file}，共 {len(profile_full)} 条记录")
-	
+	"""
+	Stream knowledge and profile files into disk stores and return lightweight
+	(entity_name, profile_key) tasks; process_entity loads its inputs per task
+	"""
 	entity_key = args.entity_key
 	# if language == 'en':  entity_key = 'english_profile'
 	# elif language == 'zh': entity_key = 'chinese_profile'
 
-	entities_data = []
-	for entity_name in gt.keys():
-		if not isinstance(gt[entity_name]['response'], dict) or not gt[entity_name]['response'].get('knowledge_points', None): continue
-		if entity_name in profile_full:
-			knowledges = gt[entity_name]['response']['knowledge_points']
-			knowledge_list = [{'id': i, 'knowledge': knowledge['knowledge']} for i, knowledge in enumerate(knowledges, start=1)]
-			if entity_key is None and profile_full[entity_name]:
-				character_text = json.dumps(profile_full[entity_name], ensure_ascii=False)
-				entities_data.append((entity_name, knowledge_list, character_text))
-			elif profile_full[entity_name].get(entity_key, None):
-				character_text = profile_full[entity_name][entity_key]
-				entities_data.append((entity_name, knowledge_list, character_text))
+	knowledge_store.put_many(knowledge_records(gt_konwledge_file))
+	print(f"成功读取 {gt_konwledge_file}，共 {len(knowledge_store)} 条有效记录")
+	profile_store.put_many(profile_records(profile_file, entity_key))
+	print(f"成功读取 {profile_file}，共 {len(profile_store)} 条有效记录")
 
-	return entities_data
+	# 通过规范化实体ID关联knowledge与profile的key，避免key格式不一致导致实体被静默丢弃
+	knowledge_keys, profile_keys = knowledge_store.keys(), profile_store.keys()
+	with EntityIndex(args.key_index) as key_index:
+		key_index.register_many(knowledge_keys, 'knowledge')
+		key_index.register_many(profile_keys, args.text_type)
+		matched, unmatched, ambiguous = key_index.join(knowledge_keys, profile_keys, 'knowledge', args.text_type)
+	if unmatched:
+		print(f"⚠️ {len(unmatched)} 个实体在 {profile_file} 中找不到对应: {unmatched[:10]}")
+	if ambiguous:
+		print(f"⚠️ {len(ambiguous)} 个实体在 {profile_file} 中对应多个key，使用第一个: {list(ambiguous.values())[:10]}")
+
+	return [(entity_name, profile_key) for _, entity_name, profile_key in matched]
 
 
 def main():
-	global total_entities
-	
-	# 展示popularity分布
+	setup()
 	entities_data = get_input_data()
 	print(f"总共读取了 {len(entities_data)} 个实体")
-	
-	total_entities = len(entities_data)
+
+	# 已有结果只在知识点列表与profile都未变化时复用，输入变化的实体重新评估
+	for entity_name, profile_key in entities_data:
+		fingerprints[entity_name] = pair_fingerprint(knowledge_store.get(entity_name), profile_store.get(profile_key))
+	if pre_results:
+		reusable = sum(is_up_to_date(pre_results.get(entity_name)) for entity_name, _ in entities_data)
+		print(f"{pre_results_file}: {reusable} 个实体的输入未变化，可复用结果")
 
 	# init_writer(f"{search_model}_response.jsonl")
-	# 根据方法调整并发数
-	
-	# 初始化结果字典，包含已有结果和新实体
-	results = {}
-
-	if parallel:
-		completed_count = 0
-		with ThreadPoolExecutor(max_workers=max_workers) as executor:
-			# 提交所有任务
-			future_to_entity = {executor.submit(process_entity, entity_info): to_my_entity_key(entity_info) for entity_info in entities_data}
-			
-			# 处理完成的任务
-			for future in as_completed(future_to_entity):
-				entity_key = future_to_entity[future]
-				result = future.result()
-				results[entity_key] = result
-				completed_count += 1
-				
-				# 每100个实体保存一次
-				if completed_count % save_interval == 0:
-					print(f"💾 已完成 {completed_count} 个实体，保存中间结果...")
-					save_progress(results)
-					print(f"💾 中间结果已保存: results/{output_file}")
 
-	else:
-		for i, entity_info in enumerate(entities_data, 1):
-			result = process_entity(entity_info)
-			results[to_my_entity_key(entity_info)] = result
-			
-			# 每100个实体保存一次
-			if i % save_interval == 0:
-				print(f"💾 已完成 {i} 个实体，保存中间结果...")
-				save_progress(results)
-				print(f"💾 中间结果已保存: results/{output_file}")
-
-	# 统计结果：已有数据 + 新完成的数据
-	total_completed = len([result for result in results.values() if result is not None])
-	new_completed = len([result for entity_info in entities_data for result in [results[to_my_entity_key(entity_info)]] if result is not None])
-	new_failed = len(entities_data) - new_completed
-	
-	print(f"📊 统计结果:")
-	# print(f"  已有实体: {len(existing_entitiy_keys)}")
-	print(f"  新处理实体: {len(entities_data)}")
-	print(f"  新成功: {new_completed}, 新失败: {new_failed}")
-	print(f"  总计成功: {total_completed}, 总计实体: {len(results)}")
-
-	# 保存汇总结果
-	save_progress(results, output_file)
-
-	# 保存TXT格式的简化结果
-	# save_result_txt(f'results/{output_file}_simple.txt', results)
-
-	# print(f"📁 结果保存在 results/ 目录下（使用{profiling_model}方法）")
-	print(f"📄 JSON格式: results/{output_file}.json")
-	# print(f"📄 TXT格式: results/{output_file}_simple.txt")
+	runner = LLMRunner(process_entity, key=to_my_entity_key, sinks=[SpooledJsonSink(output_file)],
+		max_workers=max_workers, parallel=parallel,
+		is_complete=is_up_to_date,
+		is_success=lambda result: isinstance(result, dict) and isinstance(result.get('response'), list))
+	runner.run(entities_data, total=len(entities_data))
+	report_metrics()
+
+	print(f"📄 JSON格式: {output_file}")
+
+	if verdict_store is not None:
+		stats = verdict_store.stats()
+		print(f"♻️ 逐知识点判定缓存: 命中 {stats['hits']}, 未命中 {stats['misses']}, 共 {stats['verdicts']} 条")
 
 	# close_writer()
+	knowledge_store.close()
+	profile_store.close()
+	if verdict_store is not None:
+		verdict_store.close()
 
 invalid_cnt = 0
 
 if __name__ == "__main__":
-	try: 
-		with open(pre_results_file, 'r', encoding='utf-8') as f:
-			pre_results: dict = json.load(f)
-			print(pre_results_file)
-	except:
-		pre_results = dict()
-		print('no previous results or fail to parse')
 	main()
 	print('invalid: ', invalid_cnt)
\ No newline at end of file
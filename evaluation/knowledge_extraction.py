@@ -1,17 +1,17 @@
 import json
-import requests
 import time
 from datetime import datetime
 import os
-import pandas as pd
-import pdb
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
 from utils import get_response, save_result, save_result_txt, extract_json, ensure_question_format
 import random 
-from utils import set_cache_path, init_writer, close_writer, load_file
+from utils import set_cache_path, init_writer, close_writer, load_file, report_metrics, token_budget
 import argparse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.llm_runner import LLMRunner, SpooledJsonSink
+from common.record_store import iter_json_object
+
 def parse_args():
 	parser = argparse.ArgumentParser(description="evaluate completeness of profile")
 
@@ -25,54 +25,45 @@ def parse_args():
 	args = parser.parse_args()
 	return args
 
-args = parse_args()
-print(args)
-# exit()
+# 由 setup() 根据命令行参数设置，导入本模块时不解析argv
+args = None
+extract_model = entity_file = pre_results_file = output_file = None
+pre_results = dict()
 
-# 配置方法选择
-extract_model = args.model
-# language = 'en'  # 选择 'zh' 或 'en'
-entity_file = args.entity_path
+parallel = True
+max_workers = 5
 
-pre_results_file = args.pre_result
+def setup():
+    global args, extract_model, entity_file, pre_results_file, output_file, pre_results
+    args = parse_args()
+    print(args)
 
-# timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-output_file = args.output_path
+    # 配置方法选择
+    extract_model = args.model
+    # language = 'en'  # 选择 'zh' 或 'en'
+    entity_file = args.entity_path
+    pre_results_file = args.pre_result
+    # timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_file = args.output_path
 
-parallel = True
-max_workers = 5
+    set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
 
-set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
+    try:
+        pre_results = load_file(pre_results_file)
+        print(pre_results_file, 'OK')
+    except:
+        pre_results = dict()
+        print('cannot open pre_results_file')
 
-progress_count = 0
-progress_lock = threading.Lock()
-total_entities = 0
-save_interval = 10  # 每100个实体保存一次
 
 def to_my_entity_key(entity_info):
 	return entity_info[0]
 
-def save_progress(results, filename=None):
-	"""统一的保存进度函数"""
-	if filename is None:
-		filename = output_file
-	
-	os.makedirs(os.path.dirname(filename), exist_ok=True)
-	with open(filename, 'w', encoding='utf-8') as f:
-		json.dump(results, f, ensure_ascii=False, indent=2)
-
-
 def process_entity(entity_info):
     """处理单个实体的函数，用于并发执行"""
-    global progress_count, total_entities
-
     entity_name, entity_info = entity_info
 
-    with progress_lock:
-        progress_count += 1
-        current = progress_count
-
-    print(f"[{current}/{total_entities}] 开始处理实体: {entity_name}")
+    print(f"开始处理实体: {entity_name}")
 
     # 保存完整的实体信息
     result = {
@@ -83,11 +74,19 @@ def process_entity(entity_info):
     messages = []
 
     if args.source == 'fandom':
-        prompt = EXTRACTION_PROMPT['fandom'].replace('{input_text}', json.dumps(entity_info, ensure_ascii=False))
+        input_data = entity_info
     elif args.source == 'DRinfo':
-        prompt = EXTRACTION_PROMPT['DRinfo'].replace('{input_text}', entity_info[args.entity_key])
+        input_data = entity_info[args.entity_key]
     else:
         raise NotImplementedError('unknown source')
+
+    # 页面超出模型上下文窗口时，把最长的段落截断到同一长度
+    if token_budget.strategy('knowledge_extraction') == 'trim_sections':
+        input_data, trimmed = token_budget.trim_sections(extract_model, EXTRACTION_PROMPT[args.source].replace('{input_text}', ''), input_data)
+        if trimmed:
+            print(f"✂️ {entity_name}: 截断了 {trimmed} 个过长段落")
+    input_text = json.dumps(input_data, ensure_ascii=False) if args.source == 'fandom' else input_data
+    prompt = EXTRACTION_PROMPT[args.source].replace('{input_text}', input_text)
     
     if pre_results.get(entity_name, None):
         if pre_results[entity_name].get('response', None):
@@ -109,84 +108,19 @@ def process_entity(entity_info):
     # 	# 离线判定答案唯一性 TODO
     return result
 
-try:
-    pre_results:dict = load_file(pre_results_file)
-    print(pre_results_file, 'OK')
-except:
-    pre_results = dict()
-    print('cannot open pre_results_file')
-
 def main():
-    global total_entities
-
-    # 读取多个实体文件
-    entities_data = []
-    # 按优先级顺序读取各个文件
-    with open(entity_file, 'r', encoding='utf-8') as f:
-        df = json.load(f)
-    print(f"成功读取 {entity_file}，共 {len(df)} 条记录")
-		
-    # 读取实体信息，添加到列表中，排除已有实体
-    entities_data = list(df.items())
-
-    # 展示popularity分布
-    print(f"总共读取了 {len(entities_data)} 个实体")
-
-    total_entities = len(entities_data)
-
-    # 根据方法调整并发数
-    # 初始化结果字典，包含已有结果和新实体
-    results = {}
-
-    if parallel:
-        completed_count = 0
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_entity = {executor.submit(process_entity, entity_info): to_my_entity_key(entity_info) for entity_info in entities_data}
-            
-            # 处理完成的任务
-            for future in as_completed(future_to_entity):
-                entity_key = future_to_entity[future]
-                result = future.result()
-                results[entity_key] = result
-                completed_count += 1
-                
-                # 每100个实体保存一次
-                if completed_count % save_interval == 0:
-                    print(f"💾 已完成 {completed_count} 个实体，保存中间结果...")
-                    save_progress(results)
-                    print(f"💾 中间结果已保存: results/{output_file}")
+    setup()
+    # 逐条流式读取实体文件，执行中只保留在途任务的输入
+    entities_data = iter_json_object(entity_file)
+    print(f"流式读取 {entity_file}")
 
-    else:
-        for i, entity_info in enumerate(entities_data, 1):
-            result = process_entity(entity_info)
-            results[to_my_entity_key(entity_info)] = result
-            
-            # 每100个实体保存一次
-            if i % save_interval == 0:
-                print(f"💾 已完成 {i} 个实体，保存中间结果...")
-                save_progress(results)
-                print(f"💾 中间结果已保存: results/{output_file}")
-
-    # 统计结果：已有数据 + 新完成的数据
-    total_completed = len([result for result in results.values() if result is not None])
-    new_completed = len([result for entity_info in entities_data for result in [results[to_my_entity_key(entity_info)]] if result is not None])
-    new_failed = len(entities_data) - new_completed
-
-    print(f"📊 统计结果:")
-    # print(f"  已有实体: {len(existing_entitiy_keys)}")
-    print(f"  新处理实体: {len(entities_data)}")
-    print(f"  新成功: {new_completed}, 新失败: {new_failed}")
-    print(f"  总计成功: {total_completed}, 总计实体: {len(results)}")
-
-    # 保存汇总结果
-    save_progress(results, output_file)
-
-    # 保存TXT格式的简化结果
-    # save_result_txt(f'results/{output_file}_simple.txt', results)
-
-    print(f"📄 JSON格式: results/{output_file}.json")
-    # print(f"📄 TXT格式: results/{output_file}_simple.txt")
+    is_complete = lambda result: isinstance(result, dict) and isinstance(result.get('response'), dict)
+    runner = LLMRunner(process_entity, key=to_my_entity_key, sinks=[SpooledJsonSink(output_file)],
+                       max_workers=max_workers, parallel=parallel, is_complete=is_complete, is_success=is_complete)
+    runner.run(entities_data)
+    report_metrics()
+
+    print(f"📄 JSON格式: {output_file}")
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
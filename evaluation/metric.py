@@ -1,17 +1,30 @@
-import matplotlib.pyplot as plt
 from utils import load_file
+import os
+import sys
 import argparse
 from collections import defaultdict
-import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.lazy_import import lazy_module
+from common.entity_index import entity_id_from_key
+from common.token_stats import TokenCounter, entity_token_counts
+
+pd = lazy_module('pandas')
 
 label_map = {'supportive': 'supported', 'unsupported': 'contradicted', 'partial support': 'partially supported', 'relevant': 'supported'}
 
 def arg_parse():
     parser = argparse.ArgumentParser(description="这是一个示例程序")
-    parser.add_argument('--results_path', type=str, required=True, help='结果路径')
+    parser.add_argument('--results_path', type=str, default=None, help='结果路径')
     parser.add_argument('--konwledges_path', type=str, required=True, help='结果路径')
     # parser.add_argument('--age', type=int, default=18, help='年龄，默认为18')
+    parser.add_argument('--run', type=str, nargs=3, action='append', metavar=('NAME', 'RESULTS', 'PROFILES'),
+                        help='信息密度: 一次评估的名称、结果路径与被评估的profile路径，可重复')
+    parser.add_argument('--text_key', type=str, default=None, help='profile中被评估的字段，与completeness_evaluation的--entity_key一致')
+    parser.add_argument('--encoding', type=str, default='cl100k_base')
+    parser.add_argument('--density_output', type=str, default=None, help='把逐实体的密度表写入CSV')
     args = parser.parse_args()
+    if args.results_path is None and not args.run:
+        parser.error('需要 --results_path 或 --run')
     return args
 
 
@@ -67,6 +80,62 @@ def evaluate_type(knowledges, results):
 
     return pd.DataFrame(table)
 
+def verdict_frame(runs, knowledges):
+    """One row per judged knowledge item of every run: run, entity, eid, id, label, type"""
+    rows = [(run, entity_name, res.get('id'), res['evaluation'])
+            for run, results in runs.items() for entity_name, info in results.items()
+            if isinstance(info, dict) and isinstance(info.get('response'), list)
+            for res in info['response'] if isinstance(res, dict) and 'evaluation' in res]
+    frame = pd.DataFrame(rows, columns=['run', 'entity', 'id', 'label'])
+    frame['label'] = frame['label'].replace(label_map)
+    frame['id'] = pd.to_numeric(frame['id'], errors='coerce')
+    entity_ids = {entity: entity_id_from_key(entity) for entity in frame['entity'].unique()}
+    frame['eid'] = frame['entity'].map(entity_ids)
+
+    # ids follow the knowledge order, as completeness_evaluation numbers them
+    types = pd.DataFrame([(entity_name, float(i), k.get('type')) for entity_name, v in knowledges.items() if is_valid(v)
+                          for i, k in enumerate(v['response']['knowledge_points'], start=1)],
+                         columns=['entity', 'id', 'type'])
+    return frame.merge(types, on=['entity', 'id'], how='left')
+
+def token_frame(profile_paths, text_key, counter):
+    """run, eid, tokens of the profile text each run judged"""
+    kind, field = ('fandom', None) if text_key is None else ('profile', text_key)
+    frames = []
+    for run, path in profile_paths.items():
+        counts = entity_token_counts(path, kind, field, counter)
+        frames.append(pd.DataFrame({'run': run, 'eid': [entity_id_from_key(key) for key in counts], 'tokens': list(counts.values())}))
+    return pd.concat(frames, ignore_index=True).drop_duplicates(['run', 'eid'])
+
+def add_density(table):
+    table['supported_per_1k'] = 1000 * table['supported'] / table['tokens']
+    table['density'] = 1000 * (table['supported'] + 0.5 * table['partial']) / table['tokens']
+    return table
+
+def evaluate_density(verdicts, tokens):
+    """(per run, per run and type, per entity) supported knowledge per 1k profile tokens"""
+    verdicts = verdicts.assign(supported=verdicts['label'].eq('supported'),
+                               partial=verdicts['label'].eq('partially supported'),
+                               contradicted=verdicts['label'].eq('contradicted'))
+    counts = dict(knowledge=('label', 'size'), supported=('supported', 'sum'), partial=('partial', 'sum'),
+                  contradicted=('contradicted', 'sum'))
+
+    per_entity = verdicts.groupby(['run', 'entity', 'eid'], as_index=False).agg(**counts)
+    per_entity = add_density(per_entity.merge(tokens, on=['run', 'eid'], how='inner'))
+
+    per_run = per_entity.groupby('run', as_index=False).agg(
+        entities=('entity', 'size'), tokens=('tokens', 'sum'), knowledge=('knowledge', 'sum'), supported=('supported', 'sum'),
+        partial=('partial', 'sum'), contradicted=('contradicted', 'sum'),
+        entity_density_mean=('density', 'mean'), entity_density_median=('density', 'median'))
+    per_run = add_density(per_run)
+
+    # a type's share of the run's density: its supported items over all judged profile tokens of the run
+    judged = verdicts.merge(per_entity[['run', 'entity']], on=['run', 'entity'])
+    per_type = judged.groupby(['run', 'type'], as_index=False).agg(**counts)
+    per_type = add_density(per_type.merge(per_run[['run', 'tokens']], on='run'))
+    per_type['recall'] = (per_type['supported'] + 0.5 * per_type['partial']) / per_type['knowledge']
+    return per_run, per_type, per_entity
+
 def is_valid(knowledge):
     if knowledge.get('response', None):
         if isinstance(knowledge['response'], dict) and knowledge['response'].get('knowledge_points', None):
@@ -80,12 +149,26 @@ if __name__ == "__main__":
     args = arg_parse()
     knowledges_path = args.konwledges_path
     results_path = args.results_path
-    results = load_file(results_path)
     knowledges = load_file(knowledges_path)
 
-    
     print("knowledges: ", len([1 for v in knowledges.values() if is_valid(v)]))
-    print("results: ", len(results))
-    
-    print(evaluate_total(knowledges, results))
-    print(evaluate_type(knowledges, results))
+    if results_path is not None:
+        results = load_file(results_path)
+        print("results: ", len(results))
+
+        print(evaluate_total(results))
+        print(evaluate_type(knowledges, results))
+
+    if args.run:
+        # 所有run的判定结果合并为一张表，按 run / type / entity 分组计算
+        runs = {name: load_file(path) for name, path, _ in args.run}
+        with TokenCounter(args.encoding) as counter:
+            tokens = token_frame({name: profiles for name, _, profiles in args.run}, args.text_key, counter)
+        per_run, per_type, per_entity = evaluate_density(verdict_frame(runs, knowledges), tokens)
+        with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200, 'display.max_rows', 200):
+            print("📏 信息密度 (每1k profile tokens 的支持知识点):")
+            print(per_run.to_string(index=False))
+            print(per_type.sort_values(['run', 'density'], ascending=[True, False]).to_string(index=False))
+        if args.density_output:
+            per_entity.to_csv(args.density_output, index=False)
+            print(f"逐实体密度: {args.density_output}")
@@ -20,9 +20,14 @@ import urllib.parse
 from collections import OrderedDict
 from urllib.parse import quote
 import os
+import sys
 from rapidfuzz import fuzz, process
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.normalize import make_entity_key, split_entity_key
+from common.entity_index import EntityIndex
+
 
 HEADERS = {"User-Agent": "YOUR_HEADER"}
 REQUEST_TIMEOUT = 10
@@ -283,8 +288,8 @@ def parse_character_page(url):
 # ---------------------------
 def crawl_character_find_best(query: str, max_communities=6):
 
-    character_name = query.split('(')[0].strip() if '(' in query else query
-    franchise_name = query.split('(', maxsplit=1)[-1][:-1].strip() if '(' in query else query
+    character_name, franchise_name = split_entity_key(query)
+    franchise_name = franchise_name or query
     # 1) 先试全局 API
     community_domain = find_communities(franchise_name, limit=max_communities)
     
@@ -321,12 +326,14 @@ def get_character_list(path: str):
     elif path.endswith('jsonl'):
         with open(path, 'r', encoding='utf-8') as f:
             data = [json.loads(line) for line in f.readlines()]
-            return [entity['name'] + f' ({entity["franchise"]})' for entity in data]
+            return [make_entity_key(entity['name'], entity['franchise']) for entity in data]
         
 if __name__ == "__main__":
 
     character_path = "../getcharacter/acg_characters_v1.jsonl"
     character_list = get_character_list(character_path)
+    key_index = EntityIndex()
+    key_index.register_many(character_list, 'fandom')
 
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_path = f"./gt/character_{timestamp}.json"
@@ -352,4 +359,5 @@ if __name__ == "__main__":
             print(f"💾 已爬取{i+1}个角色，结果保存在{output_path}")
     
     save_json(results, output_path)
+    key_index.close()
     print(f"📄全部{len(character_list)}个角色已完成，保存最终结果在{output_path}")
@@ -1,11 +1,13 @@
-from fandom_character_info import parse_character_page, community_dict, crawl_character_find_best
-import json
 import os
+import sys
+import json
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fandom_character_info import parse_character_page, community_dict, crawl_character_find_best
+from common.normalize import split_entity_key
 
 def split_name_francise(s: str):
-    name = s.split('(')[0].strip()
-    francise = s.split('(', maxsplit=1)[-1][:-1].strip()
-    return name, francise
+    return split_entity_key(s)
 
 def save_json(data, filename="character.json"):
     with open(filename, "w", encoding="utf-8") as f:
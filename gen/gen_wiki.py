@@ -1,67 +1,52 @@
 import json
-import requests
 import time
 from datetime import datetime
 import os
-import pandas as pd
-import pdb
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+import argparse
+from functools import partial
 from utils import get_response, save_result, save_result_txt, extract_json, ensure_question_format
 import random 
-from utils import set_cache_path, init_writer, close_writer
+from utils import set_cache_path, init_writer, close_writer, report_metrics
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.normalize import make_entity_key
+from common.entity_index import EntityIndex
+from common.llm_runner import LLMRunner, SpooledJsonSink
+from common.lazy_import import lazy_module
+
+pd = lazy_module('pandas')
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="generate character profiles")
+	parser.add_argument("--entity_files", type=str, nargs='+', default=['../getcharacter/acg_characters_v1.jsonl'], help="实体文件(.jsonl/.json/.csv)，按优先级顺序读取")
+	parser.add_argument("--search_model", type=str, default='gemini_search', help="gemini_search | doubao_search")
+	parser.add_argument("--profiling_model", type=str, default='qwen')
+	parser.add_argument("--translate_model", type=str, default='qwen')
+	parser.add_argument("--language", type=str, default='en', help="zh | en")
+	parser.add_argument("--max_workers", type=int, default=3)
+	parser.add_argument("--output_file", type=str, default=None, help="results/ 下的输出文件名")
+	parser.add_argument("--pre_result", type=str, default=None, help="已有results路径，已生成的字段直接复用")
+	return parser.parse_args()
 
-# 配置方法选择
-search_model = 'gemini_search' # 'gemini_search' or 'doubao_search'
-profiling_model = 'qwen'
-language = 'en'  # choose 'zh' or 'en'
 if_translated = True
-translate_model = "qwen"
-
-# results_file = "./results/gemini_search/gemini_profile.json"
-# results_file = "./results/doubao_search_acg_characters_v1_output_20251026_141356.json"
-
-entity_files = ['../getcharacter/acg_characters_v1.jsonl']
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-output_file = f'{search_model}_acg_characters_v1_output_{timestamp}.json'
-existing_files = []
 parallel = True
-max_workers = 3
-
-set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
 
-progress_count = 0
-progress_lock = threading.Lock()
-total_entities = 0
-save_interval = 10  # 每10个实体保存一次
 
 def to_my_entity_key(entity_info):
 	if 'entity_info' in entity_info:
-		return entity_info['entity_info']['label'] + f' ({entity_info["franchise"]})'
+		return make_entity_key(entity_info['entity_info']['label'], entity_info["franchise"])
 	else:
-		return  entity_info['label'] + f' ({entity_info["franchise"]})'
+		return make_entity_key(entity_info['label'], entity_info["franchise"])
 
-def save_progress(results, filename=None):
-	"""统一的保存进度函数"""
-	if filename is None:
-		filename = output_file
-	
-	os.makedirs("results", exist_ok=True)
-	with open(f'results/{filename}', 'w', encoding='utf-8') as f:
-		json.dump(results, f, ensure_ascii=False, indent=2)
-
-def process_entity(entity_info):
+def process_entity(entity_info, args, total_results):
 	"""处理单个实体的函数，用于并发执行"""
-	global progress_count, total_entities
-
+	search_model, profiling_model, translate_model = args.search_model, args.profiling_model, args.translate_model
+	language = args.language  # choose 'zh' or 'en'
 	entity_name = entity_info['label']
 	entity_description = f'{entity_info["franchise"]}'
 	
-	with progress_lock:
-		progress_count += 1
-		current = progress_count
-	
-	print(f"[{current}/{total_entities}] 开始查询实体: {entity_name}")
+	print(f"开始查询实体: {entity_name}")
 	
 	# 保存完整的实体信息
 	result = {
@@ -179,6 +164,10 @@ def load_file(path: str):
 			entity_dict = row.to_dict()
 			data.append(entity_dict)
 
+	elif path.endswith('.jsonl'):
+		with open(path, 'r', encoding='utf-8') as f:
+			data = [json.loads(line) for line in f if line.strip()]
+
 	elif path.endswith('.json'):
 		with open(path, 'r', encoding='utf-8') as f:
 			json_data = json.load(f)
@@ -194,93 +183,59 @@ def load_file(path: str):
 	print(f"成功读取 {path}，共 {len(data)} 条记录")
 	return data
 
-try:
-	with open(results_file, 'r', encoding='utf-8') as f:
-		total_results: dict = json.load(f)
-except:
-	total_results = dict()
+def profile_fields(language):
+	"""Fields a finished entity has: the profile in the selected language, and its translation if enabled"""
+	k1, k2 = ('english_profile', 'chinese_profile') if language == 'en' else ('chinese_profile', 'english_profile')
+	return [k1, k2] if if_translated else [k1]
+
+def load_pre_results(path):
+	if not path:
+		return dict()
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			pre_results: dict = json.load(f)
+	except (OSError, json.JSONDecodeError) as e:
+		print(f"⚠️ 无法读取已有结果 {path}: {e}")
+		return dict()
+	print(f"成功读取已有结果 {path}，共 {len(pre_results)} 个实体")
+	return pre_results
 
 def main():
-	global total_entities
-	
+	args = parse_args()
+	timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+	output_file = args.output_file or f'{args.search_model}_acg_characters_v1_output_{timestamp}.json'
+	set_cache_path('.cache-acg.pkl') # '.cache-' + output_file.replace('.json', '.pkl'))
+	total_results = load_pre_results(args.pre_result)
+
 	# 读取多个实体文件
 	entities_data = []
 	n_entities = 10100
 	# 按优先级顺序读取各个文件
-	for i_f, entity_file in enumerate(entity_files):
+	for i_f, entity_file in enumerate(args.entity_files):
 		_entities_data = load_file(entity_file)
-		# df = pd.read_csv(entity_file)
-		# print(f"成功读取 {entity_file}，共 {len(df)} 条记录")
-		
-		# 读取实体信息，添加到列表中，排除已有实体
-		# _entities_data = []
-		# for _, row in df.iterrows():
-		# 	entity_dict = row.to_dict()
-		# 	_entities_data.append(entity_dict)
-		
 		entities_data.extend(_entities_data)
 
-	# 展示popularity分布
-	entities_data = entities_data
 	print(f"总共读取了 {len(entities_data)} 个实体")
-	
-	total_entities = len(entities_data)
 
-	# init_writer(f"results/{search_model}/{timestamp}_response.jsonl")
-	# 根据方法调整并发数
-	
-	# 初始化结果字典，包含已有结果和新实体
-	results = {}
-
-	if parallel:
-		completed_count = 0
-		with ThreadPoolExecutor(max_workers=max_workers) as executor:
-			# 提交所有任务
-			future_to_entity = {executor.submit(process_entity, entity_info): to_my_entity_key(entity_info) for entity_info in entities_data}
-			
-			# 处理完成的任务
-			for future in as_completed(future_to_entity):
-				entity_key = future_to_entity[future]
-				result = future.result()
-				results[entity_key] = result
-				completed_count += 1
-				
-				# 每100个实体保存一次
-				if completed_count % save_interval == 0:
-					print(f"💾 已完成 {completed_count} 个实体，保存中间结果...")
-					save_progress(results)
-					print(f"💾 中间结果已保存: results/{output_file}")
+	with EntityIndex() as key_index:
+		key_index.register_many([to_my_entity_key(entity_info) for entity_info in entities_data], 'gen')
 
-	else:
-		for i, entity_info in enumerate(entities_data, 1):
-			result = process_entity(entity_info)
-			results[to_my_entity_key(entity_info)] = result
-			
-			# 每100个实体保存一次
-			if i % save_interval == 0:
-				print(f"💾 已完成 {i} 个实体，保存中间结果...")
-				save_progress(results)
-				print(f"💾 中间结果已保存: results/{output_file}")
-
-	# 统计结果：已有数据 + 新完成的数据
-	total_completed = len([result for result in results.values() if result is not None])
-	new_completed = len([result for entity_info in entities_data for result in [results[to_my_entity_key(entity_info)]] if result is not None])
-	new_failed = len(entities_data) - new_completed
-	
-	print(f"📊 统计结果:")
-	# print(f"  已有实体: {len(existing_entitiy_keys)}")
-	print(f"  新处理实体: {len(entities_data)}")
-	print(f"  新成功: {new_completed}, 新失败: {new_failed}")
-	print(f"  总计成功: {total_completed}, 总计实体: {len(results)}")
+	# init_writer(f"results/{search_model}/{timestamp}_response.jsonl")
 
-	# 保存汇总结果
-	save_progress(results, output_file)
+	sink = SpooledJsonSink(f'results/{output_file}')
+	# 搜索或profile失败的实体也会返回dict：只有各profile字段都已生成才算完成，续跑时重新处理其余实体
+	fields = profile_fields(args.language)
+	is_complete = lambda result: isinstance(result, dict) and all(result.get(field) for field in fields)
+	runner = LLMRunner(partial(process_entity, args=args, total_results=total_results), key=to_my_entity_key, sinks=[sink],
+		max_workers=args.max_workers, parallel=parallel, is_complete=is_complete, is_success=is_complete)
+	runner.run(entities_data, total=len(entities_data))
+	report_metrics()
 
 	# 保存TXT格式的简化结果
-	save_result_txt(f'results/{output_file}_simple.txt', results)
+	save_result_txt(f'results/{output_file}_simple.txt', sink)
 
-	print(f"📁 结果保存在 results/ 目录下（使用{profiling_model}方法）")
-	print(f"📄 JSON格式: results/{output_file}.json")
+	print(f"📁 结果保存在 results/ 目录下（使用{args.profiling_model}方法）")
+	print(f"📄 JSON格式: results/{output_file}")
 	print(f"📄 TXT格式: results/{output_file}_simple.txt")
 
 	# close_writer()
@@ -1,27 +1,43 @@
-import pdb 
 import os
 import re 
 import random 
-import openai
 import json
 import logging
 import time  
 # import jsonlines 
-import requests 
 import io
 import pickle
 import random
 import __main__
-import tiktoken
 import threading
+import functools
+import sys
 from typing import Dict, List
-import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.llm_metrics import LLMMetrics, get_encoding, DEFAULT_METRICS_PATH
+from common.profiling import span, profiled, timed_lock
+from common.llm_cache import SingleFlight, open_cache, cache_options
+from common.circuit_breaker import BreakerBoard, OPEN, CLOSED
+from common.hedging import Hedger
+from common.streaming import Streaming, iter_sse
+from common.async_logging import attach_queue_listener, ResponseTrace
+from common.token_budget import TokenBudget
+from common.lazy_import import lazy_module, lazy_object
+# 重模块在第一次使用时才导入：只读缓存/--help/metric.py 等快速命令不再为它们付出数秒启动时间
+openai = lazy_module('openai')
+requests = lazy_module('requests')
+pd = lazy_module('pandas')
 # import google
 
-with open('config.json', 'r') as f:
-	config = json.load(f)
+def _load_config():
+	# 优先使用当前目录的config.json，否则使用本阶段目录下的
+	config_path = 'config.json' if os.path.exists('config.json') else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+	with open(config_path, 'r') as f:
+		return json.load(f)
 
-streaming = False
+# 配置、日志及下面的各个组件都在第一次使用时才创建：导入utils不读文件、不启动线程
+config = lazy_object(_load_config)
 
 def load_file(path: str):
 	if path.endswith('.json'):
@@ -44,7 +60,8 @@ def setup_logger(name, log_file, level=logging.INFO, quiet=False):
 	if logger.hasHandlers():
 		logger.handlers.clear()
 
-	file_handler = logging.FileHandler(log_file, encoding='utf-8')
+	# delay: 日志文件在第一条记录写入时才打开
+	file_handler = logging.FileHandler(log_file, encoding='utf-8', delay=True)
 	file_handler.setLevel(logging.DEBUG)
 	file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 	file_handler.setFormatter(file_formatter)
@@ -59,7 +76,22 @@ def setup_logger(name, log_file, level=logging.INFO, quiet=False):
 
 	return logger
 
-logger = setup_logger(__name__, f'{__file__.split(".")[0]}.log', level=logging.INFO, quiet=False)
+def _create_logger():
+	log_config = config.get('logging', {})
+	_logger = setup_logger(__name__, f'{__file__.split(".")[0]}.log', level=getattr(logging, log_config.get('level', 'INFO')), quiet=False)
+	# 日志由后台线程写入文件/控制台，工作线程只把记录放入队列
+	if log_config.get('async', True):
+		attach_queue_listener(_logger)
+	return _logger
+
+def _create_response_trace():
+	log_config = config.get('logging', {})
+	return ResponseTrace(log_config.get('trace_path', 'llm_trace.jsonl.gz'),
+		sample_rate=log_config.get('trace_sample_rate', 0.1), max_chars=log_config.get('trace_max_chars', 20000))
+
+logger = lazy_object(_create_logger)
+# 完整的LLM响应按采样写入单独的gzip trace文件(python -m common.async_logging 查看)，日志中只记长度
+response_trace = lazy_object(_create_response_trace)
 
 from contextlib import contextmanager
 import tempfile
@@ -115,10 +147,8 @@ def open_atomic(filepath, *args, **kwargs):
 			if fsync:
 				f.flush()
 				os.fsync(f.fileno())
-		try:
-			os.rename(tmppath, filepath)
-		except:
-			pass
+		# os.replace overwrites atomically on every platform; a failure must not pass silently
+		os.replace(tmppath, filepath)
 		if original_permissions is not None:
 			os.chmod(filepath, original_permissions)
 
@@ -126,6 +156,7 @@ import datetime
 def convert_to_timestamp(time_str: str):
 	return time.mktime(datetime.datetime.strptime(time_str, "%Y-%m-%d").timetuple())
 
+@profiled('cache.pickle_dump')
 def safe_pickle_dump(obj, fname):
 	"""
 	prevents a case where one process could be writing a pickle file
@@ -137,12 +168,19 @@ def safe_pickle_dump(obj, fname):
 
 
 ERROR_SIGN = '[ERROR]'
+# 只有provider明确的内容安全拒答才返回ERROR_SIGN(会在negative_ttl内被负缓存)；网络/限流/服务端错误返回None以便重试
+REFUSAL_MARKERS = ('sensitivecontent', 'content_filter', 'content_policy', 'safety', 'prohibited', 'blocklist', 'blockreason')
+
+def is_refusal(text):
+	return any(marker in text.lower() for marker in REFUSAL_MARKERS)
 
-cache_path = config['cache']['default_path']
-cache_sign = True
+cache_path = None  # None: config['cache']['default_path']
+# 缓存选项 ttl / model_ttl / negative_ttl / max_entries / max_bytes / eviction 在打开缓存时从config读取，见 common/llm_cache.py
+# 注意：ttl 默认为0(永不过期)。旧配置中的 ttl: 3600 从未生效，若按原值执行，付费的回答一小时后就会失效
 cache = None
 reload_cache = False
-cache_lock = threading.Lock()  # 添加线程锁
+cache_lock = timed_lock(threading.Lock(), 'cache_lock')  # 添加线程锁
+inflight = SingleFlight()  # 相同key的并发请求只调用一次LLM
 
 def set_cache_path(new_cache_path):
 	global cache_path
@@ -151,6 +189,56 @@ def set_cache_path(new_cache_path):
 	reload_cache = True
 	print(f"set cache path to {cache_path}")
 
+# 每次LLM调用的token/耗时统计，按线程缓冲后追加写入metrics文件
+metrics = lazy_object(lambda: LLMMetrics(config.get('metrics', {}).get('path', DEFAULT_METRICS_PATH),
+	flush_every=config.get('metrics', {}).get('flush_every', 50),
+	encoding_name=config['encoding']['name']))
+
+def metered(func):
+	"""metrics.wrap(func)，在第一次调用时才包装，使装饰时不创建metrics"""
+	wrapped = []
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		if not wrapped:
+			wrapped.append(metrics.wrap(func))
+		return wrapped[0](*args, **kwargs)
+	return wrapper
+
+def set_metrics_path(new_metrics_path):
+	metrics.set_path(new_metrics_path)
+	print(f"set metrics path to {new_metrics_path}")
+
+def report_metrics():
+	"""打印本次运行的token与耗时分布，并把缓冲的记录写入metrics文件"""
+	metrics.flush()
+	metrics.report()
+	stats = inflight.stats()
+	print(f"  合并的重复并发请求: {stats['suppressed']} (实际发起 {stats['leaders']})")
+	for provider, state in breakers.stats().items():
+		if state['opens']:
+			print(f"  ⚡ {provider}: 熔断 {state['opens']} 次, 快速失败 {state['rejected']} 次, 当前 {state['state']}")
+	if breakers.failovers:
+		print(f"  🔀 故障转移: {breakers.failovers} 次")
+	hedger.report()
+	token_budget.report()
+
+# 按provider熔断：错误率过高时快速失败，并可按 failover 配置切换到备用模型
+breakers = lazy_object(lambda: BreakerBoard(**config.get('circuit_breaker', {'enable': False})))
+# 对冲请求(默认关闭)：搜索类调用超过延迟分位数后再发一个请求，先返回者胜出
+hedger = lazy_object(lambda: Hedger(**config.get('hedging', {})))
+# 流式输出(默认关闭)：记录首token时间，定期保存已生成的部分，连接中断后的重试从该处续写
+streaming = lazy_object(lambda: Streaming(**config.get('streaming', {})))
+# 发送前按模型上下文窗口统计prompt token数，注定超长的请求直接拒绝
+token_budget = lazy_object(lambda: TokenBudget(**dict({'encoding_name': config['encoding']['name']}, **config.get('token_budget', {}))))
+
+def record_provider_result(model, response):
+	# None = 配额/限流/超时等provider故障；ERROR_SIGN是对prompt的拒答，不算故障
+	state = breakers.record(model, response is not None)
+	if state == OPEN:
+		print(f"⚡ {model} 错误率过高，熔断打开 {breakers.breaker(model).cooldown:.0f}s")
+	elif state == CLOSED:
+		print(f"✅ {model} 探测成功，熔断关闭")
+
 def cached(func):
 	def wrapper(*args, **kwargs):		
 		# extract_from_chunk 
@@ -162,56 +250,148 @@ def cached(func):
 		global cache
 		global reload_cache
 
-		# 使用线程锁保护缓存操作
+		# 缓存存放在SQLite(WAL)中，多个进程可同时读写同一缓存文件；锁只保护打开/切换缓存
 		with cache_lock:
 			if reload_cache:
+				if cache is not None:
+					cache.close()
 				cache = None # to reload
 				reload_cache = False
 
-			if cache == None:
-				if not os.path.exists(cache_path):
-					cache = {}
-				else:
-					try:
-						cache = pickle.load(open(cache_path, 'rb'))  
-					except Exception as e:
-						# logger.info cache_path and throw error
-						logger.error(f'Error loading cache from {cache_path}')
-						cache = {}
-
-			if (cache_sign and key in cache) and not (cache[key] is None) and (not cache[key] == ERROR_SIGN):
-				return cache[key]
-
-		# 在锁外执行函数调用（避免长时间持有锁）
-		result = func(*args, **kwargs)
-		
-		# 重新获取锁来更新缓存
-		if result != None:
-			with cache_lock:
-				cache[key] = result
-				# 创建缓存副本避免在保存时被修改
-				cache_copy = cache.copy()
-			# 在锁外保存文件
-			safe_pickle_dump(cache_copy, cache_path)
-		
+			path = cache_path or config['cache']['default_path']
+			if cache is None:
+				try:
+					with span('cache.load'):
+						cache = open_cache(path, **cache_options(config['cache']))
+				except Exception as e:
+					# logger.info cache_path and throw error
+					logger.error(f'Error loading cache from {path}: {e}')
+			store = cache
+
+		cache_sign = config['cache'].get('enable', True)
+		if cache_sign and store is not None:
+			with span('cache.get'):
+				value = store.get(key)
+			# ERROR_SIGN 为负缓存(模型拒答)，在 negative_ttl 内直接返回，不再重复发送
+			if value is not None:
+				metrics.note_cache_hit()
+				return value
+
+		def call_and_store():
+			result = func(*args, **kwargs)
+			# 单条写入，不再每次重写整个缓存文件；在释放in-flight之前写入，之后的调用方一定能从缓存读到
+			if result != None and cache_sign and store is not None:
+				try:
+					with span('cache.put'):
+						store.put(key, result, func.__name__, model=str(kwargs.get('model', args[0] if args else '')),
+							negative=result == ERROR_SIGN)
+				except Exception as e:
+					logger.error(f'Error writing cache {path}: {e}')
+			return result
+
+		# 在锁外执行函数调用（避免长时间持有锁）；同一key正在请求时等待其结果，而不是重复调用
+		result, shared = inflight.do(key, call_and_store)
+		if shared:
+			metrics.note_cache_hit()
 		return result
 
 	return wrapper
 
-enc = tiktoken.get_encoding(config['encoding']['name'])
-
+# tiktoken编码在第一次encode/decode时才构建(get_encoding带缓存)
 def encode(text):
-	return enc.encode(text)
+	return get_encoding(config['encoding']['name']).encode(text)
 
 def decode(tokens):
-	return enc.decode(tokens)
+	return get_encoding(config['encoding']['name']).decode(tokens)
 
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
-	encoding = tiktoken.get_encoding(encoding_name)
+	encoding = get_encoding(encoding_name)
 	num_tokens = len(encoding.encode(string))
 	logger.info(f"Number of tokens: {num_tokens}")
 	return num_tokens
 
+def _stream_error(response):
+	"""非200的流式响应：内容安全拒答返回ERROR_SIGN，其余(限流/超时/服务端错误)返回None以便重试"""
+	logger.error(f"Error in streamed response: {response.status_code} {response.text[:1000]}")
+	return ERROR_SIGN if is_refusal(response.text) else None
+
+def _read_gemini_stream(url, headers, data, timeout, collector):
+	"""streamGenerateContent(SSE)：逐段读取，记录首token时间并定期保存已生成的部分"""
+	stream_url = url.replace(':generateContent', ':streamGenerateContent')
+	try:
+		usage, finished = None, False
+		# 流式请求的timeout是两段数据之间的空闲超时，而不是整个生成的时长
+		with requests.post(url=stream_url, params={'alt': 'sse'}, headers=headers, json=data, stream=True, timeout=timeout) as response:
+			if response.status_code != 200:
+				time.sleep(30)
+				return _stream_error(response)
+			for event in iter_sse(response.iter_lines()):
+				for candidate in event.get('candidates', [])[:1]:
+					collector.add(''.join(part.get('text', '') for part in candidate.get('content', {}).get('parts', [])))
+					finished = finished or 'finishReason' in candidate
+				if 'usageMetadata' in event:
+					usage = event
+		if not finished:
+			# 连接在生成结束前关闭
+			raise ConnectionError('stream ended before finishReason')
+		metrics.note_usage(usage)
+		metrics.note_extra(**collector.stats())
+		# 没有任何输出(如被拦截)
+		return collector.finish() or ERROR_SIGN
+	except Exception as e:
+		print(f"请求中断: {e}，已保存 {collector.abort()} 字符，重试时续写")
+		time.sleep(30)
+		return None
+
+def _read_doubao_stream(url, headers, data, timeout, collector):
+	"""responses API(SSE)：逐段读取output_text增量，完成事件中取最终文本与usage"""
+	try:
+		final = None
+		with requests.post(url=url, headers=headers, json=dict(data, stream=True), stream=True, timeout=timeout) as response:
+			if response.status_code != 200:
+				time.sleep(5)
+				return _stream_error(response)
+			for event in iter_sse(response.iter_lines()):
+				if event.get('type') == 'response.output_text.delta':
+					collector.add(event.get('delta'))
+				elif event.get('type') == 'response.completed':
+					final = event.get('response')
+		if final is None:
+			raise ConnectionError('stream ended before response.completed')
+		metrics.note_usage(final)
+		metrics.note_extra(**collector.stats())
+		text = collector.finish()
+		if final.get('output'):
+			# 与非流式一致取最后一个输出；续写时接在已保存的部分之后
+			text = collector.prefix + final['output'][-1]['content'][0]['text']
+		return text or ERROR_SIGN
+	except Exception as e:
+		print(f"请求中断: {e}，已保存 {collector.abort()} 字符，重试时续写")
+		time.sleep(5)
+		return None
+
+def _read_qwen_stream(client, model, messages, search, collector):
+	"""OpenAI兼容的流式输出；续写时最后一条assistant消息带partial=True(百炼前缀续写)"""
+	try:
+		usage, finished = None, False
+		for chunk in client.chat.completions.create(model=model, messages=messages, extra_body={"enable_search": search},
+				stream=True, stream_options={"include_usage": True}):
+			if chunk.choices:
+				collector.add(chunk.choices[0].delta.content)
+				finished = finished or chunk.choices[0].finish_reason is not None
+			if getattr(chunk, 'usage', None):
+				usage = chunk
+		if not finished:
+			raise ConnectionError('stream ended before finish_reason')
+		metrics.note_usage(usage)
+		metrics.note_extra(**collector.stats())
+		return collector.finish()
+	except Exception as e:
+		print(f"请求中断: {e}，已保存 {collector.abort()} 字符，重试时续写")
+		time.sleep(10)
+		return None
+
+@profiled('provider:gemini')
 def gemini(messages, search=False):
 	# 转换成google api支持的数据格式
 	def convert_google_message(messages):
@@ -226,6 +406,9 @@ def gemini(messages, search=False):
 	"""使用现有的gemini search API"""
 	# 从配置文件获取API配置
 	gemini_config = config['gemini_search']
+	stream = streaming.enabled_for('gemini')
+	if stream:
+		messages, collector = streaming.begin('gemini', messages, search)
 	url = gemini_config['url']
 	# params = {
 	# 	"ak": gemini_config['ak']
@@ -251,6 +434,9 @@ def gemini(messages, search=False):
 			}
 		]
 	
+	if stream:
+		return _read_gemini_stream(url, headers, data, gemini_config['timeout'], collector)
+
 	try:
 		response = requests.post(
 			url=url,
@@ -259,7 +445,9 @@ def gemini(messages, search=False):
 			timeout=gemini_config['timeout']
 		)
 		try:
-			return ''.join([res['text'] for res in response.json()['candidates'][0]['content']['parts']])
+			payload = response.json()
+			metrics.note_usage(payload)
+			return ''.join([res['text'] for res in payload['candidates'][0]['content']['parts']])
 			# return response.json()['choices'][0]['message']['content']
 		except Exception as e:
 			time.sleep(30)
@@ -270,16 +458,14 @@ def gemini(messages, search=False):
 			# else:
 			# 	return None
 
-			if any(word in response.text.lower() for word in ['limit', 'resource', 'timeout', 'time out', 'try again']):
-				return None
-			else:
-				return ERROR_SIGN
+			return ERROR_SIGN if is_refusal(response.text) else None
 			
 	except Exception as e:
 		print(f"请求失败: {e}")
 		time.sleep(30)
 		return None
 
+@profiled('provider:claude')
 def claude(messages):
 	"""使用现有的claude API"""
 	# 从配置文件获取API配置
@@ -298,6 +484,7 @@ def claude(messages):
 
 	try:
 		response = client.chat.completions.create(**request_params)
+		metrics.note_usage(response)
 
 		return response.choices[0].message.content
 			
@@ -305,6 +492,7 @@ def claude(messages):
 		print(f"请求失败: {e}")
 		return None
 
+@profiled('provider:gpt')
 def gpt(messages):
     """使用现有的claude API"""
     # 从配置文件获取API配置
@@ -324,6 +512,7 @@ def gpt(messages):
 
     try:
         response = client.chat.completions.create(**request_params)
+        metrics.note_usage(response)
         response_dict = response.model_dump()
         return response_dict
             
@@ -371,6 +560,7 @@ def deer_flow(messages):
 		print(f"Deer-flow请求失败: {e}")
 		return None
 
+@profiled('provider:qwen')
 def qwen(messages, search=False):
 
     config_qwen = config['qwen']
@@ -380,6 +570,10 @@ def qwen(messages, search=False):
         base_url=config_qwen['url'],
     )
 
+    if streaming.enabled_for('qwen'):
+        stream_messages, collector = streaming.begin('qwen', messages, search)
+        return _read_qwen_stream(client, config_qwen['model'], stream_messages, search, collector)
+
     try:
         completion = client.chat.completions.create(
             model=config_qwen['model'], 
@@ -391,6 +585,7 @@ def qwen(messages, search=False):
             #     "include_usage": True
             # },
         )
+        metrics.note_usage(completion)
         return completion.choices[0].message.content
     
     except Exception as e:
@@ -399,10 +594,14 @@ def qwen(messages, search=False):
         return None
 
 
+@profiled('provider:doubao')
 def doubao(messages, search=False):
 	## 豆包大模型api
 
 	doubao_config = config['doubao']
+	stream = streaming.enabled_for('doubao')
+	if stream:
+		messages, collector = streaming.begin('doubao', messages, search)
 
 	headers = {
 		"Content-Type": "application/json",
@@ -420,6 +619,9 @@ def doubao(messages, search=False):
 			{"type": "web_search"}
 		]
 
+	if stream:
+		return _read_doubao_stream(doubao_config['url'], headers, data, 240, collector)
+
 	try:
 		response = requests.post(
 			url=doubao_config['url'],
@@ -432,15 +634,20 @@ def doubao(messages, search=False):
 		# except Exception as e:
 		# 	print('fail to write response in ' + _file_handle.name)
 
-		return response.json()['output'][-1]['content'][0]['text']
+		payload = response.json()
+		metrics.note_usage(payload)
+		if response.status_code != 200 or 'error' in payload:
+			logger.error(f"Error in doubao response: {response.status_code} {response.text[:1000]}")
+			return ERROR_SIGN if is_refusal(response.text) else None
+		return payload['output'][-1]['content'][0]['text']
 			
 	except Exception as e:
 		time.sleep(5)
 		print(f"请求失败: {e}")
-		return ERROR_SIGN
+		return None
 
 # 全局文件句柄和锁
-_file_lock = threading.Lock()
+_file_lock = timed_lock(threading.Lock(), 'file_lock')
 _file_handle = None
 
 def init_writer(file_path="llm_responses.jsonl"):
@@ -466,28 +673,64 @@ def write_jsonl(record: dict):
         _file_handle.write(line)
         _file_handle.flush()
 
+def _call_provider(model, messages):
+	if model == 'gemini_search': 
+		response = gemini(messages, search=True)
+	elif model == 'gemini':
+		response = gemini(messages)
+	elif model == 'doubao_search':
+		response = doubao(messages, search=True)
+	elif model.startswith('claude'):
+		response = claude(messages)
+	elif model.startswith('gpt'):
+		response = gpt(messages)
+	elif model.startswith('qwen'):
+		response = qwen(messages, search=False)
+	elif model == 'deer-flow':
+		pass
+	return response
+
+def _hedged_call(model, messages, nth_generation):
+	"""主请求超过该模型的对冲延迟仍未返回时，再发一个(同一或备用模型的)请求，先成功者胜出"""
+	def task(m):
+		# 备用模型的请求同样经过它自己的熔断器
+		if m != model and not breakers.allow(m):
+			return None, None
+		response = _call_provider(m, messages)
+		if m != model:
+			record_provider_result(m, response)
+		# provider在本线程记下的usage等交给调用线程记录
+		return response, metrics.take_noted()
+
+	def on_loser(m, result, latency):
+		# 落败的请求同样计费，单独记一条
+		metrics.restore_noted(result[1])
+		metrics.note_extra(hedge='lost')
+		metrics.record(m, messages, result[0], latency, nth_generation)
+
+	(response, noted), hedged = hedger.call(model, task, ok=lambda result: result[0] is not None, on_loser=on_loser)
+	metrics.restore_noted(noted)
+	if hedged:
+		metrics.note_extra(hedged=True)
+	return response
+
+@metered
 @cached
 def _get_response(model, messages, nth_generation=0, **kwargs):
 	# if messages is str
 	if isinstance(messages, str):
 		messages = [{"role": "user", "content": messages}]
 
+	if not breakers.allow(model):
+		return None
+
 	try:
-		if model == 'gemini_search': 
-			response = gemini(messages, search=True)
-		elif model == 'gemini':
-			response = gemini(messages)
-		elif model == 'doubao_search':
-			response = doubao(messages, search=True)
-		elif model.startswith('claude'):
-			response = claude(messages)
-		elif model.startswith('gpt'):
-			response = gpt(messages)
-		elif model.startswith('qwen'):
-			response = qwen(messages, search=False)
-		elif model == 'deer-flow':
-			pass
+		if hedger.enabled_for(model):
+			response = _hedged_call(model, messages, nth_generation)
+		else:
+			response = _call_provider(model, messages)
 		
+		record_provider_result(model, response)
 		return response
 
 	except Exception as e:
@@ -506,21 +749,40 @@ def _get_response(model, messages, nth_generation=0, **kwargs):
 		logger.error(f"Number of input tokens: {num_tokens_from_string(messages[0]['content'])}")
 
 		traceback.print_exc()
+		record_provider_result(model, None)
 		return None
 
 def get_response(post_processing_funcs=[], **kwargs):
 	nth_generation = 0
+	failovers = 0
+
+	# 超出上下文窗口的prompt在发送前拒绝，不再经过往返和重试
+	fits, tokens = token_budget.admit(kwargs['model'], kwargs.get('messages'))
+	if not fits:
+		logger.warning(f"prompt too long for {kwargs['model']}: {tokens} tokens > {token_budget.limit(kwargs['model'])}, refused")
+		return None
 
 	while True:
 		if nth_generation > kwargs.get('max_retry', 3):
 			# Return error response with backup data if parse_response failed
 			return None
 		
-		logger.info(f'{nth_generation}th generation')
+		if tokens is not None:
+			# admit() 已经编码过prompt，metrics直接使用该计数
+			metrics.note_prompt_tokens(tokens)
 		response = _get_response(**kwargs, nth_generation=nth_generation)
-		logger.info(f'response by LLM: {response[:1000] if isinstance(response, str) else response}')
+		traced = response_trace.write(model=kwargs['model'], nth_generation=nth_generation, response=response)
+		size = f'{len(response)} chars' if isinstance(response, str) else type(response).__name__
+		logger.info(f"response by LLM ({kwargs['model']}, {nth_generation}th generation): {size}{' [traced]' if traced else ''}")
 
 		if response is None:
+			# 熔断打开时切换到备用模型，不计入重试次数
+			fallback = breakers.failover(kwargs['model']) if failovers < 3 else None
+			if fallback is not None:
+				logger.warning(f"{kwargs['model']} 熔断中，切换到 {fallback}")
+				kwargs['model'] = fallback
+				failovers += 1
+				continue
 			nth_generation += 1
 			continue 
 		
@@ -556,6 +818,7 @@ def ensure_question_format(response, **kwargs):
 
 
 
+@profiled('progress.save_result')
 def save_result(filename, result):
 	"""保存查询结果到文件"""
 	# 创建results目录
@@ -673,6 +936,7 @@ def save_result_txt(filename, results):
 				
 			f.write("└" + "─" * 78 + "┘\n\n")
 		
+@profiled('extract_json')
 def extract_json(text, **kwargs):
 	def _extract_json(text):
 		# Use regular expressions to find all content within curly braces
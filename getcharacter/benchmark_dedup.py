@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Duplicate Detection Benchmark - exact grouping vs MinHash/LSH vs all pairs
+Run from getcharacter/: python benchmark_dedup.py --input final_merged_characters.jsonl
+"""
+
+import json
+import time
+import argparse
+from itertools import combinations
+
+from smart_data_cleaner import SmartDataCleaner
+
+
+def load_characters(path: str, repeat: int = 1):
+    characters = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            characters.append(json.loads(line))
+    # Repeat under suffixed franchises to check how each method scales
+    # (copies collide in the index but never merge across franchises)
+    scaled = []
+    for r in range(repeat):
+        for char in characters:
+            if r and not char.get('franchise'):
+                continue
+            char = dict(char)
+            if r:
+                char['franchise'] = f"{char['franchise']} {r}"
+            scaled.append(char)
+    return scaled
+
+
+def duplicate_pairs(cleaner: SmartDataCleaner, groups):
+    pairs = set()
+    for group in groups:
+        for duplicates in cleaner.split_duplicates(group):
+            ids = sorted(id(c) for c in duplicates)
+            pairs.update(combinations(ids, 2))
+    return pairs
+
+
+def run(method: str, characters):
+    cleaner = SmartDataCleaner(dedup_method=method)
+    start = time.perf_counter()
+    groups = cleaner.find_candidate_groups(characters)
+    pairs = duplicate_pairs(cleaner, groups)
+    elapsed = time.perf_counter() - start
+    return pairs, elapsed
+
+
+def run_all_pairs(characters):
+    cleaner = SmartDataCleaner()
+    start = time.perf_counter()
+    pairs = set()
+    for a, b in combinations(characters, 2):
+        if cleaner.are_same_character(a, b):
+            pairs.add(tuple(sorted((id(a), id(b)))))
+    return pairs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Duplicate detection throughput benchmark')
+    parser.add_argument('--input', default='final_merged_characters.jsonl')
+    parser.add_argument('--repeat', type=int, default=1, help='Scale the dataset by repeating it')
+    parser.add_argument('--all_pairs', action='store_true', help='Also run the quadratic baseline for recall')
+    args = parser.parse_args()
+
+    characters = load_characters(args.input, args.repeat)
+    print(f"📊 {len(characters)} characters from {args.input}")
+
+    results = {}
+    for method in ['exact', 'lsh']:
+        pairs, elapsed = run(method, characters)
+        results[method] = pairs
+        print(f"  {method:>9}: {len(pairs):5d} duplicate pairs in {elapsed:.2f}s ({len(characters) / elapsed:,.0f} chars/s)")
+
+    if args.all_pairs:
+        pairs, elapsed = run_all_pairs(characters)
+        results['all_pairs'] = pairs
+        print(f"  all_pairs: {len(pairs):5d} duplicate pairs in {elapsed:.2f}s ({len(characters) / elapsed:,.0f} chars/s)")
+        for method in ['exact', 'lsh']:
+            recall = len(results[method] & pairs) / len(pairs) if pairs else 1.0
+            print(f"  {method} recall vs all pairs: {recall:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,16 +6,32 @@ Collects real character data and performs franchise-aware merging
 
 import requests
 import json
-import time
+import os
 import re
+import sys
 import argparse
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 from difflib import SequenceMatcher
 from collections import defaultdict
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.normalize import normalize_name, normalize_franchise
+from record_stream import iter_jsonl, iter_source_records, write_jsonl, JsonlWriter, rank_by_popularity
+from character_index import CharacterIndex, default_index_path, discard_index
+from paginated_fetcher import (
+    RateLimiter, PageCheckpoint, fetch_pages, request_with_retry,
+    ANILIST_RATE_LIMITS, JIKAN_RATE_LIMITS
+)
 
 class CharacterDataProcessor:
-    def __init__(self):
+    def __init__(self, max_workers: int = 3, max_pages: int = 1000, checkpoint_dir: Optional[str] = None):
         """Initialize the complete character data processing system"""
+        # Pages prefetched in parallel per source; the shared limiters keep each API under its documented limit
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.checkpoint_dir = checkpoint_dir
+        self.anilist_limiter = RateLimiter(ANILIST_RATE_LIMITS)
+        self.mal_limiter = RateLimiter(JIKAN_RATE_LIMITS)
+        
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -25,20 +41,6 @@ class CharacterDataProcessor:
             'Connection': 'keep-alive',
         })
         
-        # Franchise normalization for merging
-        self.franchise_map = {
-            'one piece': 'one piece', 'onepiece': 'one piece',
-            'attack on titan': 'attack on titan', 'shingeki no kyojin': 'attack on titan', 'aot': 'attack on titan',
-            'jujutsu kaisen': 'jujutsu kaisen', 'jjk': 'jujutsu kaisen',
-            'naruto': 'naruto', 'naruto shippuden': 'naruto',
-            'hunter x hunter': 'hunter x hunter', 'hxh': 'hunter x hunter',
-            'demon slayer': 'demon slayer', 'kimetsu no yaiba': 'demon slayer',
-            'my hero academia': 'my hero academia', 'boku no hero academia': 'my hero academia',
-            'genshin impact': 'genshin impact', 'genshin': 'genshin impact',
-            'pokemon': 'pokemon', 'pokémon': 'pokemon',
-            'spy x family': 'spy x family', 'spyxfamily': 'spy x family',
-        }
-        
         # Known character equivalents (franchise -> list of name sets)
         self.character_matches = {
             'jujutsu kaisen': [
@@ -67,7 +69,6 @@ class CharacterDataProcessor:
     
     def collect_anilist_characters(self, limit: int = 1000) -> List[Dict]:
         """Collect characters from AniList API"""
-        characters = []
         print(f"🔥 Collecting AniList characters (target: {limit})...")
         
         url = "https://graphql.anilist.co"
@@ -89,138 +90,130 @@ class CharacterDataProcessor:
         """
         
         characters_per_page = 50
-        pages_needed = (limit // characters_per_page) + 1
         
-        for page in range(1, min(pages_needed + 1, 21)):
-            try:
-                variables = {"page": page, "perPage": characters_per_page}
-                response = self.session.post(
+        def fetch_page(page: int):
+            variables = {"page": page, "perPage": characters_per_page}
+            response = request_with_retry(
+                lambda: self.session.post(
                     url,
                     json={"query": query, "variables": variables},
                     headers={"Content-Type": "application/json"},
                     timeout=10
-                )
-                
-                if response.status_code != 200:
-                    print(f"  ❌ Page {page} failed: HTTP {response.status_code}")
-                    break
-                
-                data = response.json()
-                if "errors" in data:
-                    print(f"  ❌ GraphQL errors: {data['errors']}")
-                    break
-                
-                char_data = data.get("data", {}).get("Page", {}).get("characters", [])
-                if not char_data:
-                    break
-                
-                print(f"  📄 Page {page}: {len(char_data)} characters")
-                
-                for char in char_data:
-                    name = char.get("name", {}).get("full", "Unknown")
-                    favorites = char.get("favourites", 0)
-                    description = char.get("description", "")
-                    
-                    # Clean description
-                    if description:
-                        description = re.sub(r'<.*?>', '', description)[:150] + "..."
-                    
-                    # Get franchise
-                    media_nodes = char.get("media", {}).get("nodes", [])
-                    franchise = ""
-                    if media_nodes:
-                        title_info = media_nodes[0].get("title", {})
-                        franchise = title_info.get("english") or title_info.get("romaji", "")
-                    
-                    characters.append({
-                        "name": name,
-                        "rank": len(characters) + 1,
-                        "source": "anilist",
-                        "category": "anime",
-                        "franchise": franchise,
-                        "popularity_score": favorites,
-                        "description": description,
-                        "tags": ["anime", "manga", "anilist_verified"]
-                    })
-                    
-                    if len(characters) >= limit:
-                        break
+                ),
+                self.anilist_limiter
+            )
+            
+            if response.status_code != 200:
+                print(f"  ❌ Page {page} failed: HTTP {response.status_code}")
+                return None
+            
+            data = response.json()
+            if "errors" in data:
+                print(f"  ❌ GraphQL errors: {data['errors']}")
+                return None
+            
+            page_chars = []
+            for char in data.get("data", {}).get("Page", {}).get("characters", []):
+                name = char.get("name", {}).get("full", "Unknown")
+                favorites = char.get("favourites", 0)
+                description = char.get("description", "")
                 
-                if len(characters) >= limit:
-                    break
+                # Clean description
+                if description:
+                    description = re.sub(r'<.*?>', '', description)[:150] + "..."
                 
-                time.sleep(0.3)
+                # Get franchise
+                media_nodes = char.get("media", {}).get("nodes", [])
+                franchise = ""
+                if media_nodes:
+                    title_info = media_nodes[0].get("title", {})
+                    franchise = title_info.get("english") or title_info.get("romaji", "")
                 
-            except Exception as e:
-                print(f"  ❌ Error on page {page}: {e}")
-                break
+                page_chars.append({
+                    "name": name,
+                    "source": "anilist",
+                    "category": "anime",
+                    "franchise": franchise,
+                    "popularity_score": favorites,
+                    "description": description,
+                    "tags": ["anime", "manga", "anilist_verified"]
+                })
+            return page_chars
+        
+        characters = fetch_pages(
+            fetch_page,
+            max_pages=self.max_pages,
+            per_page=characters_per_page,
+            limit=limit,
+            max_workers=self.max_workers,
+            checkpoint=self._checkpoint('anilist')
+        )
+        for i, char in enumerate(characters):
+            char["rank"] = i + 1
         
         print(f"  ✅ AniList: {len(characters)} characters collected")
         return characters
     
     def collect_mal_characters(self, limit: int = 1000) -> List[Dict]:
         """Collect characters from MyAnimeList via Jikan API"""
-        characters = []
         print(f"🔥 Collecting MAL characters (target: {limit})...")
         
         base_url = "https://api.jikan.moe/v4/top/characters"
+        characters_per_page = 25
         
-        try:
-            page = 1
-            while len(characters) < limit and page <= 40:
-                print(f"  📄 Page {page}: fetching 25 characters")
-                
-                response = self.session.get(f"{base_url}?page={page}", timeout=10)
-                
-                if response.status_code == 429:
-                    print("  ⏳ Rate limited, waiting...")
-                    time.sleep(3)
-                    continue
-                
-                if response.status_code != 200:
-                    print(f"  ❌ Error: HTTP {response.status_code}")
-                    break
-                
-                data = response.json()
-                char_data = data.get("data", [])
-                
-                if not char_data:
-                    break
-                
-                for char in char_data:
-                    if len(characters) >= limit:
-                        break
-                    
-                    name = char.get("name", "Unknown")
-                    favorites = char.get("favorites", 0)
-                    about = char.get("about", "")
-                    
-                    # Get anime info (MAL doesn't provide franchise in this endpoint)
-                    animeography = char.get("animeography", [])
-                    franchise = ""
-                    if animeography:
-                        franchise = animeography[0].get("anime", {}).get("title", "")
-                    
-                    characters.append({
-                        "name": name,
-                        "rank": len(characters) + 1,
-                        "source": "myanimelist",
-                        "category": "anime",
-                        "franchise": franchise,
-                        "popularity_score": favorites,
-                        "description": about[:150] + "..." if about else "",
-                        "tags": ["anime", "manga", "mal_verified"]
-                    })
+        def fetch_page(page: int):
+            response = request_with_retry(
+                lambda: self.session.get(f"{base_url}?page={page}", timeout=10),
+                self.mal_limiter
+            )
+            
+            if response.status_code != 200:
+                print(f"  ❌ Page {page} failed: HTTP {response.status_code}")
+                return None
+            
+            page_chars = []
+            for char in response.json().get("data", []):
+                name = char.get("name", "Unknown")
+                favorites = char.get("favorites", 0)
+                about = char.get("about", "")
                 
-                page += 1
-                time.sleep(1)
+                # Get anime info (MAL doesn't provide franchise in this endpoint)
+                animeography = char.get("animeography", [])
+                franchise = ""
+                if animeography:
+                    franchise = animeography[0].get("anime", {}).get("title", "")
                 
-        except Exception as e:
-            print(f"  ❌ Error scraping MAL: {e}")
+                page_chars.append({
+                    "name": name,
+                    "source": "myanimelist",
+                    "category": "anime",
+                    "franchise": franchise,
+                    "popularity_score": favorites,
+                    "description": about[:150] + "..." if about else "",
+                    "tags": ["anime", "manga", "mal_verified"]
+                })
+            return page_chars
+        
+        characters = fetch_pages(
+            fetch_page,
+            max_pages=self.max_pages,
+            per_page=characters_per_page,
+            limit=limit,
+            max_workers=self.max_workers,
+            checkpoint=self._checkpoint('myanimelist')
+        )
+        for i, char in enumerate(characters):
+            char["rank"] = i + 1
         
         print(f"  ✅ MAL: {len(characters)} characters collected")
         return characters
     
+    def _checkpoint(self, source: str) -> PageCheckpoint:
+        """Per-page progress file for one source (None disables checkpointing)"""
+        if not self.checkpoint_dir:
+            return PageCheckpoint(None)
+        return PageCheckpoint(os.path.join(self.checkpoint_dir, f"{source}_pages.jsonl"))
+    
     def get_character_ai_data(self, limit: int = 200) -> List[Dict]:
         """Get Character.AI popular characters based on research"""
         print(f"🔥 Generating Character.AI research data (target: {limit})...")
@@ -262,13 +255,13 @@ class CharacterDataProcessor:
         print(f"  ✅ Character.AI: {len(characters)} characters generated")
         return characters
     
-    def collect_all_data(self) -> Dict[str, List[Dict]]:
+    def collect_all_data(self, limit: int = 1000) -> Dict[str, List[Dict]]:
         """Collect data from all sources"""
         print("🚀 Starting comprehensive data collection...")
         
         all_data = {}
-        all_data["anilist"] = self.collect_anilist_characters(1000)
-        all_data["myanimelist"] = self.collect_mal_characters(1000)
+        all_data["anilist"] = self.collect_anilist_characters(limit)
+        all_data["myanimelist"] = self.collect_mal_characters(limit)
         all_data["character_ai"] = self.get_character_ai_data(200)
         
         total = sum(len(chars) for chars in all_data.values())
@@ -278,26 +271,11 @@ class CharacterDataProcessor:
     
     def normalize_name(self, name: str) -> str:
         """Normalize character name for comparison"""
-        if not name:
-            return ''
-        
-        name = re.sub(r'^(mr|mrs|dr|sir|lord|lady|captain|professor)\s+', '', name.lower())
-        name = re.sub(r'[^\w\s]', '', name)
-        name = re.sub(r'\s+', ' ', name).strip()
-        name = name.replace('ou', 'o').replace('uu', 'u')  # Romanization fixes
-        
-        return name
+        return normalize_name(name)
     
     def normalize_franchise(self, franchise: str) -> str:
         """Normalize franchise name"""
-        if not franchise:
-            return ''
-        
-        normalized = franchise.lower().strip()
-        normalized = re.sub(r'[^\w\s]', ' ', normalized)
-        normalized = re.sub(r'\s+', ' ', normalized).strip()
-        
-        return self.franchise_map.get(normalized, normalized)
+        return normalize_franchise(franchise)
     
     def are_same_character(self, char1: Dict, char2: Dict) -> bool:
         """Check if two characters represent the same person"""
@@ -384,6 +362,26 @@ class CharacterDataProcessor:
             'final_rank': 0  # Will be set after sorting
         }
     
+    def single_character_record(self, char: Dict) -> Dict:
+        """Merged-database record for a character with a single source"""
+        return {
+            'name': char['name'],
+            'franchise': char.get('franchise', ''),
+            'category': char.get('category', ''),
+            'description': char.get('description', '')[:200],
+            'total_popularity_score': char.get('popularity_score', 0),
+            'highest_rank': char.get('rank'),
+            'source_count': 1,
+            'platforms': [char.get('source')],
+            'tags': char.get('tags', []),
+            'sources': [{'platform': char.get('source'), 'rank': char.get('rank'),
+                        'popularity_score': char.get('popularity_score'),
+                        'name_variant': char.get('name'), 'franchise': char.get('franchise', ''),
+                        'tags': char.get('tags', [])}],
+            'name_variants': [char['name']],
+            'final_rank': 0
+        }
+    
     def merge_database(self, input_data: Dict[str, List[Dict]]) -> List[Dict]:
         """Merge characters across all sources"""
         print("🔄 Starting intelligent character merging...")
@@ -444,23 +442,7 @@ class CharacterDataProcessor:
         
         # Add characters without franchise (no merging)
         for char in no_franchise:
-            merged_chars.append({
-                'name': char['name'],
-                'franchise': char.get('franchise', ''),
-                'category': char.get('category', ''),
-                'description': char.get('description', '')[:200],
-                'total_popularity_score': char.get('popularity_score', 0),
-                'highest_rank': char.get('rank'),
-                'source_count': 1,
-                'platforms': [char.get('source')],
-                'tags': char.get('tags', []),
-                'sources': [{'platform': char.get('source'), 'rank': char.get('rank'),
-                            'popularity_score': char.get('popularity_score'),
-                            'name_variant': char.get('name'), 'franchise': char.get('franchise', ''),
-                            'tags': char.get('tags', [])}],
-                'name_variants': [char['name']],
-                'final_rank': 0
-            })
+            merged_chars.append(self.single_character_record(char))
         
         # Sort by total popularity and assign final ranks
         merged_chars.sort(key=lambda x: x.get('total_popularity_score', 0), reverse=True)
@@ -470,25 +452,159 @@ class CharacterDataProcessor:
         print(f"🎯 Merge complete: {len(all_chars)} → {len(merged_chars)} characters ({merge_count} merges)")
         return merged_chars
     
+    def matches_record(self, char: Dict, record: Dict) -> bool:
+        """Check a new source record against every source variant of a merged record"""
+        for source in record.get('sources', []):
+            variant = {
+                'source': source.get('platform'),
+                'name': source.get('name_variant') or record['name'],
+                'franchise': source.get('franchise') or record.get('franchise', '')
+            }
+            if self.are_same_character(char, variant):
+                return True
+        return False
+    
+    def is_recollected(self, char: Dict, record: Dict) -> bool:
+        """The record already holds this platform's entry for the character"""
+        return any(source.get('platform') == char.get('source') and source.get('name_variant') == char.get('name')
+                   for source in record.get('sources', []))
+    
+    def merge_into_record(self, record: Dict, char: Dict) -> Dict:
+        """Apply one source record to an existing merged record in place"""
+        new_source = {
+            'platform': char.get('source'),
+            'rank': char.get('rank'),
+            'popularity_score': char.get('popularity_score'),
+            'name_variant': char.get('name'),
+            'franchise': char.get('franchise', ''),
+            'tags': char.get('tags', [])
+        }
+        
+        # A recollected entry of the same platform replaces the old one
+        sources = record.setdefault('sources', [])
+        for i, source in enumerate(sources):
+            if source.get('platform') == new_source['platform'] and source.get('name_variant') == new_source['name_variant']:
+                sources[i] = new_source
+                break
+        else:
+            sources.append(new_source)
+        
+        if not record.get('franchise') and char.get('franchise'):
+            record['franchise'] = char['franchise']
+        
+        ranks = [s['rank'] for s in sources if s.get('rank')]
+        record['total_popularity_score'] = sum(s.get('popularity_score') or 0 for s in sources)
+        record['highest_rank'] = min(ranks) if ranks else None
+        record['source_count'] = len(sources)
+        record['platforms'] = [s.get('platform') for s in sources]
+        record['tags'] = sorted(set(record.get('tags', [])) | set(char.get('tags', [])))
+        if char.get('name') not in record.setdefault('name_variants', []):
+            record['name_variants'].append(char['name'])
+        return record
+    
+    def incremental_update(self, batch: Iterable[Dict], database_file: str, index_file: str = None) -> Dict[str, int]:
+        """
+        Merge a batch of new source records into an existing merged database.
+        Each record is matched only against the characters of its own franchise via
+        the persisted index, and only those rows are read from the database file, so
+        the matching work and memory scale with the batch, not the database. The
+        file is then rewritten once, streamed through the popularity re-rank.
+        """
+        print("🔄 Starting incremental character update...")
+        index_file = index_file or default_index_path(database_file)
+        
+        index = None
+        if os.path.exists(index_file):
+            index = CharacterIndex.load(index_file, self.normalize_name, self.normalize_franchise)
+            if not index.describes(database_file):
+                print(f"📇 {index_file} does not match {database_file} (rewritten since), rebuilding")
+                index = None
+        if index is None:
+            index = CharacterIndex.build(database_file, self.normalize_name, self.normalize_franchise)
+            print(f"📇 Built index for {index.size} characters")
+        
+        size = index.size
+        loaded: Dict[int, Dict] = {}  # database rows read for matching
+        merged_rows = set()
+        inserted: List[Dict] = []
+        
+        batch_count = merge_count = insert_count = 0
+        db = open(database_file, 'rb') if size else None
+        try:
+            def record(row: int) -> Dict:
+                if row >= size:
+                    return inserted[row - size]
+                if row not in loaded:
+                    loaded[row] = index.read(db, row)
+                return loaded[row]
+            
+            for char in batch:
+                batch_count += 1
+                
+                row = index.exact_match(char.get('name', ''), char.get('franchise', ''))
+                if row is not None and not (self.is_recollected(char, record(row)) or self.matches_record(char, record(row))):
+                    row = None
+                if row is None:
+                    row = next((r for r in index.candidates(char.get('franchise', ''))
+                                if self.matches_record(char, record(r))), None)
+                
+                if row is not None:
+                    self.merge_into_record(record(row), char)
+                    index.add(row, record(row))
+                    if row < size:
+                        merged_rows.add(row)
+                    merge_count += 1
+                    print(f"  ✅ Merged: {char.get('name')} into {record(row)['name']}")
+                else:
+                    inserted.append(self.single_character_record(char))
+                    index.add(size + len(inserted) - 1, inserted[-1])
+                    insert_count += 1
+        finally:
+            if db is not None:
+                db.close()
+        
+        def rows() -> Iterator[Dict]:
+            existing = iter_jsonl(database_file) if size else iter(())
+            for row, char in enumerate(existing):
+                char = loaded[row] if row in merged_rows else char
+                char['_row'] = row
+                yield char
+            for row, char in enumerate(inserted, size):
+                char['_row'] = row
+                yield char
+        
+        # Re-rank with a single (spill-to-disk) sort and carry the index over to the new order
+        order, offsets = [], []
+        with JsonlWriter(database_file) as writer:
+            for char in rank_by_popularity(rows(), tmp_dir=os.path.dirname(os.path.abspath(database_file))):
+                order.append(char.pop('_row'))
+                offsets.append(writer.write(char))
+        index.renumber(order, offsets)
+        index.save(index_file, database_file)
+        
+        print(f"💾 Data saved to {database_file}")
+        print(f"🎯 Incremental update complete: {batch_count} records → {merge_count} merges, {insert_count} inserts ({index.size} characters)")
+        return {'records': batch_count, 'merges': merge_count, 'inserts': insert_count, 'characters': index.size}
+    
     def save_data(self, data, filename: str, format_type: str = 'json'):
-        """Save data to file"""
+        """Save data to file (jsonl accepts any iterable and is written as it streams)"""
         if format_type == 'jsonl':
-            with open(filename, 'w', encoding='utf-8') as f:
-                for item in data:
-                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+            write_jsonl(data, filename)
+            # a rewritten database invalidates the incremental-mode index next to it
+            discard_index(filename)
         else:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         
         print(f"💾 Data saved to {filename}")
     
-    def run_full_pipeline(self):
+    def run_full_pipeline(self, limit: int = 1000):
         """Run the complete data collection and merging pipeline"""
         print("🚀 STARTING COMPLETE CHARACTER DATA PIPELINE")
         print("=" * 60)
         
         # Step 1: Collect data
-        raw_data = self.collect_all_data()
+        raw_data = self.collect_all_data(limit)
         self.save_data(raw_data, 'collected_characters.json')
         
         # Step 2: Merge characters
@@ -511,20 +627,28 @@ class CharacterDataProcessor:
 
 def main():
     parser = argparse.ArgumentParser(description='Character Data Processor')
-    parser.add_argument('--mode', choices=['collect', 'merge', 'full'], default='full',
-                        help='Processing mode: collect, merge, or full pipeline')
+    parser.add_argument('--mode', choices=['collect', 'merge', 'full', 'incremental'], default='full',
+                        help='Processing mode: collect, merge, full pipeline, or incremental update')
     parser.add_argument('--input', default='collected_characters.json',
-                        help='Input file for merge mode')
+                        help='Input file for merge mode, or new source records (.json/.jsonl) for incremental mode')
+    parser.add_argument('--index', default=None,
+                        help='Index file for incremental mode (default: <output>.index.json)')
     parser.add_argument('--output', default='final_merged_characters.jsonl',
                         help='Output file name')
+    parser.add_argument('--limit', type=int, default=1000,
+                        help='Characters to collect per source')
+    parser.add_argument('--workers', type=int, default=3,
+                        help='Pages fetched in parallel per source')
+    parser.add_argument('--checkpoint_dir', default=None,
+                        help='Per-page progress files to resume an interrupted collection (removed once it completes)')
     
     args = parser.parse_args()
     
-    processor = CharacterDataProcessor()
+    processor = CharacterDataProcessor(max_workers=args.workers, checkpoint_dir=args.checkpoint_dir)
     
     if args.mode == 'collect':
         print("🔄 Data Collection Mode")
-        data = processor.collect_all_data()
+        data = processor.collect_all_data(args.limit)
         processor.save_data(data, 'collected_characters.json')
         
     elif args.mode == 'merge':
@@ -534,8 +658,12 @@ def main():
         merged = processor.merge_database(raw_data)
         processor.save_data(merged, args.output, 'jsonl')
         
+    elif args.mode == 'incremental':
+        print("🔄 Incremental Mode")
+        processor.incremental_update(iter_source_records(args.input), args.output, args.index)
+        
     else:  # full mode
-        processor.run_full_pipeline()
+        processor.run_full_pipeline(args.limit)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
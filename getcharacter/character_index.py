@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Character Index - persisted lookup of a merged database by normalized name + franchise
+Used by CharacterDataProcessor.incremental_update to find merge candidates for
+new source records without re-merging the whole database. The index also keeps
+the byte offset of every row, so candidates are read from the file on demand,
+and the size + mtime of the database it describes, so an index left behind by
+another writer of the database is detected and rebuilt.
+"""
+
+import os
+import json
+from typing import BinaryIO, Callable, Dict, List, Optional, Set
+from collections import defaultdict
+
+
+def default_index_path(database_file: str) -> str:
+    return os.path.splitext(database_file)[0] + '.index.json'
+
+
+def file_signature(path: str) -> Optional[Dict[str, int]]:
+    """Size and mtime of a file, None when it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def discard_index(database_file: str):
+    """Remove the default index of a database that is being rewritten as a whole"""
+    try:
+        os.remove(default_index_path(database_file))
+    except FileNotFoundError:
+        pass
+
+
+class CharacterIndex:
+    def __init__(self, normalize_name: Callable[[str], str], normalize_franchise: Callable[[str], str]):
+        self.normalize_name = normalize_name
+        self.normalize_franchise = normalize_franchise
+        # normalized franchise -> rows of the merged database in that franchise
+        self.franchise_rows: Dict[str, Set[int]] = defaultdict(set)
+        # "normalized name|normalized franchise" -> row, for every source name variant
+        self.exact_rows: Dict[str, int] = {}
+        # byte offset of every row in the database file
+        self.offsets: List[int] = []
+        # file_signature() of the database file this index was saved for
+        self.source: Optional[Dict[str, int]] = None
+        self.size = 0
+
+    def key(self, name: str, franchise: str) -> str:
+        return f"{self.normalize_name(name)}|{self.normalize_franchise(franchise)}"
+
+    def add(self, row: int, record: Dict):
+        """Index one merged record under its franchise and all of its name variants (idempotent)"""
+        franchise = self.normalize_franchise(record.get('franchise', ''))
+        if franchise:
+            self.franchise_rows[franchise].add(row)
+        for source in record.get('sources') or [{'name_variant': record['name'], 'franchise': record.get('franchise', '')}]:
+            name = source.get('name_variant') or record['name']
+            self.exact_rows.setdefault(self.key(name, source.get('franchise') or record.get('franchise', '')), row)
+        self.size = max(self.size, row + 1)
+
+    def exact_match(self, name: str, franchise: str) -> Optional[int]:
+        return self.exact_rows.get(self.key(name, franchise))
+
+    def candidates(self, franchise: str) -> List[int]:
+        """Rows that may hold the same character (same normalized franchise), best ranked first"""
+        franchise = self.normalize_franchise(franchise)
+        return sorted(self.franchise_rows.get(franchise, ())) if franchise else []
+
+    def read(self, f: BinaryIO, row: int) -> Dict:
+        """Record at row of the database file f (opened in binary mode)"""
+        f.seek(self.offsets[row])
+        return json.loads(f.readline())
+
+    def describes(self, database_file: str) -> bool:
+        """The database file is the one this index was saved for"""
+        return self.source is not None and self.source == file_signature(database_file) and len(self.offsets) == self.size
+
+    def renumber(self, old_rows: List[int], offsets: List[int]):
+        """Follow a rewrite of the database: old_rows[new_row] is the row before sorting, offsets the new row offsets"""
+        new_row = {old: new for new, old in enumerate(old_rows)}
+        self.franchise_rows = defaultdict(set, {
+            franchise: {new_row[row] for row in rows} for franchise, rows in self.franchise_rows.items()
+        })
+        self.exact_rows = {key: new_row[row] for key, row in self.exact_rows.items()}
+        self.offsets = offsets
+        self.size = len(offsets)
+
+    @classmethod
+    def build(cls, database_file: str, normalize_name, normalize_franchise) -> 'CharacterIndex':
+        """Index a JSONL database in one streaming pass (an empty index if the file does not exist)"""
+        index = cls(normalize_name, normalize_franchise)
+        if not os.path.exists(database_file):
+            return index
+        with open(database_file, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    index.offsets.append(offset)
+                    index.add(len(index.offsets) - 1, json.loads(line))
+                offset += len(line)
+        index.source = file_signature(database_file)
+        return index
+
+    @classmethod
+    def load(cls, path: str, normalize_name, normalize_franchise) -> 'CharacterIndex':
+        index = cls(normalize_name, normalize_franchise)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        index.franchise_rows = defaultdict(set, {franchise: set(rows) for franchise, rows in data['franchise_rows'].items()})
+        index.exact_rows = data['exact_rows']
+        index.offsets = data.get('offsets', [])
+        index.source = data.get('source')
+        index.size = data['size']
+        return index
+
+    def save(self, path: str, database_file: str):
+        """Write the index, recording the current signature of database_file"""
+        self.source = file_signature(database_file)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': self.size, 'source': self.source, 'offsets': self.offsets,
+                       'franchise_rows': {franchise: sorted(rows) for franchise, rows in self.franchise_rows.items()},
+                       'exact_rows': self.exact_rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -1,13 +1,6 @@
-import json
-with open('final_merged_characters.jsonl', 'r') as f:
-    data = []
-    for line in f:
-        d = json.loads(line)
-        if d['franchise'] != '':
-            data.append(d)
+from record_stream import iter_jsonl, write_jsonl
 
-print(len(data))
+data = (d for d in iter_jsonl('final_merged_characters.jsonl') if d['franchise'] != '')
+count = write_jsonl(data, 'acg_characters_v1.jsonl', ensure_ascii=True)
 
-with open('acg_characters_v1.jsonl', 'w') as f:
-    for item in data:
-        f.write(json.dumps(item) + '\n')
+print(count)
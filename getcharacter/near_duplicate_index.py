@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Near Duplicate Index - MinHash/LSH over character n-grams
+Finds candidate duplicate names across the whole dataset in sub-quadratic time
+"""
+
+import random
+import zlib
+from typing import Dict, Iterable, List, Set, Tuple
+from collections import defaultdict
+
+# Mersenne prime used for the universal hash family
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class MinHashLSHIndex:
+    def __init__(self, num_perm: int = 64, bands: int = 16, ngram: int = 3, seed: int = 1):
+        """
+        num_perm hash functions are split into `bands` bands of num_perm // bands rows.
+        Two names become candidates when all rows of at least one band agree, which
+        happens with high probability once their n-gram Jaccard similarity exceeds
+        roughly (1 / bands) ** (1 / rows) (~0.5 with the defaults).
+        """
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def shingles(self, text: str) -> Set[int]:
+        """Hashed character n-grams of a normalized name (padded so short names still shingle)"""
+        padded = f" {text} "
+        n = self.ngram
+        if len(padded) <= n:
+            return {zlib.crc32(padded.encode('utf-8'))}
+        return {zlib.crc32(padded[i:i + n].encode('utf-8')) for i in range(len(padded) - n + 1)}
+
+    def signature(self, text: str) -> List[int]:
+        """MinHash signature of a normalized name"""
+        shingles = self.shingles(text)
+        return [min(((a * s + b) % _PRIME) & _MAX_HASH for s in shingles) for a, b in self._perms]
+
+    def add(self, item_id: int, text: str):
+        """Insert an item under its normalized name"""
+        sig = self.signature(text)
+        rows = self.rows
+        for band in range(self.bands):
+            key = tuple(sig[band * rows:(band + 1) * rows])
+            self._buckets[band][key].append(item_id)
+        self._size += 1
+
+    def add_many(self, texts: Iterable[str]):
+        """Insert texts with ids equal to their position"""
+        for item_id, text in enumerate(texts):
+            self.add(item_id, text)
+
+    def candidate_pairs(self) -> Set[Tuple[int, int]]:
+        """All (i, j) with i < j that share at least one LSH bucket"""
+        pairs = set()
+        for band_buckets in self._buckets:
+            for ids in band_buckets.values():
+                if len(ids) < 2:
+                    continue
+                for x in range(len(ids)):
+                    for y in range(x + 1, len(ids)):
+                        i, j = ids[x], ids[y]
+                        pairs.add((i, j) if i < j else (j, i))
+        return pairs
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x: int, y: int):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+    def groups(self) -> List[List[int]]:
+        """Connected components in order of their smallest member"""
+        components = defaultdict(list)
+        for x in range(len(self.parent)):
+            components[self.find(x)].append(x)
+        return [components[root] for root in sorted(components)]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Paginated Fetcher - rate-limited concurrent page collection with checkpoints
+Shared by the AniList and MAL collectors in CharacterDataProcessor
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+# Documented API limits as (max calls, period in seconds)
+ANILIST_RATE_LIMITS = [(90, 60)]           # AniList: 90 requests per minute
+JIKAN_RATE_LIMITS = [(3, 1), (60, 60)]     # Jikan v4: 3 per second, 60 per minute
+
+
+class RateLimiter:
+    def __init__(self, limits: List[Tuple[int, float]]):
+        """Sliding-window limiter shared by every worker thread of one API"""
+        self.limits = limits
+        self._calls = [deque() for _ in limits]
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def acquire(self):
+        """Block until a call is allowed under every window"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait_time = self._paused_until - now
+                for (max_calls, period), calls in zip(self.limits, self._calls):
+                    while calls and now - calls[0] >= period:
+                        calls.popleft()
+                    if len(calls) >= max_calls:
+                        wait_time = max(wait_time, period - (now - calls[0]))
+                if wait_time <= 0:
+                    for calls in self._calls:
+                        calls.append(now)
+                    return
+            time.sleep(wait_time)
+
+    def pause(self, seconds: float):
+        """Hold back every thread, e.g. after the server answered 429"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def request_with_retry(send: Callable, limiter: RateLimiter, max_retries: int = 5, base_delay: float = 2.0):
+    """
+    Send a request through the limiter, backing off with jitter on 429/5xx and on
+    connection errors / timeouts; the last response is returned, or the last error raised
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        retry_after = None
+        try:
+            response = send()
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise
+            reason = type(e).__name__
+        else:
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == max_retries:
+                return response
+            reason = f"HTTP {response.status_code}"
+            retry_after = response.headers.get('Retry-After')
+
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = base_delay * (2 ** attempt)
+        delay += random.uniform(0, base_delay)
+        print(f"  ⏳ {reason}, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        limiter.pause(delay)
+
+
+class PageCheckpoint:
+    def __init__(self, path: Optional[str]):
+        """Per-page progress log (JSONL) of an interrupted collection; pages already fetched are skipped on restart"""
+        self.path = path
+        self._lock = threading.Lock()
+        self.pages: Dict[int, List[Dict]] = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn last line from an interrupted run
+                    self.pages[record['page']] = record['items']
+            print(f"  ♻️  Resuming from {path}: {len(self.pages)} pages done")
+
+    def save_page(self, page: int, items: List[Dict]):
+        with self._lock:
+            self.pages[page] = items
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'page': page, 'items': items}, ensure_ascii=False) + '\n')
+
+    def clear(self):
+        """Drop the log once a collection completed, so the next run fetches fresh data"""
+        with self._lock:
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def fetch_pages(fetch_page: Callable[[int], Optional[List[Dict]]], max_pages: int, per_page: int, limit: int,
+                max_workers: int = 3, checkpoint: Optional[PageCheckpoint] = None) -> List[Dict]:
+    """
+    Prefetch pages 1..max_pages with up to max_workers in flight.
+    fetch_page returns the page's items, [] at the end of the data, or None on failure.
+    Returns items in page order, truncated to limit. The checkpoint is cleared when no page failed.
+    """
+    checkpoint = checkpoint or PageCheckpoint(None)
+    pages_needed = min(max_pages, (limit + per_page - 1) // per_page)
+    last_page = pages_needed  # shrinks once the end of the data or a failed page is seen
+    for page, items in checkpoint.pages.items():
+        if not items:
+            last_page = min(last_page, page - 1)
+    next_page = 1
+    in_flight = {}
+    failed = False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while in_flight or next_page <= last_page:
+            while next_page <= last_page and len(in_flight) < max_workers:
+                if next_page not in checkpoint.pages:
+                    in_flight[executor.submit(fetch_page, next_page)] = next_page
+                next_page += 1
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                page = in_flight.pop(future)
+                try:
+                    items = future.result()
+                except Exception as e:
+                    print(f"  ❌ Error on page {page}: {e}")
+                    items = None
+
+                if items is None:
+                    failed = True
+                    last_page = min(last_page, page - 1)
+                    continue
+                if not items:
+                    last_page = min(last_page, page - 1)
+                checkpoint.save_page(page, items)
+                print(f"  📄 Page {page}: {len(items)} characters")
+
+    results = []
+    for page in range(1, last_page + 1):
+        if page not in checkpoint.pages:
+            break
+        results.extend(checkpoint.pages[page])
+    if failed:
+        print(f"  ⚠️  Stopped at page {last_page} after a failed page; rerun with the same checkpoint to continue")
+    else:
+        checkpoint.clear()
+    return results[:limit]
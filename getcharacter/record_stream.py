@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Record Stream - generator-based JSONL reading/writing and spill-to-disk sorting
+Lets the getcharacter pipeline run read → fix → filter → dedupe → write without
+holding several copies of the dataset in memory
+"""
+
+import os
+import json
+import heapq
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """Yield one record per non-empty line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_source_records(path: str) -> Iterator[Dict]:
+    """
+    Yield records of a collected_characters.json style file ({source: [chars]}),
+    tagging each with its source. Plain JSON has to be parsed in one go, so only
+    the downstream stages stream; .jsonl inputs are read line by line.
+    """
+    if path.endswith('.jsonl'):
+        yield from iter_jsonl(path)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for source, chars in data.items():
+        for char in chars:
+            char['source'] = source
+            yield char
+
+
+class JsonlWriter:
+    def __init__(self, path: str, ensure_ascii: bool = False):
+        """
+        Incremental JSONL writer. Lines go to <path>.partial as they arrive and the
+        file is moved into place on a clean close, so a crash keeps the records
+        written so far without clobbering the previous output.
+        """
+        self.path = path
+        self.ensure_ascii = ensure_ascii
+        self.partial_path = path + '.partial'
+        self.count = 0
+        self.offset = 0
+        self._f = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._f = open(self.partial_path, 'wb')
+        return self
+
+    def write(self, record: Dict) -> int:
+        """Write one record, returning the byte offset of its line"""
+        line = (json.dumps(record, ensure_ascii=self.ensure_ascii) + '\n').encode('utf-8')
+        self._f.write(line)
+        offset = self.offset
+        self.offset += len(line)
+        self.count += 1
+        return offset
+
+    def write_all(self, records: Iterable[Dict]) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f.close()
+        if exc_type is None:
+            os.replace(self.partial_path, self.path)
+        return False
+
+
+def write_jsonl(records: Iterable[Dict], path: str, ensure_ascii: bool = False) -> int:
+    """Stream records to a JSONL file, returning how many were written"""
+    with JsonlWriter(path, ensure_ascii) as writer:
+        return writer.write_all(records)
+
+
+def external_sort(records: Iterable[Dict], key: Callable[[Dict], float], reverse: bool = False,
+                  chunk_size: int = 50000, tmp_dir: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Stable sort of an arbitrarily long record stream. Runs of chunk_size records
+    are sorted in memory and spilled to temporary JSONL files, then k-way merged.
+    Inputs that fit in a single chunk never touch the disk.
+    """
+    chunk: List[Dict] = []
+    spill_paths: List[str] = []
+    spill_dir = None
+
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                if spill_dir is None:
+                    spill_dir = tempfile.mkdtemp(prefix='sort-', dir=tmp_dir)
+                chunk.sort(key=key, reverse=reverse)
+                spill_path = os.path.join(spill_dir, f'run-{len(spill_paths)}.jsonl')
+                write_jsonl(chunk, spill_path)
+                spill_paths.append(spill_path)
+                chunk = []
+
+        chunk.sort(key=key, reverse=reverse)
+        if not spill_paths:
+            yield from chunk
+            return
+
+        runs = [iter_jsonl(path) for path in spill_paths] + [iter(chunk)]
+        yield from heapq.merge(*runs, key=key, reverse=reverse)
+    finally:
+        for path in spill_paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if spill_dir is not None:
+            try:
+                os.rmdir(spill_dir)
+            except OSError:
+                pass
+
+
+def rank_by_popularity(records: Iterable[Dict], chunk_size: int = 50000,
+                       tmp_dir: Optional[str] = None) -> Iterator[Dict]:
+    """Sort by total_popularity_score (descending) and set final_rank"""
+    ranked = external_sort(records, key=lambda x: x.get('total_popularity_score', 0), reverse=True,
+                           chunk_size=chunk_size, tmp_dir=tmp_dir)
+    for i, record in enumerate(ranked):
+        record['final_rank'] = i + 1
+        yield record
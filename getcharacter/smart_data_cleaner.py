@@ -3,14 +3,24 @@
 Smart Data Cleaner - Fix duplicate issues intelligently
 """
 
-import json
-import re
-from typing import List, Dict, Set
+import os
+import sys
+import tempfile
+from typing import List, Dict, Set, Iterable, Iterator, Optional
 from difflib import SequenceMatcher
 from collections import defaultdict
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.normalize import normalize_name, normalize_franchise, normalize_names
+from near_duplicate_index import MinHashLSHIndex, UnionFind
+from record_stream import iter_jsonl, JsonlWriter, rank_by_popularity
 
 class SmartDataCleaner:
-    def __init__(self):
+    def __init__(self, dedup_method: str = 'lsh'):
+        # 'lsh': MinHash/LSH candidates across the whole dataset, 'exact': group by normalized name only
+        if dedup_method not in ('lsh', 'exact'):
+            raise ValueError(f"Unknown dedup method: {dedup_method}")
+        self.dedup_method = dedup_method
+
         # Only clean obvious duplicates and fix known franchise issues
         self.manual_fixes = {
             # Fix known characters without franchise from MAL
@@ -62,36 +72,11 @@ class SmartDataCleaner:
     
     def normalize_name(self, name: str) -> str:
         """Normalize name for comparison"""
-        if not name:
-            return ''
-        return re.sub(r'[^\w\s]', '', name.lower()).strip()
+        return normalize_name(name)
     
     def normalize_franchise(self, franchise: str) -> str:
         """Normalize franchise name"""
-        if not franchise:
-            return ''
-        
-        # Basic normalization
-        normalized = franchise.lower().strip()
-        normalized = re.sub(r'[^\w\s]', ' ', normalized)
-        normalized = re.sub(r'\s+', ' ', normalized).strip()
-        
-        # Handle common variations
-        variations = {
-            'attack on titan': ['shingeki no kyojin', 'aot'],
-            'jujutsu kaisen': ['jjk'],
-            'demon slayer': ['kimetsu no yaiba'],
-            'my hero academia': ['boku no hero academia', 'mha', 'bnha'],
-            'hunter x hunter': ['hxh'],
-            'one punch man': ['opm'],
-            'spy x family': ['spyxfamily'],
-        }
-        
-        for canonical, aliases in variations.items():
-            if normalized in aliases or normalized == canonical:
-                return canonical
-        
-        return normalized
+        return normalize_franchise(franchise)
     
     def are_same_character(self, char1: Dict, char2: Dict) -> bool:
         """Check if two characters are the same with franchise consideration"""
@@ -210,121 +195,157 @@ class SmartDataCleaner:
         
         return merged
     
-    def clean_data_smart(self, input_file: str, output_file: str):
-        """Smart cleaning - only fix obvious issues"""
-        print(f"🧠 Smart cleaning data from {input_file}")
+    def find_candidate_groups(self, chars: List[Dict]) -> List[List[Dict]]:
+        """Group characters that may be duplicates of each other"""
+        if self.dedup_method == 'exact':
+            # Group by normalized name for initial duplicate detection
+            name_groups = defaultdict(list)
+            for char in chars:
+                name_groups[self.normalize_name(char['name'])].append(char)
+            return list(name_groups.values())
+        
+        # Near-duplicate names across the whole dataset: LSH proposes pairs,
+        # are_same_character keeps the franchise-compatibility rules
+        index = MinHashLSHIndex()
+        index.add_many(normalize_names([char['name'] for char in chars]))
+        
+        union_find = UnionFind(len(chars))
+        for i, j in index.candidate_pairs():
+            if self.are_same_character(chars[i], chars[j]):
+                union_find.union(i, j)
+        
+        return [[chars[i] for i in component] for component in union_find.groups()]
+    
+    def split_duplicates(self, group: List[Dict]) -> List[List[Dict]]:
+        """Split a candidate group into sets of real duplicates"""
+        if len(group) == 1:
+            return [group]
         
-        # Load data
-        characters = []
-        with open(input_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                char = json.loads(line.strip())
-                characters.append(char)
+        duplicate_groups = []
+        remaining = group[:]
         
-        print(f"📊 Loaded {len(characters)} characters")
+        while remaining:
+            current = remaining.pop(0)
+            duplicates = [current]
+            
+            # Find all characters that are duplicates of current
+            to_remove = []
+            for i, other in enumerate(remaining):
+                if self.are_same_character(current, other):
+                    duplicates.append(other)
+                    to_remove.append(i)
+            
+            # Remove found duplicates from remaining
+            for i in reversed(to_remove):
+                remaining.pop(i)
+            
+            duplicate_groups.append(duplicates)
         
-        # Step 1: Fix missing franchise info for known characters
-        print("🔧 Fixing missing franchise information...")
-        fixed_count = 0
+        return duplicate_groups
+    
+    def fix_and_filter(self, characters: Iterable[Dict], stats: Dict) -> Iterator[Dict]:
+        """Steps 1-2 as a stream: fix known franchises, drop unfixable characters"""
         for char in characters:
+            stats['original'] += 1
+            
+            # Step 1: Fix missing franchise info for known characters
             original_franchise = char.get('franchise', '')
             char = self.fix_character_franchise(char)
             if char.get('franchise', '') != original_franchise:
-                fixed_count += 1
-        
-        print(f"  ✅ Fixed {fixed_count} franchises")
-        
-        # Step 2: Only remove characters that definitely have no franchise and can't be fixed
-        print("🗑️  Removing unfixable characters without franchise...")
-        chars_to_keep = []
-        removed_count = 0
-        
-        for char in characters:
+                stats['fixed'] += 1
+            
+            # Step 2: Only remove characters that definitely have no franchise and can't be fixed
             if char.get('franchise') and char['franchise'].strip():
-                chars_to_keep.append(char)
+                yield char
             else:
                 # Only remove if we're very sure it's not from anime/game/movie
                 name = char.get('name', '')
                 # Keep if it might be from a known franchise even if we can't identify it
                 if (any(keyword in name.lower() for keyword in ['goku', 'naruto', 'luffy', 'ichigo', 'edward', 'alphonse']) or
                     char.get('category') in ['anime', 'game']):
-                    chars_to_keep.append(char)
                     print(f"  ⚠️  Kept without franchise: {name} (might be identifiable)")
+                    yield char
                 else:
-                    removed_count += 1
+                    stats['removed'] += 1
                     print(f"  ❌ Removed: {name} (no franchise, not identifiable)")
-        
-        print(f"  🗑️  Removed {removed_count} characters")
-        
-        # Step 3: Find and merge obvious duplicates
-        print("🔗 Merging obvious duplicates...")
-        
-        # Group by normalized name for initial duplicate detection
-        name_groups = defaultdict(list)
-        for char in chars_to_keep:
-            normalized_name = self.normalize_name(char['name'])
-            name_groups[normalized_name].append(char)
-        
-        merged_characters = []
-        merge_count = 0
-        
-        for normalized_name, group in name_groups.items():
-            if len(group) == 1:
-                merged_characters.append(group[0])
-            else:
-                # Check for real duplicates
-                duplicate_groups = []
-                remaining = group[:]
-                
-                while remaining:
-                    current = remaining.pop(0)
-                    duplicates = [current]
-                    
-                    # Find all characters that are duplicates of current
-                    to_remove = []
-                    for i, other in enumerate(remaining):
-                        if self.are_same_character(current, other):
-                            duplicates.append(other)
-                            to_remove.append(i)
-                    
-                    # Remove found duplicates from remaining
-                    for i in reversed(to_remove):
-                        remaining.pop(i)
-                    
-                    if len(duplicates) > 1:
-                        merged = self.merge_duplicate_characters(duplicates)
-                        merged_characters.append(merged)
-                        merge_count += 1
-                        names = [c['name'] for c in duplicates]
-                        print(f"  🔗 Merged: {names}")
-                    else:
-                        merged_characters.append(duplicates[0])
-        
-        # Step 4: Sort and rank
-        merged_characters.sort(key=lambda x: x.get('total_popularity_score', 0), reverse=True)
-        for i, char in enumerate(merged_characters):
-            char['final_rank'] = i + 1
-        
-        # Step 5: Save cleaned data
-        print(f"💾 Saving to {output_file}")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for char in merged_characters:
-                f.write(json.dumps(char, ensure_ascii=False) + '\n')
+    
+    def merge_stream(self, kept_file: str, keys: List[Dict], stats: Dict) -> Iterator[Dict]:
+        """
+        Step 3 as a stream. Duplicate detection only needs name and franchise, so it
+        runs on the lightweight keys; full records are re-read from the spill file and
+        only members of a duplicate set are buffered until their set is complete.
+        """
+        duplicate_of = {}
+        set_sizes = []
+        for group in self.find_candidate_groups(keys):
+            for duplicates in self.split_duplicates(group):
+                if len(duplicates) > 1:
+                    for key in duplicates:
+                        duplicate_of[key['position']] = len(set_sizes)
+                    set_sizes.append(len(duplicates))
+        
+        pending = defaultdict(list)
+        for position, char in enumerate(iter_jsonl(kept_file)):
+            set_id = duplicate_of.get(position)
+            if set_id is None:
+                yield char
+                continue
+            
+            pending[set_id].append(char)
+            if len(pending[set_id]) == set_sizes[set_id]:
+                duplicates = pending.pop(set_id)
+                stats['merged'] += 1
+                names = [c['name'] for c in duplicates]
+                print(f"  🔗 Merged: {names}")
+                yield self.merge_duplicate_characters(duplicates)
+    
+    def clean_data_smart(self, input_file: str, output_file: str, sort_chunk_size: int = 50000,
+                         tmp_dir: Optional[str] = None):
+        """Smart cleaning - only fix obvious issues"""
+        print(f"🧠 Smart cleaning data from {input_file}")
+        stats = defaultdict(int)
+        
+        with tempfile.TemporaryDirectory(prefix='smart-clean-', dir=tmp_dir) as work_dir:
+            # Steps 1-2: stream read → fix → filter into a spill file, keeping only dedupe keys
+            print("🔧 Fixing missing franchise information and removing unfixable characters...")
+            kept_file = os.path.join(work_dir, 'kept.jsonl')
+            keys = []
+            with JsonlWriter(kept_file) as kept:
+                for char in self.fix_and_filter(iter_jsonl(input_file), stats):
+                    keys.append({'position': kept.count, 'name': char['name'], 'franchise': char.get('franchise', '')})
+                    kept.write(char)
+            
+            print(f"📊 Loaded {stats['original']} characters")
+            print(f"  ✅ Fixed {stats['fixed']} franchises")
+            print(f"  🗑️  Removed {stats['removed']} characters")
+            
+            # Step 3: Find and merge obvious duplicates
+            print("🔗 Merging obvious duplicates...")
+            merged_characters = self.merge_stream(kept_file, keys, stats)
+            
+            # Steps 4-5: Sort (spilling to disk for large inputs), rank and save
+            print(f"💾 Saving to {output_file}")
+            with JsonlWriter(output_file) as writer:
+                for char in rank_by_popularity(merged_characters, chunk_size=sort_chunk_size, tmp_dir=work_dir):
+                    if char.get('franchise') and char['franchise'].strip():
+                        stats['with_franchise'] += 1
+                    writer.write(char)
+                final_count = writer.count
         
         # Statistics
         print(f"\n✅ SMART CLEANING COMPLETE")
         print("=" * 40)
-        print(f"📊 Original: {len(characters)}")
-        print(f"🔧 Fixed franchises: {fixed_count}")
-        print(f"🗑️  Removed: {removed_count}")
-        print(f"🔗 Merged duplicates: {merge_count}")
-        print(f"🎯 Final: {len(merged_characters)}")
+        print(f"📊 Original: {stats['original']}")
+        print(f"🔧 Fixed franchises: {stats['fixed']}")
+        print(f"🗑️  Removed: {stats['removed']}")
+        print(f"🔗 Merged duplicates: {stats['merged']}")
+        print(f"🎯 Final: {final_count}")
         
         # Show sample of characters with and without franchise
-        with_franchise = sum(1 for char in merged_characters if char.get('franchise') and char['franchise'].strip())
-        print(f"📚 With franchise: {with_franchise}/{len(merged_characters)} ({with_franchise/len(merged_characters)*100:.1f}%)")
+        with_franchise = stats['with_franchise']
+        print(f"📚 With franchise: {with_franchise}/{final_count} ({with_franchise/max(final_count, 1)*100:.1f}%)")
         
-        return len(merged_characters)
+        return final_count
 
 def main():
     cleaner = SmartDataCleaner()